@@ -45,7 +45,7 @@ from core.constants.combat import (
 )
 from core.constants.items import QUEST_COIN_BANDS, Affixes, LootBox, Potions, Quests, Rarity, RarityTier
 from core.constants.player import STAT_LABELS, Affinity, Death, Magic, Player, Stats
-from core.constants.ui import TARGET_FPS, Colors, Fonts, Hyperparameters, Minimap, Music, Screen
+from core.constants.ui import TARGET_FPS, Colors, Fonts, Hyperparameters, Logs, Minimap, Music, Pregen, Screen
 from core.constants.villages import Villages
 from core.constants.world import (
     Breakables,
@@ -98,6 +98,7 @@ __all__ = [
     "Fonts",
     "Hyperparameters",
     "ImpactFx",
+    "Logs",
     "LootBox",
     "Magic",
     "Minimap",
@@ -107,6 +108,7 @@ __all__ = [
     "Player",
     "PointsOfInterest",
     "Potions",
+    "Pregen",
     "Projectile",
     "Quests",
     "Rarity",
@@ -90,8 +90,10 @@ class Death:
     # The death screen mocks the player with an LLM-written line. Generated ahead of time
     # into a buffer (llm/death_taunts.py), because the screen is blocking and waiting on
     # the model there would turn a death into a stall; these are what it says if the
-    # buffer is empty (a fresh save, or the model still busy with the first one).
-    TAUNT_BUFFER: int = 3
+    # buffer is empty (a fresh save, or the model still busy with the first one). Written
+    # TAUNT_BATCH to a call, and asked for again once TAUNT_LOW_WATER or fewer are left.
+    TAUNT_BATCH: int = 4
+    TAUNT_LOW_WATER: int = 1
     FALLBACK_TAUNTS: tuple = (
         "The worms send their thanks.",
         "Even the crows looked away.",
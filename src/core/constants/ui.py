@@ -92,6 +92,23 @@ class Colors:
 
 @dataclass(frozen=True)
 class Hyperparameters:
+    MODEL_PATH: str = "./models/Qwen2.5-7B-Instruct-Q2_K.gguf"
+    # Run the model in a process of its own (llm/inference_process.py) rather than on a
+    # thread of the game's, so sampling and its Python bookkeeping never hold the GIL the
+    # render loop needs, and a crash in the model is an error result instead of the game's end.
+    LLM_PROCESS: bool = True
+    # Address of a shared LLM service (`python -m llm.service`) to use instead of loading
+    # the model at all: a Unix socket path, or "127.0.0.1:port" / "localhost:port". Started
+    # without one, the service listens on $XDG_RUNTIME_DIR/local-ai-rpg/llm.sock, or
+    # ~/.local-ai-rpg/llm.sock, and prints it. Several games and tools on one machine then
+    # share one model and its warm cache. None, or a service that doesn't answer, and the
+    # model is loaded as above.
+    LLM_SERVICE: str | None = None
+    # A small model of the same family and tokenizer (e.g. Qwen2.5-0.5B-Instruct) that drafts
+    # up to DRAFT_TOKENS tokens at a time for the dialogue's streams, checked by the model
+    # in one decode (llm/backends.py). Loaded with the model, by `get_llm_queue()`; None: none.
+    DRAFT_MODEL_PATH: str | None = None
+    DRAFT_TOKENS: int = 4
     GPU_LAYERS: int = -1
     CONTEXT_SIZE: int = 8192
     MAX_TOKENS: int = 200
@@ -100,6 +117,70 @@ class Hyperparameters:
     DIALOGUE_MAX_TOKENS: int = 120
     TEMPERATURE: float = 0.8
     REPETITION_PENALTY: float = 1.2
+    # RAM kept for saved dialogue states (`llm.state_cache`). A 7B state costs roughly 60 KB
+    # per token in context, so this holds a few dozen ongoing conversations.
+    STATE_CACHE_MB: int = 512
+    # Openings of system prompts that many calls share (`llm.warmup`) are evaluated while
+    # the game loads and saved as state files next to the model, so later launches load
+    # them instead. The WARM_STATES_KEPT most recently used files are kept: a couple per world.
+    WARM_STATES_KEPT: int = 16
+    # A conversation's transcript is kept under TRANSCRIPT_TOKEN_BUDGET tokens in the prompt:
+    # past it, everything but the last TRANSCRIPT_KEEP_MESSAGES messages is folded into a
+    # summary of at most TRANSCRIPT_SUMMARY_TOKENS (llm/transcript.py).
+    TRANSCRIPT_TOKEN_BUDGET: int = 768
+    TRANSCRIPT_KEEP_MESSAGES: int = 6
+    TRANSCRIPT_SUMMARY_TOKENS: int = 120
+    # Measurement mode: log how many prompt tokens each call found already evaluated in
+    # the model (`reused_prompt_tokens` in logs/llm_calls.jsonl). Always measured for the
+    # telemetry; this only adds it to every line.
+    LOG_PREFIX_REUSE: bool = False
+    # Live per-category latency figures (llm/telemetry.py): the last TELEMETRY_WINDOW calls
+    # of each, summarised into the call log every TELEMETRY_SUMMARY_S while calls are made.
+    TELEMETRY_WINDOW: int = 256
+    TELEMETRY_SUMMARY_S: float = 60.0
+    # Short background calls (names, taunts, flavour lines) decoded together as parallel
+    # sequences, up to this many per pass; 1 turns batching off. They get a context of
+    # their own this size, shared by the batch, so they never evict the dialogue's.
+    BATCH_SIZE: int = 4
+    BATCH_CONTEXT_SIZE: int = 2048
+    # NPC names come NAME_BATCH to a call, as a numbered list; the next call is made once
+    # the buffer is down to NAME_LOW_WATER, so a new village's burst of NPCs finds them ready.
+    NAME_BATCH: int = 8
+    NAME_LOW_WATER: int = 3
+    # A conversation whose words leave unclear whether a quest was agreed to gets a yes/no
+    # call of two tokens before the full quest analysis (llm/quest_system.py). False: those
+    # go straight to the analysis.
+    QUEST_CHECK_CALL: bool = True
+
+
+@dataclass(frozen=True)
+class Logs:
+    """The background log writer (core/log_writer.py) behind logs/llm_calls.jsonl and the
+    dialogue files."""
+
+    # How long the writer gathers lines after the first before writing them all at once.
+    FLUSH_INTERVAL_S: float = 0.5
+    # The call log is moved aside past this size; the newest ROTATED_KEPT moved-aside files
+    # are kept, gzipped with GZIP_ROTATED (a JSONL log compresses about tenfold).
+    MAX_BYTES: int = 32 * 1024 * 1024
+    ROTATED_KEPT: int = 5
+    GZIP_ROTATED: bool = True
+
+
+@dataclass(frozen=True)
+class Pregen:
+    """Content the LLM makes while it would otherwise sit idle (llm/pregen.py), kept in
+    typed pools for the moment it is wanted."""
+
+    # Pools across sessions: a context for the next new game, and the current world's items.
+    PATH: str = "./saves/pools.json"
+    # How often the harvester looks for an idle model and saves what changed.
+    IDLE_POLL_S: float = 0.5
+    # Items kept ready per key of each pool: per omen, per boss kind, per village size.
+    LORE_LINES: int = 2
+    BOSS_NAMES: int = 2
+    VILLAGE_NAMES: int = 3
+    WORLD_CONTEXTS: int = 2
 
 
 @dataclass(frozen=True)
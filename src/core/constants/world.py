@@ -88,6 +88,25 @@ class World:
     CHUNK_LOAD_RADIUS: int = 2
     # ...and stay loaded until this much farther away, to avoid load/unload thrashing at the edge.
     CHUNK_KEEP_RADIUS: int = 3
+    # Chunks are built ahead of the player on a worker thread (game/chunk_worker.py): the load
+    # window around where they will be CHUNK_PREFETCH_S from now, at their velocity smoothed
+    # over CHUNK_HEADING_SMOOTH_S. Built chunks join the world for at most
+    # CHUNK_INTEGRATE_BUDGET_MS of a frame; one needed before its turn is built on the spot.
+    CHUNK_PREFETCH_S: float = 2.5
+    CHUNK_HEADING_SMOOTH_S: float = 0.5
+    CHUNK_INTEGRATE_BUDGET_MS: float = 3.0
+    # Build them in this many processes instead of on the thread, 0 for the thread. Each
+    # process takes a core and its own copy of the terrain caches; `python -m game.chunk_bench`
+    # says what it is worth on this machine.
+    CHUNK_PROCESSES: int = 0
+    # Chunks once built are kept on disk (game/chunk_cache.py), one file per world and
+    # version of the generator, so ground walked before is read back rather than generated
+    # again, in this session or the next. None for no cache. A world's file starts over
+    # past CHUNK_CACHE_MAX_BYTES, and only the files of the last CHUNK_CACHE_WORLDS_KEPT
+    # worlds are kept.
+    CHUNK_CACHE_DIR: str | None = "./saves/chunk_cache"
+    CHUNK_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    CHUNK_CACHE_WORLDS_KEPT: int = 3
 
     # Shortest gap between two World.persist_world writes. Every write serialises the whole
     # world, and generation threads finish in bursts; the periodic autosave catches the rest.
@@ -6,11 +6,11 @@ are meant to be re-read later to inspect what the model was told and how it repl
 """
 
 import os
-import threading
 from datetime import datetime
 
+from core.log_writer import get_log_writer
+
 LOG_DIR = "./logs/dialogues"
-_lock = threading.Lock()
 
 
 def _safe_name(name: str) -> str:
@@ -19,12 +19,12 @@ def _safe_name(name: str) -> str:
 
 
 def write_conversation(npc, system_prompt: str, conversation) -> str | None:
-    """Write a finished conversation to a new file. Returns its path, or None if empty."""
+    """Write a finished conversation to a new file. Returns its path, or None if empty.
+    Queued on the log writer: called from `DialogueManager.close()`, inside a frame."""
     messages = conversation.messages
     if not messages:
         return None
 
-    os.makedirs(LOG_DIR, exist_ok=True)
     now = datetime.now()
     path = os.path.join(LOG_DIR, f"{now:%Y%m%d_%H%M%S}_{_safe_name(npc.name)}.md")
 
@@ -44,8 +44,7 @@ def write_conversation(npc, system_prompt: str, conversation) -> str | None:
         lines.append(f"**{speaker}:** {msg['content']}")
         lines.append("")
 
-    with _lock, open(path, "w") as f:
-        f.write("\n".join(lines))
+    get_log_writer().write(path, "\n".join(lines))
     return path
 
 
@@ -53,5 +52,4 @@ def append_section(path: str | None, title: str, body: str):
     """Append a titled section to an existing conversation file (no-op if path is None)."""
     if not path:
         return
-    with _lock, open(path, "a") as f:
-        f.write(f"\n## {title}\n\n{body}\n")
+    get_log_writer().append(path, f"\n## {title}\n\n{body}\n")
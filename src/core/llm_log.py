@@ -6,12 +6,27 @@ or an AI agent later to assess response quality and generation efficiency.
 """
 
 import json
-import os
-import threading
 from datetime import datetime
 
+from core.log_writer import get_log_writer
+
 LOG_PATH = "./logs/llm_calls.jsonl"
-_lock = threading.Lock()
+
+# Set in the inference process (`llm.inference_process`): the records it makes are sent to
+# the game, which writes them (`write_forwarded`). One process appending to and rotating a
+# file is what keeps two from renaming it under each other.
+_forward = None
+
+
+def forward_to(send):
+    """Hand every record to `send(line)` from now on instead of writing it here."""
+    global _forward
+    _forward = send
+
+
+def write_forwarded(line: str):
+    """Write a record another process made and forwarded (`forward_to`)."""
+    get_log_writer().append(LOG_PATH, line, rotate=True)
 
 
 def log_call(
@@ -27,6 +42,13 @@ def log_call(
     streaming: bool,
     prompt_tokens: int | None = None,
     completion_tokens: int | None = None,
+    cancelled: bool = False,
+    batch_size: int | None = None,
+    constrained: bool = False,
+    reused_prompt_tokens: int | None = None,
+    draft_tokens: int | None = None,
+    accepted_draft_tokens: int | None = None,
+    submitted: float | None = None,
 ):
     entry = {
         "timestamp": datetime.now().isoformat(timespec="seconds"),
@@ -44,9 +66,37 @@ def log_call(
         "completion_tokens": completion_tokens,
         "tokens_per_second": round(completion_tokens / duration, 2) if completion_tokens and duration > 0 else None,
     }
+    # Only written when true: a cut-short reply must not read as the model's whole answer.
+    if cancelled:
+        entry["cancelled"] = True
+    # A batched call's duration is the whole batch's, shared with `batch_size - 1` others.
+    if batch_size:
+        entry["batch_size"] = batch_size
+    # Grammar-constrained: the reply's shape was enforced, so a parse failure on it is a bug.
+    if constrained:
+        entry["constrained"] = True
+    # Only measured with Hyperparameters.LOG_PREFIX_REUSE on: of `prompt_tokens`, how many the
+    # model already held and did not evaluate again.
+    if reused_prompt_tokens is not None:
+        entry["reused_prompt_tokens"] = reused_prompt_tokens
+    # Streamed with a draft model: how many tokens it guessed, and how many of them held.
+    if draft_tokens is not None:
+        entry["draft_tokens"] = draft_tokens
+        entry["accepted_draft_tokens"] = accepted_draft_tokens
+    # When the call was asked for (wall-clock seconds), queue wait included: `timestamp` less
+    # `duration_seconds` is only when it started running. What `llm.replay` arrives calls by.
+    if submitted is not None:
+        entry["submitted"] = datetime.fromtimestamp(submitted).isoformat(timespec="milliseconds")
     _append(entry)
 
 
+def log_metrics(summary: dict):
+    """The queue's rolling figures per category (`llm.telemetry`), written every so often
+    while calls are being made. A record with "metrics" and no "prompt": a script reading
+    the calls tells them apart by that."""
+    _append({"timestamp": datetime.now().isoformat(timespec="seconds"), "metrics": summary})
+
+
 def log_parse_failure(category: str, response: str, error: str):
     """Record a response the game couldn't make sense of, alongside the call that produced
     it. Model output that fails to parse is a quality signal like any other, and the game
@@ -63,6 +113,9 @@ def log_parse_failure(category: str, response: str, error: str):
 
 
 def _append(entry: dict):
-    os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
-    with _lock, open(LOG_PATH, "a") as f:
-        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    # Encoded here, written later by the log writer: the worker is back on the model at once.
+    line = json.dumps(entry, ensure_ascii=False) + "\n"
+    if _forward is not None:
+        _forward(line)
+        return
+    get_log_writer().append(LOG_PATH, line, rotate=True)
@@ -0,0 +1,137 @@
+"""One background thread that does every log write, so logging never waits on the disk.
+
+`llm_log` used to create its directory and open, write and close logs/llm_calls.jsonl on
+every call, under a lock, on the LLM worker; `dialogue_log` wrote a whole conversation file
+from `DialogueManager.close()`, inside the frame. Both now hand the text to `get_log_writer()`
+and return: an enqueue, nothing more. The writer wakes when there is something to write,
+waits `Logs.FLUSH_INTERVAL_S` for whatever else comes with it, and writes the lot, each file
+opened once per batch. Writes to one file happen in the order they were asked for, so a
+section appended to a conversation file still lands after the conversation.
+
+A file written through `append(..., rotate=True)` is rotated once it grows past
+`Logs.MAX_BYTES`: renamed with a timestamp, gzipped if `Logs.GZIP_ROTATED`, and only the
+newest `Logs.ROTATED_KEPT` of those kept. Rotation happens between batches, on the writer,
+which is only safe while one process writes the file: another process's writer would rename
+it from under this one. The inference process therefore forwards its records instead.
+
+At exit, what is still queued is written before the process goes (`close`, registered with
+atexit): a log that loses the last calls before a crash loses the ones that mattered.
+"""
+
+import atexit
+import glob
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import core.constants as c
+
+# How long `close` waits for the queue to drain before giving up on the rest.
+CLOSE_TIMEOUT_S = 5.0
+
+
+class LogWriter:
+    def __init__(self):
+        # ("a" or "w", path, text, rotate) in the order they were asked for; None stops.
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def append(self, path: str, text: str, rotate: bool = False):
+        self._queue.put(("a", path, text, rotate))
+
+    def write(self, path: str, text: str):
+        """Create `path` (or replace it) with `text`."""
+        self._queue.put(("w", path, text, False))
+
+    def flush(self):
+        """Block until everything queued so far is on disk. For tools and tests; the game
+        never needs to."""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(CLOSE_TIMEOUT_S)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            stopping = batch[0] is None
+            if not stopping:
+                # Collect what arrives meanwhile, so a burst is one open per file, not one per line.
+                stopping = self._collect(batch)
+            try:
+                self._write_batch([op for op in batch if op is not None])
+            except OSError as e:
+                print(f"Log write failed: {type(e).__name__}: {e}")
+            for _ in batch:
+                self._queue.task_done()
+            if stopping:
+                return
+
+    def _collect(self, batch) -> bool:
+        """Add what comes within the flush interval to `batch`. True if it held the stop."""
+        deadline = time.monotonic() + c.Logs.FLUSH_INTERVAL_S
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                op = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return False
+            batch.append(op)
+            if op is None:
+                return True
+
+    def _write_batch(self, batch):
+        files = {}
+        rotating = set()
+        try:
+            for mode, path, text, rotate in batch:
+                f = files.get(path)
+                if f is None or mode == "w":
+                    if f is not None:
+                        f.close()
+                    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                    f = files[path] = open(path, mode, encoding="utf-8")
+                f.write(text)
+                if rotate:
+                    rotating.add(path)
+        finally:
+            for f in files.values():
+                f.close()
+        for path in rotating:
+            if os.path.getsize(path) > c.Logs.MAX_BYTES:
+                _rotate(path)
+
+
+def _rotate(path: str):
+    """Move a full log aside as `<name>.<timestamp><ext>[.gz]`, keeping the newest few."""
+    stem, ext = os.path.splitext(path)
+    rotated = f"{stem}.{datetime.now():%Y%m%d_%H%M%S}{ext}"
+    os.replace(path, rotated)
+    if c.Logs.GZIP_ROTATED:
+        with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated)
+    # The timestamp sorts by age; whatever the extension, the oldest go first.
+    old = sorted(glob.glob(f"{glob.escape(stem)}.*_*{ext}*"))
+    for stale in old[: max(0, len(old) - c.Logs.ROTATED_KEPT)]:
+        os.remove(stale)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_log_writer() -> LogWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = LogWriter()
+                atexit.register(_writer.close)
+    return _writer
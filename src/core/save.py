@@ -1,7 +1,6 @@
 import json
 import os
 import threading
-import time
 
 
 class SaveSystem:
@@ -65,6 +64,10 @@ class SaveSystem:
         # Background generation threads and the main loop both save now; serialise the
         # file writes so two threads can't interleave and corrupt the JSON.
         self._write_lock = threading.Lock()
+        self._context_lock = threading.Lock()
+        self._context_waiters = []
+        # Set by `close` once the game this save belongs to has ended.
+        self._closed = False
 
     def _load_all(self):
         if os.path.exists(self.filename):
@@ -77,26 +80,40 @@ class SaveSystem:
 
     def update(self, key, value):
         self.data[key] = value
+        if key == "context" and value is not None:
+            with self._context_lock:
+                waiting, self._context_waiters = self._context_waiters, []
+                if self._closed:
+                    waiting = []
+            for callback in waiting:
+                callback(value)
 
     def load(self, key, default=None):
         return self.data.get(key, default)
 
-    def await_context(self, abandoned) -> str | None:
-        """Block until the world context has been written, then return it.
+    def when_context(self, callback):
+        """Call `callback(context)` once the world context has been written: now, if it
+        already has been, otherwise from the `update` that writes it.
 
-        The context is generated once at startup on its own thread, and the background
-        writers that need it (NPC names, death taunts) are started before it lands. They
-        all wait here rather than each keeping their own poll loop. `abandoned` is asked
-        between polls: a session that has been closed gives up and gets None back, so a
-        thread still waiting when the player quits does not write into the next game.
-        """
-        while True:
-            if abandoned():
-                return None
-            context = self.load("context", None)
-            if context is not None:
-                return context
-            time.sleep(0.1)
+        The context is generated once at startup, and the background writers that need it
+        (NPC names, death taunts) are started before it lands. They queue here instead of
+        each parking a thread in a poll loop until it arrives."""
+        with self._context_lock:
+            if self._closed:
+                return
+            context = self.data.get("context")
+            if context is None:
+                self._context_waiters.append(callback)
+                return
+        callback(context)
+
+    def close(self):
+        """The game this save belongs to is over: a context that lands late is still
+        written, but nothing waiting on it runs. Otherwise it would point the idle model
+        and the preamble warm-up back at a world the player has already left."""
+        with self._context_lock:
+            self._closed = True
+            self._context_waiters = []
 
     def save_all(self):
         with self._write_lock:
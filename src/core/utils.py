@@ -30,8 +30,18 @@ def random_coordinates():
 
 
 class ConversationHistory:
+    """Every message of one conversation, as the player sees it, and the transcript the
+    model is given, which is not always the same thing: a long conversation has its oldest
+    turns folded into `summary` (see `llm.transcript.compact`), and only the messages from
+    `folded` on are written out in full."""
+
     def __init__(self):
         self.messages = []
+        self.summary = ""
+        self.folded = 0
+        # Bumped by clear(), so a summary still being written for a conversation that has
+        # since closed can tell it is too late.
+        self.generation = 0
 
     def add_user_message(self, content: str):
         self.messages.append({"role": "user", "content": content})
@@ -50,10 +60,18 @@ class ConversationHistory:
 
     def clear(self):
         self.messages.clear()
+        self.summary = ""
+        self.folded = 0
+        self.generation += 1
+
+    def fold(self, upto: int, summary: str):
+        """Replace the messages before index `upto` with `summary` in the prompt transcript."""
+        self.folded = upto
+        self.summary = summary
 
     def format_for_prompt(self):
-        conversation_text = ""
-        for msg in self.messages:
+        conversation_text = f"(Earlier in this conversation: {self.summary})\n" if self.summary else ""
+        for msg in self.messages[self.folded :]:
             if msg["role"] == "user":
                 conversation_text += f"Player: {msg['content']}\n"
             else:
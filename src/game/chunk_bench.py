@@ -0,0 +1,103 @@
+"""Time chunk building on the thread against the chunk processes, in chunks a second.
+
+The same square of wilderness chunks is built once the way `ChunkWorker` builds them on its
+thread (`build_chunk`, one after another), then through a pool of chunk processes
+(`World.CHUNK_PROCESSES`) of each size asked for, every chunk rehydrated in this process the
+way the worker does it, and last read back from a scratch chunk cache (`ChunkCache`) the way
+the worker reads a chunk it has built before. Each run starts from cold terrain caches, the
+processes' included, and the pool is started and given a chunk per process before the clock
+starts, since the game starts it once per world:
+
+    python -m game.chunk_bench
+    python -m game.chunk_bench --chunks 100 --workers 1 2 4 8 --origin 20 -5
+
+The chunks are laid out against the sites of a freshly rolled starting world, with no
+buildings or villages of their own near them: what is timed is the wilderness, which is
+where the player spends most of the walk and what makes a chunk expensive.
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import tempfile
+import time
+from concurrent.futures import wait
+
+from game.chunk_cache import ChunkCache
+from game.chunk_worker import build_chunk, chunk_pool, chunk_records, rehydrate, submit_chunk
+from game.entities.village import generate_starting_world, load_site_registry, register_world_sites, site_registry
+
+
+def square(origin: tuple[int, int], count: int) -> list[tuple[int, int]]:
+    """`count` chunks filling a square from `origin`, row by row."""
+    side = math.ceil(math.sqrt(count))
+    return [(origin[0] + i % side, origin[1] + i // side) for i in range(count)]
+
+
+def run_thread(chunks: list[tuple[int, int]]) -> float:
+    """Seconds to build `chunks` one after another in this process."""
+    load_site_registry(site_registry())
+    start = time.perf_counter()
+    for chunk in chunks:
+        build_chunk(chunk, [], [])
+    return time.perf_counter() - start
+
+
+def run_pool(chunks: list[tuple[int, int]], processes: int) -> float:
+    """Seconds to build `chunks` in `processes` chunk processes, rehydrated here."""
+    pool = chunk_pool(processes)
+    try:
+        # Started and importing before the clock starts, on chunks that are not timed.
+        warm = [(-10_000 - i, -10_000) for i in range(processes)]
+        wait([submit_chunk(pool, chunk, [], []) for chunk in warm])
+        start = time.perf_counter()
+        futures = [(chunk, submit_chunk(pool, chunk, [], [])) for chunk in chunks]
+        for chunk, future in futures:
+            rehydrate(chunk, None, future.result())
+        return time.perf_counter() - start
+    finally:
+        pool.shutdown()
+
+
+def run_cache(chunks: list[tuple[int, int]]) -> float:
+    """Seconds to read `chunks` back from a chunk cache they were all put in."""
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ChunkCache(directory)
+        try:
+            for chunk in chunks:
+                cache.put(chunk, chunk_records(build_chunk(chunk, [], [])), [], [])
+            start = time.perf_counter()
+            for chunk in chunks:
+                cache.get(chunk, [], [])
+            return time.perf_counter() - start
+        finally:
+            cache.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chunks", type=int, default=64, help="how many chunks each run builds")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="pool sizes to time")
+    parser.add_argument("--origin", type=int, nargs=2, default=[12, 12], metavar=("CX", "CY"), help="first chunk")
+    args = parser.parse_args(argv)
+
+    village, buildings = generate_starting_world()
+    register_world_sites([village], buildings)
+    chunks = square(tuple(args.origin), args.chunks)
+
+    print(f"{len(chunks)} chunks, {os.cpu_count()} cores")
+    print(f"{'mode':<14}{'seconds':>10}{'chunks/s':>10}{'speed-up':>10}")
+    baseline = run_thread(chunks)
+    print(f"{'thread':<14}{baseline:>10.2f}{len(chunks) / baseline:>10.1f}{1.0:>10.2f}")
+    for processes in args.workers:
+        seconds = run_pool(chunks, processes)
+        label = f"{processes} process" + ("es" if processes > 1 else "")
+        print(f"{label:<14}{seconds:>10.2f}{len(chunks) / seconds:>10.1f}{baseline / seconds:>10.2f}")
+    seconds = run_cache(chunks)
+    print(f"{'disk cache':<14}{seconds:>10.2f}{len(chunks) / seconds:>10.1f}{baseline / seconds:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
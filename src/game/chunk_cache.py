@@ -0,0 +1,280 @@
+"""Chunks already built, kept on disk and read back instead of generated again.
+
+A chunk is a pure function of its coordinates, of the village sites its world registered and
+of what stands near it, so once built it never needs building again: not when the player
+walks back over it, not when they fast travel to a village they found an hour ago, not in
+the next session of the same world. `ChunkWorker` asks here before building anything, and
+adds whatever it does build.
+
+One file per world, `<World.CHUNK_CACHE_DIR>/<world key>.chunks`. The world key is a hash of
+the sites registered (`site_registry`) and of the generator (`generator_version`: the source
+of every module a chunk is laid out by, constants included), so a world with another
+starting town, or a build of the game that lays chunks out differently, never reads a file
+made by the other. Registering sites fires `register_site_cache` like any other cache that
+answers off them, and this one lets go of its file then (`invalidate`); the next chunk asked
+for opens the file of the world registered now.
+
+The file opens with `MAGIC` and `FORMAT` and then holds entries back to back, appended as
+chunks are built, each a 16-byte key, a u32 body length and the body. The key hashes the
+chunk with what it is laid out against (the footprints near it, the villages in reach), so a
+village going up beside a chunk makes it a new entry rather than a stale one. The body is
+`chunk_records` packed little-endian: five u16 counts (strings, details, POIs, scenery,
+traps); the strings, each a u8 length and UTF-8 (kinds, biomes, POI ids, each stored once);
+then the records, positions and sizes as f64 so a chunk read back is bit for bit the chunk
+that was built, names as u16 indexes into the strings. Reads go through an mmap of the file.
+A write cut short by a crash is cut off the end when the file is next opened, and a file
+grown past `CHUNK_CACHE_MAX_BYTES` starts over.
+"""
+
+from __future__ import annotations
+
+import glob
+import hashlib
+import importlib
+import mmap
+import os
+import struct
+import threading
+from functools import lru_cache
+
+import core.constants as c
+from game.chunk_worker import ChunkPayload, Footprint, chunk_stamp, rehydrate
+from game.entities.village import register_site_cache, site_registry
+
+MAGIC = b"RPGC"
+FORMAT = 1
+SUFFIX = ".chunks"
+_HEADER = struct.Struct("<4sI")
+_ENTRY = struct.Struct("<16sI")
+_COUNTS = struct.Struct("<5H")
+_DETAIL = struct.Struct("<ddH")
+_POI = struct.Struct("<ddHH")
+_SCENERY = struct.Struct("<ddddHH")
+_TRAP = struct.Struct("<dd")
+
+# Every module a chunk's contents come out of. The constants go in whole: the generators
+# read tables from half of them.
+_GENERATOR_MODULES = (
+    "game.chunk_worker",
+    "game.entities.poi",
+    "game.entities.terrain",
+    "game.entities.traps",
+    "game.entities.village",
+)
+
+
+@lru_cache(maxsize=1)
+def generator_version() -> str:
+    """A hash of the source chunks are generated by: a different one for any change to it."""
+    digest = hashlib.sha1(f"{MAGIC!r}{FORMAT}".encode("ascii"))
+    paths = [importlib.import_module(name).__file__ for name in _GENERATOR_MODULES]
+    paths += sorted(glob.glob(os.path.join(glob.escape(os.path.dirname(c.__file__)), "*.py")))
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def world_key() -> str:
+    """Which file the chunks of the world registered now go in."""
+    digest = hashlib.sha1(generator_version().encode("ascii"))
+    digest.update(repr(site_registry()).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def chunk_key(chunk: tuple[int, int], nearby, villages) -> bytes:
+    footprints = sorted(Footprint.of(b) for b in nearby)
+    sites = sorted((v.x, v.y, v.grounds_radius) for v in villages)
+    return hashlib.sha1(repr((chunk, footprints, sites)).encode("utf-8")).digest()[:16]
+
+
+def encode_records(records: tuple) -> bytes:
+    details, pois, scenery, traps = records
+    strings: dict[str, int] = {}
+
+    def ref(text: str) -> int:
+        return strings.setdefault(text, len(strings))
+
+    parts = [_DETAIL.pack(x, y, ref(kind)) for x, y, kind in details]
+    parts += [_POI.pack(x, y, ref(kind), ref(poi_id)) for x, y, kind, poi_id in pois]
+    parts += [_SCENERY.pack(x, y, size, angle, ref(kind), ref(biome)) for x, y, kind, size, biome, angle in scenery]
+    parts += [_TRAP.pack(x, y) for x, y in traps]
+    table = []
+    for text in strings:
+        raw = text.encode("utf-8")
+        table.append(bytes([len(raw)]) + raw)
+    counts = _COUNTS.pack(len(strings), len(details), len(pois), len(scenery), len(traps))
+    return counts + b"".join(table) + b"".join(parts)
+
+
+def decode_records(body: bytes) -> tuple:
+    """What `encode_records` was given, the lists as lists of tuples."""
+    n_strings, n_details, n_pois, n_scenery, n_traps = _COUNTS.unpack_from(body, 0)
+    offset = _COUNTS.size
+    strings = []
+    for _ in range(n_strings):
+        length = body[offset]
+        strings.append(body[offset + 1 : offset + 1 + length].decode("utf-8"))
+        offset += 1 + length
+
+    def unpack(record: struct.Struct, count: int) -> list[tuple]:
+        nonlocal offset
+        end = offset + record.size * count
+        rows = list(record.iter_unpack(body[offset:end])) if count else []
+        offset = end
+        return rows
+
+    details = [(x, y, strings[kind]) for x, y, kind in unpack(_DETAIL, n_details)]
+    pois = [(x, y, strings[kind], strings[poi_id]) for x, y, kind, poi_id in unpack(_POI, n_pois)]
+    scenery = [
+        (x, y, strings[kind], size, strings[biome], angle)
+        for x, y, size, angle, kind, biome in unpack(_SCENERY, n_scenery)
+    ]
+    traps = unpack(_TRAP, n_traps)
+    return details, pois, scenery, traps
+
+
+class ChunkCache:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        # The open world's key and file, its mmap (None while the file holds no entries),
+        # and where each chunk's body is in it: key -> (offset, length).
+        self._world = None
+        self._file = None
+        self._map = None
+        self._index: dict[bytes, tuple[int, int]] = {}
+
+    def world(self) -> str:
+        """The key of the world registered now."""
+        return world_key()
+
+    def invalidate(self):
+        """The village sites changed: the file open describes another world now."""
+        with self._lock:
+            self._close()
+
+    def get(self, chunk: tuple[int, int], nearby, villages) -> ChunkPayload | None:
+        """This chunk as it was built against these neighbours, or None if it never was."""
+        key = chunk_key(chunk, nearby, villages)
+        try:
+            with self._lock:
+                self._open()
+                entry = self._index.get(key)
+                if entry is None:
+                    return None
+                offset, length = entry
+                if self._map is None or offset + length > len(self._map):
+                    self._remap()
+                body = self._map[offset : offset + length]
+            return rehydrate(chunk, chunk_stamp(nearby, villages), decode_records(body))
+        except (OSError, ValueError, IndexError, struct.error) as e:
+            print(f"Chunk cache read failed for {chunk}: {type(e).__name__}: {e}")
+            return None
+
+    def put(self, chunk: tuple[int, int], records: tuple, nearby, villages, world: str | None = None):
+        """Keep a chunk built against these neighbours (`chunk_records`), unless it was built
+        for a `world` other than the one registered now."""
+        key = chunk_key(chunk, nearby, villages)
+        body = encode_records(records)
+        try:
+            with self._lock:
+                self._open()
+                if key in self._index or (world is not None and world != self._world):
+                    return
+                self._file.seek(0, os.SEEK_END)
+                start = self._file.tell() + _ENTRY.size
+                if start + len(body) > c.World.CHUNK_CACHE_MAX_BYTES:
+                    self._reset()
+                    start = _HEADER.size + _ENTRY.size
+                self._file.write(_ENTRY.pack(key, len(body)) + body)
+                self._file.flush()
+                self._index[key] = (start, len(body))
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Chunk cache write failed for {chunk}: {type(e).__name__}: {e}")
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _open(self):
+        world = world_key()
+        if world == self._world:
+            return
+        self._close()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{world}{SUFFIX}")
+        self._file = open(path, "a+b")
+        self._world = world
+        self._file.seek(0)
+        if self._file.read(_HEADER.size) != _HEADER.pack(MAGIC, FORMAT):
+            self._reset()
+        else:
+            self._scan()
+        self._prune(path)
+
+    def _scan(self):
+        """Index every whole entry in the file, and cut off a torn one at the end."""
+        self._remap()
+        size = len(self._map) if self._map is not None else _HEADER.size
+        offset = _HEADER.size
+        while offset + _ENTRY.size <= size:
+            key, length = _ENTRY.unpack_from(self._map, offset)
+            if offset + _ENTRY.size + length > size:
+                break
+            self._index[key] = (offset + _ENTRY.size, length)
+            offset += _ENTRY.size + length
+        if offset < size:
+            self._unmap()
+            self._file.truncate(offset)
+
+    def _reset(self):
+        self._unmap()
+        self._index.clear()
+        self._file.truncate(0)
+        self._file.write(_HEADER.pack(MAGIC, FORMAT))
+        self._file.flush()
+
+    def _remap(self):
+        self._unmap()
+        if os.fstat(self._file.fileno()).st_size > _HEADER.size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _unmap(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _close(self):
+        self._unmap()
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._world = None
+        self._index.clear()
+
+    def _prune(self, keep: str):
+        """Drop the files of all but the last `CHUNK_CACHE_WORLDS_KEPT` worlds opened."""
+        os.utime(keep)
+        paths = glob.glob(os.path.join(glob.escape(self.directory), f"*{SUFFIX}"))
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[c.World.CHUNK_CACHE_WORLDS_KEPT :]:
+            if path != keep:
+                os.remove(path)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_chunk_cache() -> ChunkCache | None:
+    """The chunk cache, or None when `World.CHUNK_CACHE_DIR` turns it off."""
+    global _cache
+    if c.World.CHUNK_CACHE_DIR is None:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ChunkCache(c.World.CHUNK_CACHE_DIR)
+                register_site_cache(_cache.invalidate)
+    return _cache
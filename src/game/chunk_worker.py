@@ -0,0 +1,307 @@
+"""Chunks of wilderness built on a thread of their own, ahead of the player.
+
+A chunk's floor details, landmark, scenery and traps are a pure function of its coordinates
+and of what already stands near it (the buildings within a chunk, the villages within
+reach), and building them is the expensive part of loading a chunk: a forest's worth of
+trunks, each tested against roads, rivers and clearings. `WorldStreaming` used to do all of
+it for the whole `CHUNK_LOAD_RADIUS` window in the frame the player crossed a border. Now it
+asks this worker for the chunks the player is heading towards (`request`), and adds the
+finished ones (`ChunkPayload`) to the world a few at a time, on the main thread, within
+`World.CHUNK_INTEGRATE_BUDGET_MS` of a frame. Everything that touches the world itself
+(villages, saved POI and trap state, camp garrisons) stays on the main thread.
+
+A chunk built once is kept on disk (`game.chunk_cache`), and the worker reads it back from
+there rather than building it again (`build`).
+
+A payload remembers what it was laid out against (`stamp`). If a village went up near it
+meanwhile, the stamp no longer matches and it is built again, so a chunk comes out the same
+whichever path made it.
+
+The worker is a thread, so the GIL still serialises it with the frame: it takes the time the
+main thread spends waiting in `clock.tick`, and the hitch becomes a few slower frames spread
+over the walk towards the border. With `World.CHUNK_PROCESSES` set, the thread hands the
+chunks to that many processes instead, several at once, and the building happens off the
+GIL altogether. A process is given the village sites registered when it starts
+(`site_registry`), since the registry is what the terrain is laid out against, and for each
+chunk only what the generators read of its neighbours (`Footprint`, `Site`). It sends back
+plain tuples rather than `Scenery` objects, which is a fraction of the pickling, and the
+objects are made again from them here (`rehydrate`): every shape is rolled from a piece's
+kind and position, so they come out the same as the ones the process made.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import random
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import NamedTuple
+
+import pygame
+
+import core.constants as c
+from game.entities.poi import PointOfInterest, pois_for_chunk
+from game.entities.scenery import Scenery
+from game.entities.terrain import generate_chunk_scenery
+from game.entities.traps import BearTrap, traps_for_chunk
+from game.entities.village import load_site_registry, site_registry
+
+# How long `close` waits for the chunk being built to finish.
+CLOSE_TIMEOUT_S = 2.0
+
+
+def chunk_stamp(nearby, villages) -> tuple[frozenset, frozenset]:
+    """What a chunk is laid out against, by identity: equal stamps, equal chunks."""
+    return frozenset(id(b) for b in nearby), frozenset(id(v) for v in villages)
+
+
+@dataclass
+class ChunkPayload:
+    """Everything one chunk holds. Built off the main thread, then kept as it is: a loaded
+    chunk is its payload, in `World._chunks`, until it is unloaded."""
+
+    chunk: tuple[int, int]
+    stamp: tuple[frozenset, frozenset]
+    details: list[tuple] = field(default_factory=list)
+    pois: list = field(default_factory=list)
+    scenery: list = field(default_factory=list)
+    traps: list = field(default_factory=list)
+
+
+def build_chunk(chunk: tuple[int, int], nearby, villages) -> ChunkPayload:
+    """Everything a chunk holds that comes from its seed. Touches nothing but its arguments,
+    so any thread may run it."""
+    cx, cy = chunk
+    size = c.World.CHUNK_SIZE
+    payload = ChunkPayload(chunk, chunk_stamp(nearby, villages))
+    rng = random.Random(f"{cx},{cy}")
+    for _ in range(c.World.DETAILS_PER_CHUNK):
+        x = cx * size + rng.uniform(0, size)
+        y = cy * size + rng.uniform(0, size)
+        payload.details.append((x, y, rng.choice(["stone", "flower"])))
+    payload.pois = pois_for_chunk(cx, cy, nearby)
+    # The wilderness itself, laid down last so it can be kept off everything already
+    # standing here: the settlement, its buildings and this chunk's landmark.
+    payload.scenery = generate_chunk_scenery(cx, cy, nearby, villages, payload.pois)
+    # The hunters' traps, laid last: they need the wilderness this chunk just grew, so
+    # none of them ends up under a trunk or in the water where nothing could step on it.
+    payload.traps = traps_for_chunk(cx, cy, nearby, payload.scenery)
+    return payload
+
+
+class Footprint(NamedTuple):
+    """What the chunk generators read of a building, and nothing they don't: enough to
+    answer `covers` and `bounds` the way the building would, in a few numbers."""
+
+    x: float
+    y: float
+    w: int
+    h: int
+    rects: tuple[tuple[int, int, int, int], ...]
+
+    @classmethod
+    def of(cls, building) -> Footprint:
+        return cls(building.x, building.y, building.w, building.h, tuple(tuple(r) for r in building.footprint()))
+
+    def covers(self, x, y, radius: float = 0.0) -> bool:
+        return any(pygame.Rect(r).inflate(radius * 2, radius * 2).collidepoint(x, y) for r in self.rects)
+
+    @property
+    def bounds(self) -> pygame.Rect:
+        return pygame.Rect(self.rects[0]).unionall([pygame.Rect(r) for r in self.rects[1:]])
+
+
+class Site(NamedTuple):
+    """What the chunk generators read of a village."""
+
+    x: float
+    y: float
+    grounds_radius: float
+
+
+def _build_records(chunk: tuple[int, int], footprints: list[Footprint], sites: list[Site]) -> tuple:
+    """`build_chunk`, run in a chunk process, as `chunk_records`."""
+    return chunk_records(build_chunk(chunk, footprints, sites))
+
+
+def chunk_records(payload: ChunkPayload) -> tuple:
+    """A payload as plain tuples, (details, pois, scenery, traps): what a chunk process sends
+    back and the chunk cache keeps, and all `rehydrate` needs to make it again."""
+    return (
+        payload.details,
+        [(p.x, p.y, p.kind, p.id) for p in payload.pois],
+        [(s.x, s.y, s.kind, s.size, s.biome, s.angle) for s in payload.scenery],
+        [(t.x, t.y) for t in payload.traps],
+    )
+
+
+def rehydrate(chunk: tuple[int, int], stamp, records: tuple) -> ChunkPayload:
+    """The payload `_build_records` described."""
+    details, pois, scenery, traps = records
+    return ChunkPayload(
+        chunk,
+        stamp,
+        details,
+        [PointOfInterest(x, y, kind, poi_id=poi_id) for x, y, kind, poi_id in pois],
+        [Scenery(x, y, kind, chunk, size=size, biome=biome, angle=angle) for x, y, kind, size, biome, angle in scenery],
+        [BearTrap(x, y, chunk) for x, y in traps],
+    )
+
+
+def chunk_pool(processes: int) -> ProcessPoolExecutor:
+    """Processes that build chunks against the village sites registered now."""
+    return ProcessPoolExecutor(
+        processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=load_site_registry,
+        initargs=(site_registry(),),
+    )
+
+
+def submit_chunk(pool: ProcessPoolExecutor, chunk: tuple[int, int], nearby, villages):
+    """Have `pool` build this chunk; the future's result is for `rehydrate`."""
+    footprints = [Footprint.of(b) for b in nearby]
+    sites = [Site(v.x, v.y, v.grounds_radius) for v in villages]
+    return pool.submit(_build_records, chunk, footprints, sites)
+
+
+class ChunkWorker:
+    def __init__(self, processes: int = c.World.CHUNK_PROCESSES, cache=None):
+        self._lock = threading.Condition()
+        # chunk -> (nearby buildings, villages) to build it against, nearest first.
+        self._wanted: dict[tuple[int, int], tuple[list, list]] = {}
+        self._done: dict[tuple[int, int], ChunkPayload] = {}
+        # Chunks being built now: one at a time on the thread, one per process with a pool.
+        self._building: set[tuple[int, int]] = set()
+        self._processes = processes
+        # Started with the first chunk, once the world has registered its sites; started
+        # again if they have changed since.
+        self._pool = None
+        self._pool_sites = None
+        # Where chunks built before are read back from, and what is built is added to
+        # (`game.chunk_cache.ChunkCache`), or None.
+        self._cache = cache
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def request(self, jobs: list[tuple[tuple[int, int], list, list]]):
+        """Build these chunks, in this order, instead of whatever was asked for before.
+        Chunks already built or being built are left alone."""
+        with self._lock:
+            self._wanted = {
+                chunk: (nearby, villages)
+                for chunk, nearby, villages in jobs
+                if chunk not in self._done and chunk not in self._building
+            }
+            self._lock.notify_all()
+
+    def built(self) -> list[ChunkPayload]:
+        """The chunks finished so far, not yet taken."""
+        with self._lock:
+            return list(self._done.values())
+
+    def discard(self, chunk: tuple[int, int]):
+        with self._lock:
+            self._done.pop(chunk, None)
+
+    def take(self, chunk: tuple[int, int]) -> ChunkPayload | None:
+        """This chunk's payload if it is built, after waiting for it if it is being built
+        now; None if it isn't, and then it is no longer asked for: the caller builds it."""
+        with self._lock:
+            self._wanted.pop(chunk, None)
+            while chunk in self._building:
+                self._lock.wait()
+            return self._done.pop(chunk, None)
+
+    def build(self, chunk: tuple[int, int], nearby, villages) -> ChunkPayload:
+        """This chunk from the cache, or built here and now and added to it, on whichever
+        thread calls this: the worker's own, or the main thread for a chunk it cannot wait for."""
+        if self._cache is not None:
+            payload = self._cache.get(chunk, nearby, villages)
+            if payload is not None:
+                return payload
+        payload = build_chunk(chunk, nearby, villages)
+        if self._cache is not None:
+            self._cache.put(chunk, chunk_records(payload), nearby, villages)
+        return payload
+
+    def close(self):
+        """Stop for good, once the chunk being built on the thread (if any) is done: after
+        this no thread is reading the village sites a new world is about to register. The
+        processes have their own copy of them, and are told to stop without being waited for."""
+        with self._lock:
+            self._closed = True
+            self._wanted.clear()
+            self._lock.notify_all()
+        self._thread.join(CLOSE_TIMEOUT_S)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while (not self._wanted or len(self._building) >= max(1, self._processes)) and not self._closed:
+                    self._lock.wait()
+                if self._closed:
+                    return
+                chunk = next(iter(self._wanted))
+                nearby, villages = self._wanted.pop(chunk)
+                self._building.add(chunk)
+            if self._processes:
+                self._submit(chunk, nearby, villages)
+                continue
+            payload = None
+            try:
+                payload = self.build(chunk, nearby, villages)
+            except Exception as e:
+                # The main thread builds it itself when it gets there.
+                print(f"Chunk {chunk} failed to build in the background: {type(e).__name__}: {e}")
+            self._finish(chunk, payload)
+
+    def _submit(self, chunk: tuple[int, int], nearby, villages):
+        stamp = chunk_stamp(nearby, villages)
+        world = None
+        if self._cache is not None:
+            payload = self._cache.get(chunk, nearby, villages)
+            if payload is not None:
+                self._finish(chunk, payload)
+                return
+            # What it is built against now: by the time it is back, a new world may be.
+            world = self._cache.world()
+        try:
+            sites = site_registry()
+            if self._pool is None or sites != self._pool_sites:
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool, self._pool_sites = chunk_pool(self._processes), sites
+            future = submit_chunk(self._pool, chunk, nearby, villages)
+        except Exception as e:
+            print(f"Chunk {chunk} could not be sent to a chunk process: {type(e).__name__}: {e}")
+            self._finish(chunk, None)
+            return
+        future.add_done_callback(
+            lambda future: self._finish(chunk, self._collect(chunk, stamp, future, (nearby, villages, world)))
+        )
+
+    def _collect(self, chunk: tuple[int, int], stamp, future, built_against) -> ChunkPayload | None:
+        if future.cancelled():
+            return None
+        try:
+            records = future.result()
+            payload = rehydrate(chunk, stamp, records)
+        except Exception as e:
+            print(f"Chunk {chunk} failed to build in a chunk process: {type(e).__name__}: {e}")
+            return None
+        if self._cache is not None:
+            nearby, villages, world = built_against
+            self._cache.put(chunk, records, nearby, villages, world=world)
+        return payload
+
+    def _finish(self, chunk: tuple[int, int], payload: ChunkPayload | None):
+        with self._lock:
+            if payload is not None and not self._closed:
+                self._done[chunk] = payload
+            self._building.discard(chunk)
+            self._lock.notify_all()
@@ -219,7 +219,7 @@ class WorldCombat:
         poi_hit = next(
             (
                 p
-                for p in self.pois
+                for p in self.chunk_contents_in_range("pois", *pos, hit_radius + c.PointsOfInterest.HIT_RADIUS)
                 if p.has_loot and not p.looted and p.distance_to_point(pos) < hit_radius + c.PointsOfInterest.HIT_RADIUS
             ),
             None,
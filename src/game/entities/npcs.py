@@ -366,9 +366,11 @@ class NPC(Entity):
             self.shop_prices[item.id] = round(entry["price"] * rarity_tier(rarity).price_mult)
         self.restock_at = time.time() + c.Villages.SHOP_RESTOCK_S
 
-    def assign_name(self, npc_name_generator: NPCNameGenerator):
+    def assign_name(self, npc_name_generator: NPCNameGenerator, wait: bool = True):
+        """Name them if they have no name yet. `wait=False` only takes a name that is ready,
+        leaving them nameless for now rather than holding up the frame for one."""
         if self.name is None:
-            self.name = npc_name_generator.get_name()
+            self.name = npc_name_generator.get_name(wait=wait)
 
     def update(self, player: Player, dt, *args, **kwargs):
         """One frame, with whatever this one is aiming at held in front of them.
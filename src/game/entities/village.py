@@ -716,6 +716,21 @@ def registered_keepouts() -> tuple[tuple[float, float, float], ...]:
     return tuple(_keepouts)
 
 
+def site_registry() -> tuple[tuple, tuple]:
+    """Everything registered, as plain tuples: what another process needs to lay chunks out
+    against the same world as this one (`load_site_registry`)."""
+    return tuple(sorted(_registered.items())), tuple(_keepouts)
+
+
+def load_site_registry(registry: tuple[tuple, tuple]):
+    """Replace what is registered with a `site_registry` taken elsewhere."""
+    settlements, keepouts = registry
+    _registered.clear()
+    _registered.update(settlements)
+    _keepouts[:] = keepouts
+    _invalidate_sites()
+
+
 def register_world_sites(villages, buildings):
     """Register everything one world holds that its own region grid never offered. Called
     once when a world is created or loaded, before any chunk is generated: after this the
@@ -13,7 +13,8 @@ from core.utils import parse_response_quest_analysis
 from game.entities.items import Item
 from game.entities.npcs import NPC
 from game.entities.terrain import road_points_for_chunk
-from llm.llm_request_queue import generate_response_queued
+from llm.llm_request_queue import LLMExpired, generate_response_queued
+from llm.pregen import ContentPool, register_pool, take
 
 if TYPE_CHECKING:
     from game.entities.player import Player
@@ -23,6 +24,33 @@ if TYPE_CHECKING:
 
 RUMOR_COLOR = c.Minimap.RUMOR_COLOR
 
+LORE_SYSTEM_PROMPT = "You write short atmospheric lines for an RPG world. Reply with one short sentence only."
+# The omens that only need the world to be written, so a few can be ready before they roll.
+TREASURE_OMEN = (
+    "In one short sentence, hint that a hidden treasure lies somewhere nearby, without revealing an exact location."
+)
+BLOOD_NIGHT_OMEN = "In one short ominous sentence, warn that a night of blood is coming soon."
+BOSS_OMEN = "In one short ominous sentence, warn that a terrible beast or boss is about to rise nearby."
+TREASURE_PROPHECY = (
+    "In at most 15 words, have a villager whisper that a treasure lies hidden out in the wilds, "
+    "without giving exact directions."
+)
+
+
+def _lore_prompt(context: str | None, instruction: str) -> tuple[str, str]:
+    return f"World: {context}\n{instruction}", LORE_SYSTEM_PROMPT
+
+
+LORE_LINES = register_pool(
+    ContentPool(
+        "lore_lines",
+        "Event flavor text",
+        (TREASURE_OMEN, BLOOD_NIGHT_OMEN, BOSS_OMEN, TREASURE_PROPHECY),
+        _lore_prompt,
+        c.Pregen.LORE_LINES,
+    )
+)
+
 
 class EventSystem:
     """Rolls random world events on a cooldown: wandering merchants, treasure, blood nights,
@@ -141,9 +169,15 @@ class EventSystem:
         return None
 
     def _generate_lore_line(self, instruction: str) -> str:
-        system_prompt = "You write short atmospheric lines for an RPG world. Reply with one short sentence only."
-        prompt = f"World: {self.world.context}\n{instruction}"
-        text = generate_response_queued(prompt, system_prompt, "Event flavor text") or ""
+        # One of the omens made while the model was idle, if there is one (`llm.pregen`).
+        text = take(LORE_LINES, instruction)
+        if text is None:
+            prompt, system_prompt = _lore_prompt(self.world.context, instruction)
+            try:
+                text = generate_response_queued(prompt, system_prompt, "Event flavor text") or ""
+            except LLMExpired:
+                # Queued past the moment it was for: every caller has a canned line instead.
+                return ""
         return text.strip().strip('"').split("\n")[0]
 
     # ------------------------------------------------------------------ wandering merchant
@@ -250,10 +284,7 @@ class EventSystem:
             self.world.mark_rumor(pos[0], pos[1], mark)
 
     def _treasure_with_presage(self, player: Player):
-        text = self._generate_lore_line(
-            "In one short sentence, hint that a hidden treasure lies somewhere nearby, without revealing "
-            "an exact location."
-        )
+        text = self._generate_lore_line(TREASURE_OMEN)
         self.notify(text or "Whispers speak of treasure hidden nearby...", c.Colors.YELLOW)
         time.sleep(random.uniform(*c.Events.PRESAGE_DELAY_RANGE_S))
         self._spawn_treasure(player, "The treasure appears, right where the whispers pointed")
@@ -270,7 +301,7 @@ class EventSystem:
             get_banner().trigger("BLOOD NIGHT", "Monsters grow bolder, and the dead pay better", c.Colors.RED)
 
     def _blood_night_with_presage(self):
-        text = self._generate_lore_line("In one short ominous sentence, warn that a night of blood is coming soon.")
+        text = self._generate_lore_line(BLOOD_NIGHT_OMEN)
         self.notify(text or "Something dark is coming with the night...", c.Colors.RED)
         time.sleep(random.uniform(*c.Events.PRESAGE_DELAY_RANGE_S))
         self._start_blood_night()
@@ -292,9 +323,7 @@ class EventSystem:
         self.world.spawn_boss(*pos, announce=message or "A monstrous presence, {name}, stirs nearby")
 
     def _boss_event_with_presage(self, player: Player):
-        text = self._generate_lore_line(
-            "In one short ominous sentence, warn that a terrible beast or boss is about to rise nearby."
-        )
+        text = self._generate_lore_line(BOSS_OMEN)
         self.notify(text or "The ground trembles with something monstrous...", c.Colors.BOSS_BAR)
         time.sleep(random.uniform(*c.Events.PRESAGE_DELAY_RANGE_S))
         self._spawn_boss_event(player, "{name} has risen, and it hungers")
@@ -317,10 +346,7 @@ class EventSystem:
         self.world.mark_rumor(x, y, label)
 
     def _generate_prophetic_rumor(self, player: Player):
-        text = self._generate_lore_line(
-            "In at most 15 words, have a villager whisper that a treasure lies hidden out in the wilds, "
-            "without giving exact directions."
-        )
+        text = self._generate_lore_line(TREASURE_PROPHECY)
         self.notify(
             f"Rumour: {text or 'a treasure lies hidden somewhere out there'} (watch your map)",
             RUMOR_COLOR,
@@ -363,7 +389,11 @@ class EventSystem:
             f"{npc.name} suddenly faces an urgent problem that an adventurer could solve by fetching an item. "
             f"Reply with this exact JSON format:\n{json_format}"
         )
-        response = generate_response_queued(prompt, system_prompt, "Village crisis", raw=True)
+        try:
+            response = generate_response_queued(prompt, system_prompt, "Village crisis", raw=True)
+        except LLMExpired:
+            # The model was busy for so long that the crisis would land out of nowhere.
+            return
         quest_info = parse_response_quest_analysis(response)
         quest_system.create_quest_from_analysis(npc, quest_info, npc_name_generator)
         if npc.quest:
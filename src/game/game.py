@@ -21,8 +21,10 @@ from game.loot import open_lootbox
 from game.world import World
 from llm.death_taunts import DeathTauntGenerator
 from llm.dialogue_manager import DialogueManager
-from llm.llm_request_queue import get_llm_tasks, llm_busy
+from llm.llm_request_queue import drain_llm_callbacks, get_llm_metrics, get_llm_tasks, llm_busy
 from llm.name_generator import NPCNameGenerator
+from llm.pregen import set_world
+from llm.warmup import warm_up
 from ui.game_renderer import GameRenderer
 from ui.menus.context_menu import ContextMenu
 from ui.menus.game_over import run_game_over
@@ -125,6 +127,12 @@ class Game:
         self.dialogue_manager.quest_system.on_complete = self.save_data
         self.npc_name_generator = NPCNameGenerator(self.save_system)
         self.death_taunts = DeathTauntGenerator(self.save_system)
+        # The preambles with this world's context in them, loaded from disk for a world
+        # played before: so the first conversation starts as fast as the ones after it.
+        self.save_system.when_context(warm_up)
+        # What the idle model makes ahead for a world (omens, boss and village names) is
+        # made for this one from now on.
+        self.save_system.when_context(set_world)
         self.active_menu = False
         # Set by the pause menu's "Quit to menu"; breaks the run loop so control
         # returns to the main menu (game state is saved on the way out).
@@ -510,8 +518,8 @@ class Game:
                 # off. Kill it or walk away from it first.
                 label = f"{npc.name or 'They'} won't talk with that out there"
             elif llm_busy():
-                # One model serves the whole game and the call already running cannot be
-                # cut short, so a conversation opened now would sit on an empty box.
+                # One model serves the whole game; dialogue already in flight (or background
+                # work past its preemption budget) would leave a new conversation on an empty box.
                 label = f"{npc.name} is busy..." if npc.name else "Busy..."
             else:
                 label = f"E: talk to {npc.name}" if npc.name else "E: talk"
@@ -554,6 +562,15 @@ class Game:
         the prompt and the talk key so the two can't disagree, exactly like the busy check."""
         return bool(self.world.hostiles_near(self.player.x, self.player.y, c.Entities.TALK_SAFE_RADIUS))
 
+    def _greeting_target(self):
+        """Who the talk key would open a conversation with this frame, if anyone: the NPC the
+        prompt offers, when it offers talking rather than a reason not to. What
+        `DialogueManager.speculate_greeting` writes a first line ahead for."""
+        interaction = self.interaction
+        if interaction is None or interaction.kind != "npc" or self._threat_nearby():
+            return None
+        return interaction.target
+
     def _talk_to(self, npc):
         if self.world.context is None or not npc.can_talk or (npc.is_merchant and not npc.shop_ready):
             return
@@ -916,6 +933,10 @@ class Game:
             if not self.handle_input() or self.quit_to_menu:
                 break
 
+            # Finished LLM work that touches the world (names, shop stock, new quests) is
+            # applied here, between frames, rather than from the worker mid-update.
+            drain_llm_callbacks()
+
             # Skip world simulation while a menu is open to save computation, but keep
             # rendering the world every frame so menus show it behind their dim overlay
             # instead of it going stale (and progressively darker as the overlay restacks).
@@ -943,6 +964,8 @@ class Game:
         self.world.close()
         self.npc_name_generator.close()
         self.death_taunts.close()
+        self.save_system.close()
+        set_world(None)
 
     def _update_frame(self):
         """One step of the world. Only runs with no menu open, which is what pausing is."""
@@ -960,6 +983,7 @@ class Game:
         self.interior = self.world.building_at(self.player.x, self.player.y)
         self._sweep_loot(gameplay_dt)
         self.interaction = self.current_interaction()
+        self.dialogue_manager.speculate_greeting(self._greeting_target(), self.npc_name_generator, self.world)
         self._lift_gate(gameplay_dt)
         self.update_camera()
         for system in (get_shake(), get_particles(), get_swings(), get_impacts()):
@@ -1032,6 +1056,8 @@ class Game:
                 self.world,
                 self.last_save_ms,
                 self.gate_lift,
+                # Only read while the panel shows them: summarising costs a sort per figure.
+                get_llm_metrics() if self.game_renderer.show_llm_tasks else None,
             )
 
         self.context_window.update()
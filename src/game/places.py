@@ -211,7 +211,7 @@ class WorldPlaces:
         pos = player.get_pos()
         camps = [
             poi
-            for poi in self.pois
+            for poi in self.chunk_contents_in_range("pois", *pos, c.PointsOfInterest.REST_DISTANCE)
             if poi.has_fire
             and poi.distance_to_point(pos) < c.PointsOfInterest.REST_DISTANCE
             and self.camp_is_clear(poi)
@@ -311,7 +311,7 @@ class WorldPlaces:
         pos = player.get_pos()
         caves = [
             poi
-            for poi in self.pois
+            for poi in self.chunk_contents_in_range("pois", *pos, c.PointsOfInterest.CAVE_ENTER_DISTANCE)
             if poi.kind == "cave" and poi.distance_to_point(pos) < c.PointsOfInterest.CAVE_ENTER_DISTANCE
         ]
         return min(caves, key=lambda poi: poi.distance_to_point(pos), default=None)
@@ -436,7 +436,7 @@ class WorldPlaces:
         pos = player.get_pos()
         shrines = [
             poi
-            for poi in self.pois
+            for poi in self.chunk_contents_in_range("pois", *pos, c.PointsOfInterest.SHRINE_PRAY_DISTANCE)
             if poi.kind == "shrine"
             and not poi.prayed
             and poi.distance_to_point(pos) < c.PointsOfInterest.SHRINE_PRAY_DISTANCE
@@ -953,7 +953,7 @@ class WorldPlaces:
         shrine's flavor, a quiet landmark saying what it is, a signpost or a camper pointing
         the way to somewhere still unexplored."""
         pos = player.get_pos()
-        for poi in self.pois:
+        for poi in self.chunk_contents_in_range("pois", *pos, c.PointsOfInterest.DISCOVER_DISTANCE):
             if poi.discovered or poi.distance_to_point(pos) >= c.PointsOfInterest.DISCOVER_DISTANCE:
                 continue
             if poi.kind == "shrine":
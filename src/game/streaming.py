@@ -1,17 +1,18 @@
 from __future__ import annotations
 
-import random
-import threading
+import math
+import time
+from collections.abc import Collection
 from typing import TYPE_CHECKING
 
 import core.constants as c
 from core.audio import play_sound
+from game.chunk_worker import ChunkPayload, chunk_stamp
 from game.entities.breakables import generate_breakables
-from game.entities.poi import pois_for_chunk
-from game.entities.terrain import blocking_index, generate_chunk_scenery, water_index
-from game.entities.traps import traps_for_chunk
+from game.entities.terrain import blocking_index, water_index
 from game.entities.village import generate_village, village_site
-from llm.llm_request_queue import generate_response_queued, generate_response_stream_queued
+from llm.llm_request_queue import generate_response_stream_queued, submit_queued
+from llm.pregen import ContentPool, register_pool, submit_pooled, take
 
 if TYPE_CHECKING:
     from game.entities.buildings import Building
@@ -19,6 +20,68 @@ if TYPE_CHECKING:
     from game.entities.village import Village
 
 
+def _context_prompt(context: str | None, key: str) -> tuple[str, str]:
+    system_prompt = (
+        "You create worlds for an RPG. "
+        "Each world must contain one original detail that can serve as a starting point for quests."
+    )
+    prompt = (
+        "In a single very short sentence, describe an RPG world starting with 'The game takes place...' "
+        "The sentence must contain one original detail that can serve as a starting point for adventures."
+    )
+    return prompt, system_prompt
+
+
+def _village_name_prompt(context: str | None, size: str) -> tuple[str, str]:
+    system_prompt = "You name settlements for an RPG world. Reply with the name only, no quotes, no punctuation."
+    return f"{context}\nGive a short name, 1 to 3 words, for a small {size} in the wilds of this world.", system_prompt
+
+
+# Made while the model is idle (`llm.pregen`): the next new game's world, written before
+# the player asks for one, and names for the villages that load in as the player walks.
+WORLD_CONTEXTS = register_pool(
+    ContentPool(
+        "world_contexts", "Context generation", ("",), _context_prompt, c.Pregen.WORLD_CONTEXTS, per_world=False
+    )
+)
+VILLAGE_NAMES = register_pool(
+    ContentPool(
+        "village_names",
+        "Village naming",
+        tuple(size for size, _ in c.Villages.SIZE_WEIGHTS),
+        _village_name_prompt,
+        c.Pregen.VILLAGE_NAMES,
+    )
+)
+
+
+class ChunkItems(Collection):
+    """One kind of thing (floor details, scenery, traps or POIs) across every loaded chunk,
+    read in place. What `World.scenery` and the others used to be as flat lists, for the
+    callers that want all of them: the ones that only want what is around a point ask
+    `World.chunk_contents_in_range`, which walks the chunks in that window and no others.
+    Read-only: chunks join and leave the world whole, in `_integrate_chunk` and
+    `_unload_chunk`."""
+
+    __slots__ = ("_chunks", "_field")
+
+    def __init__(self, chunks: dict[tuple[int, int], ChunkPayload], field: str):
+        self._chunks = chunks
+        self._field = field
+
+    def __iter__(self):
+        # Over a copy of the chunks: a callback on another thread may be reading while a
+        # chunk loads, and copying is one step the GIL does not split.
+        for payload in list(self._chunks.values()):
+            yield from getattr(payload, self._field)
+
+    def __len__(self) -> int:
+        return sum(len(getattr(payload, self._field)) for payload in list(self._chunks.values()))
+
+    def __contains__(self, item) -> bool:
+        return any(entry is item or entry == item for entry in self)
+
+
 class WorldStreaming:
     """How the endless map comes into being around the player: chunks of floor detail and
     landmarks generated from their coordinates and dropped again when left behind, the
@@ -27,7 +90,9 @@ class WorldStreaming:
 
     Mixed into `World`. A chunk is a pure function of (cx, cy) apart from `World.poi_state`,
     so it can be thrown away and rebuilt at will; a village is the deliberate exception,
-    generated once and then kept in the save (see `_ensure_village`).
+    generated once and then kept in the save (see `_ensure_village`). Being pure, chunks are
+    built ahead of the player on the chunk worker (`_prefetch_chunks`) and joined to the world
+    a few a frame (`_integrate_built`).
     """
 
     def _chunk_of(self, x, y) -> tuple[int, int]:
@@ -37,40 +102,39 @@ class WorldStreaming:
     def _load_chunk(self, chunk: tuple[int, int]):
         """Deterministically generate a chunk's floor details and points of interest, so
         revisiting it looks the same and walking outward never runs out of things to find.
-        A chunk that holds a village site builds the settlement too, the first time only."""
-        cx, cy = chunk
-        size = c.World.CHUNK_SIZE
-        rng = random.Random(f"{cx},{cy}")
-        for _ in range(c.World.DETAILS_PER_CHUNK):
-            x = cx * size + rng.uniform(0, size)
-            y = cy * size + rng.uniform(0, size)
-            self.floor_details.append((x, y, rng.choice(["stone", "flower"])))
+        A chunk that holds a village site builds the settlement too, the first time only.
 
+        The fallback for a chunk needed this frame: one the chunk worker has built (or is
+        building) is taken from it, and anything else is read from the chunk cache or built
+        here and now."""
         self._ensure_village(chunk)
+        nearby, villages = self._chunk_inputs(chunk)
+        payload = self._chunk_worker.take(chunk)
+        if payload is None or payload.stamp != chunk_stamp(nearby, villages):
+            payload = self._chunk_worker.build(chunk, nearby, villages)
+        self._integrate_chunk(payload)
+
+    def _chunk_inputs(self, chunk: tuple[int, int]) -> tuple[list, list]:
+        """What a chunk is laid out against: the buildings in and around it, and the villages
+        whose grounds could reach into it."""
+        size = c.World.CHUNK_SIZE
+        center = ((chunk[0] + 0.5) * size, (chunk[1] + 0.5) * size)
+        nearby = self.buildings_in_range(center[0], center[1], size)
+        villages = [v for v in self.villages if v.distance_to_point(center) < v.grounds_radius + size * 2]
+        return nearby, villages
 
-        nearby = self.buildings_in_range((cx + 0.5) * size, (cy + 0.5) * size, size)
-        chunk_pois = pois_for_chunk(cx, cy, nearby)
-        for poi in chunk_pois:
+    def _integrate_chunk(self, payload: ChunkPayload):
+        """Put a built chunk into the world, with what the save remembers about its places."""
+        for poi in payload.pois:
             state = self.poi_state.get(poi.id)
             if state:
                 poi.apply_state(state)
-            self.pois.append(poi)
-            self._populate_camp(poi)
-
-        # The wilderness itself, laid down last so it can be kept off everything already
-        # standing here: the settlement, its buildings and this chunk's landmark.
-        center = ((cx + 0.5) * size, (cy + 0.5) * size)
-        villages = [v for v in self.villages if v.distance_to_point(center) < v.grounds_radius + size * 2]
-        chunk_scenery = generate_chunk_scenery(cx, cy, nearby, villages, chunk_pois)
-        self.scenery.extend(chunk_scenery)
-
-        # The hunters' traps, laid last: they need the wilderness this chunk just grew, so
-        # none of them ends up under a trunk or in the water where nothing could step on it.
-        for trap in traps_for_chunk(cx, cy, nearby, chunk_scenery):
+        for trap in payload.traps:
             trap.sprung = self.trap_state.get(trap.id, False)
-            self.traps.append(trap)
-
-        self._loaded_chunks.add(chunk)
+        self._chunks[payload.chunk] = payload
+        self._index_scenery(payload.scenery)
+        for poi in payload.pois:
+            self._populate_camp(poi)
 
     def _ensure_village(self, chunk: tuple[int, int]):
         """Build the village this chunk holds, if it holds one and nobody has built it yet.
@@ -113,61 +177,156 @@ class WorldStreaming:
         trees that would end up in the middle of the street are taken out here instead."""
         keep_out = village.grounds_radius + c.Scenery.CLEARANCE_VILLAGE
         footprints = [b.bounds.inflate(c.Scenery.CLEARANCE_BUILDING, c.Scenery.CLEARANCE_BUILDING) for b in buildings]
-        kept = []
-        for item in self.scenery:
-            if item.blocking_radius and village.distance_to_point((item.x, item.y)) < keep_out:
+        cut = []
+        # A chunk further out than that can still have grown a copse over its border.
+        for chunk in self._chunk_window(village.x, village.y, keep_out + c.World.CHUNK_SIZE):
+            payload = self._chunks.get(chunk)
+            if payload is None:
                 continue
-            if any(rect.collidepoint(item.x, item.y) for rect in footprints):
-                continue
-            kept.append(item)
-        self.scenery = kept
+            kept = []
+            for item in payload.scenery:
+                if item.blocking_radius and village.distance_to_point((item.x, item.y)) < keep_out:
+                    cut.append(item)
+                elif any(rect.collidepoint(item.x, item.y) for rect in footprints):
+                    cut.append(item)
+                else:
+                    kept.append(item)
+            payload.scenery = kept
+        self._unindex_scenery(cut)
 
     def _unload_chunk(self, chunk: tuple[int, int]):
-        self.floor_details = [d for d in self.floor_details if self._chunk_of(d[0], d[1]) != chunk]
-        # Filtered on the chunk that generated it rather than the one it stands in: a copse
-        # rolled at a chunk's edge spills over the border, and it leaves with its own chunk.
-        self.scenery = [s for s in self.scenery if s.chunk != chunk]
-        # A trap is rebuilt from its chunk seed like everything else here; only the fact
-        # that one has already shut is worth carrying away with it.
-        self.traps = [t for t in self.traps if t.chunk != chunk]
+        payload = self._chunks.pop(chunk, None)
+        if payload is None:
+            return
+        # Everything a chunk generated leaves with it, including the copse rolled at its
+        # edge that spilled over the border. A trap is rebuilt from its chunk seed like
+        # everything else here; only the fact that one has already shut is worth carrying
+        # away with it.
+        self._unindex_scenery(payload.scenery)
         dropped = set()
-        for poi in self.pois:
-            if self._chunk_of(poi.x, poi.y) != chunk:
-                continue
+        for poi in payload.pois:
             if poi.touched:
                 self.poi_state[poi.id] = poi.state()
             dropped.add(poi.id)
-        self.pois = [p for p in self.pois if p.id not in dropped]
         # A camp's guards belong to its chunk, not to the world: they leave with it and are
         # stood back up from the camp's own count when it loads again. Without this they
         # would be the one thing that accumulated forever as the player found more camps.
         if dropped:
             self.monsters = [m for m in self.monsters if m.camp_id not in dropped]
             self.critters = [cr for cr in self.critters if cr.camp_id not in dropped]
-        self._loaded_chunks.discard(chunk)
+
+    @property
+    def floor_details(self) -> ChunkItems:
+        """Every loaded chunk's floor details, as (x, y, kind)."""
+        return ChunkItems(self._chunks, "details")
+
+    @property
+    def scenery(self) -> ChunkItems:
+        return ChunkItems(self._chunks, "scenery")
+
+    @property
+    def traps(self) -> ChunkItems:
+        return ChunkItems(self._chunks, "traps")
+
+    @property
+    def pois(self) -> ChunkItems:
+        return ChunkItems(self._chunks, "pois")
 
     def _sync_chunks(self, player: Player):
         chunk = self._chunk_of(player.x, player.y)
-        if chunk == self._current_chunk:
+        self._track_heading(player)
+        moved = chunk != self._current_chunk
+        if moved:
+            self._current_chunk = chunk
+            cx, cy = chunk
+            load_r = c.World.CHUNK_LOAD_RADIUS
+            keep_r = c.World.CHUNK_KEEP_RADIUS
+            for dx in range(-load_r, load_r + 1):
+                for dy in range(-load_r, load_r + 1):
+                    candidate = (cx + dx, cy + dy)
+                    if candidate not in self._chunks:
+                        self._load_chunk(candidate)
+            for loaded in list(self._chunks):
+                if max(abs(loaded[0] - cx), abs(loaded[1] - cy)) > keep_r:
+                    self._unload_chunk(loaded)
+        self._prefetch_chunks(player)
+        if self._integrate_built() or moved:
+            # A trunk generated by the chunk the player just walked into can land on top of
+            # them (nothing knows where they stand at generation time), so they step out to
+            # the nearest clear ground rather than being stuck inside a tree. The same pass
+            # everything else on legs goes through (`World.unstick`).
+            self.unstick(player, player.size / 2)
+
+    def _track_heading(self, player: Player):
+        """Follow the player's velocity, smoothed over `CHUNK_HEADING_SMOOTH_S`, in world
+        units a second. A jump (fast travel, a respawn, a ladder) is not a velocity."""
+        now = time.monotonic()
+        last, self._last_seen = self._last_seen, (player.x, player.y, now)
+        if last is None or now <= last[2]:
+            return
+        dx, dy, dt = player.x - last[0], player.y - last[1], now - last[2]
+        if math.hypot(dx, dy) > c.World.CHUNK_SIZE:
+            self._velocity = (0.0, 0.0)
             return
-        self._current_chunk = chunk
-        cx, cy = chunk
+        share = min(1.0, dt / c.World.CHUNK_HEADING_SMOOTH_S)
+        vx, vy = self._velocity
+        self._velocity = (vx + (dx / dt - vx) * share, vy + (dy / dt - vy) * share)
+
+    def _prefetch_chunks(self, player: Player):
+        """Ask the chunk worker for the load window around where the player will be
+        `CHUNK_PREFETCH_S` from now, nearest first. Asked again only when that changes.
+
+        A chunk whose own village is not built yet is left to `_load_chunk`: the settlement
+        goes up on the main thread, and everything around it is laid out against it."""
+        vx, vy = self._velocity
+        ahead = self._chunk_of(player.x + vx * c.World.CHUNK_PREFETCH_S, player.y + vy * c.World.CHUNK_PREFETCH_S)
+        key = (self._current_chunk, ahead)
+        if key == self._prefetch_key:
+            return
+        self._prefetch_key = key
         load_r = c.World.CHUNK_LOAD_RADIUS
-        keep_r = c.World.CHUNK_KEEP_RADIUS
+        wanted = []
         for dx in range(-load_r, load_r + 1):
             for dy in range(-load_r, load_r + 1):
-                candidate = (cx + dx, cy + dy)
-                if candidate not in self._loaded_chunks:
-                    self._load_chunk(candidate)
-        for loaded in list(self._loaded_chunks):
-            if max(abs(loaded[0] - cx), abs(loaded[1] - cy)) > keep_r:
-                self._unload_chunk(loaded)
-        self._reindex_scenery()
-        # A trunk generated by the chunk the player just walked into can land on top of
-        # them (nothing knows where they stand at generation time), so they step out to
-        # the nearest clear ground rather than being stuck inside a tree. The same pass
-        # everything else on legs goes through (`World.unstick`).
-        self.unstick(player, player.size / 2)
+                chunk = (ahead[0] + dx, ahead[1] + dy)
+                if chunk in self._chunks or self._village_unbuilt(chunk):
+                    continue
+                wanted.append(chunk)
+        wanted.sort(key=self._chunk_distance)
+        self._prefetching = set(wanted)
+        self._chunk_worker.request([(chunk, *self._chunk_inputs(chunk)) for chunk in wanted])
+
+    def _village_unbuilt(self, chunk: tuple[int, int]) -> bool:
+        return village_site(*chunk) is not None and not any(village.chunk == chunk for village in self.villages)
+
+    def _chunk_distance(self, chunk: tuple[int, int]) -> int:
+        cx, cy = self._current_chunk
+        return max(abs(chunk[0] - cx), abs(chunk[1] - cy))
+
+    def _integrate_built(self) -> bool:
+        """Add the chunks the worker has finished that are now within `CHUNK_KEEP_RADIUS`,
+        nearest first, for at most `CHUNK_INTEGRATE_BUDGET_MS` (and always at least one).
+        Further ones wait their turn while they are still wanted. True if any were added."""
+        deadline = time.perf_counter() + c.World.CHUNK_INTEGRATE_BUDGET_MS / 1000
+        added = False
+        for payload in sorted(self._chunk_worker.built(), key=lambda p: self._chunk_distance(p.chunk)):
+            chunk = payload.chunk
+            if self._chunk_distance(chunk) > c.World.CHUNK_KEEP_RADIUS:
+                if chunk not in self._prefetching:
+                    self._chunk_worker.discard(chunk)
+                continue
+            if added and time.perf_counter() > deadline:
+                break
+            self._chunk_worker.discard(chunk)
+            if chunk in self._chunks or self._village_unbuilt(chunk):
+                continue
+            if payload.stamp != chunk_stamp(*self._chunk_inputs(chunk)):
+                # Something went up near it since it was asked for: ask again.
+                self._prefetch_key = None
+                continue
+            self._integrate_chunk(payload)
+            added = True
+        return added
 
     def prepare(self, player: Player):
         """Build the ground the player is about to open their eyes on, before they can move.
@@ -183,37 +342,64 @@ class WorldStreaming:
         self._sync_chunks(player)
         self._reveal_around(player)
 
-    def _reindex_scenery(self):
-        """Rebuild what the renderer and `World.blocked` read the wilderness through.
+    def _index_scenery(self, items):
+        """Add `items` to what the renderer and `World.blocked` read the wilderness through.
 
-        Done once per chunk sync, not once per chunk: a sync loads several at a time. The
-        drawing side is bucketed by chunk (and, on the ground, by kind, which is its draw
-        order) because a wood holds thousands of pieces and only the few chunks on screen
-        are worth walking every frame."""
-        self._ground_by_chunk = {}
-        self._props_by_chunk = {}
-        for item in self.scenery:
+        Kept up to date chunk by chunk as chunks come and go, never rebuilt: a wood holds
+        thousands of pieces, and re-bucketing every one of them to add a row of chunks made
+        a border crossing cost more the further the player could see. The drawing side is
+        bucketed by chunk (and, on the ground, by kind, which is its draw order) because
+        only the few chunks on screen are worth walking every frame."""
+        for item in items:
             chunk = self._chunk_of(item.x, item.y)
             if item.ground:
                 self._ground_by_chunk.setdefault(chunk, {}).setdefault(item.kind, []).append(item)
             else:
                 self._props_by_chunk.setdefault(chunk, []).append(item)
-        self._scenery_by_cell = blocking_index(self.scenery)
-        self._water_by_cell = water_index(self.scenery)
+        for index, built in ((self._scenery_by_cell, blocking_index(items)), (self._water_by_cell, water_index(items))):
+            for cell, found in built.items():
+                index.setdefault(cell, []).extend(found)
+
+    def _unindex_scenery(self, items):
+        """Take `items` out of the indexes again. Only the buckets they were put in are
+        touched, found the way `_index_scenery` found them."""
+        if not items:
+            return
+        leaving = {id(item) for item in items}
+
+        def prune(index: dict, key):
+            kept = [item for item in index[key] if id(item) not in leaving]
+            if kept:
+                index[key] = kept
+            else:
+                del index[key]
+
+        for chunk in {self._chunk_of(item.x, item.y) for item in items if not item.ground}:
+            if chunk in self._props_by_chunk:
+                prune(self._props_by_chunk, chunk)
+        for chunk, kind in {(self._chunk_of(item.x, item.y), item.kind) for item in items if item.ground}:
+            kinds = self._ground_by_chunk.get(chunk)
+            if kinds and kind in kinds:
+                prune(kinds, kind)
+                if not kinds:
+                    del self._ground_by_chunk[chunk]
+        for index, built in ((self._scenery_by_cell, blocking_index(items)), (self._water_by_cell, water_index(items))):
+            for cell in built:
+                if cell in index:
+                    prune(index, cell)
 
     def _generate_context(self):
-        system_prompt = (
-            "You create worlds for an RPG. "
-            "Each world must contain one original detail that can serve as a starting point for quests."
-        )
-        prompt = (
-            "In a single very short sentence, describe an RPG world starting with 'The game takes place...' "
-            "The sentence must contain one original detail that can serve as a starting point for adventures."
-        )
-        for chunk in generate_response_stream_queued(prompt, system_prompt, "Context generation"):
-            if chunk:
-                self.context_window.push_chunk(chunk)
-                self.context = chunk
+        # A world written while the model sat idle is shown whole rather than streamed.
+        context = take(WORLD_CONTEXTS, "")
+        if context is not None:
+            self.context_window.push_chunk(context)
+            self.context = context
+        else:
+            prompt, system_prompt = _context_prompt(None, "")
+            for chunk in generate_response_stream_queued(prompt, system_prompt, "Context generation"):
+                if chunk:
+                    self.context_window.push_chunk(chunk)
+                    self.context = chunk
         self.context_window.finish_streaming()
 
         self.persist_world()
@@ -221,7 +407,7 @@ class WorldStreaming:
         self._start_village_naming()
         self.start_shop_generation()
         for boss in self.bosses:
-            threading.Thread(target=self._generate_boss_identity, args=(boss, None), daemon=True).start()
+            self._request_boss_identity(boss)
         self._start_landmark_naming()
 
     def _start_village_naming(self):
@@ -233,16 +419,17 @@ class WorldStreaming:
             if village.name or village.chunk in self._naming_villages:
                 continue
             self._naming_villages.add(village.chunk)
-            threading.Thread(target=self._generate_village_name, args=(village,), daemon=True).start()
-
-    def _generate_village_name(self, village: Village):
-        system_prompt = "You name settlements for an RPG world. Reply with the name only, no quotes, no punctuation."
-        prompt = (
-            f"{self.context}\nGive a short name, 1 to 3 words, for a small {village.size} in the wilds of this world."
-        )
+            submit_pooled(
+                VILLAGE_NAMES,
+                village.size,
+                self.context,
+                callback=lambda future, village=village: self._name_village(village, future),
+                on_main=True,
+            )
+
+    def _name_village(self, village: Village, future):
         try:
-            name = generate_response_queued(prompt, system_prompt, "Village naming") or ""
-            name = name.strip().strip('"').strip(".")
+            name = (future.result() or "").strip().strip('"').strip(".")
             if name:
                 village.name = " ".join(name.split()[:3])
                 self.persist_world()
@@ -267,14 +454,19 @@ class WorldStreaming:
         if landmark is None or landmark.name or self._landmark_naming:
             return
         self._landmark_naming = True
-        threading.Thread(target=self._generate_landmark_name, args=(landmark,), daemon=True).start()
-
-    def _generate_landmark_name(self, landmark: Building):
         system_prompt = "You name landmarks for an RPG world. Reply with the name only, no quotes, no punctuation."
         prompt = f"{self.context}\nGive a short name, 2 to 4 words, for the ancient ruined landmark of this world."
+        submit_queued(
+            prompt,
+            system_prompt,
+            "Landmark naming",
+            callback=lambda future: self._name_landmark(landmark, future),
+            on_main=True,
+        )
+
+    def _name_landmark(self, landmark: Building, future):
         try:
-            name = generate_response_queued(prompt, system_prompt, "Landmark naming") or ""
-            name = name.strip().strip('"').strip(".")
+            name = (future.result() or "").strip().strip('"').strip(".")
             if name:
                 landmark.name = " ".join(name.split()[:5])
                 self.persist_world()
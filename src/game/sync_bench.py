@@ -0,0 +1,139 @@
+"""Time a chunk sync against the size of the loaded area.
+
+A sync is the frame the player crosses a chunk border: a row of chunks joins the world, the
+row behind is dropped, and the indexes the renderer and `World.blocked` read are brought up
+to date. Only the rows change, so the sync should cost the same however much is loaded
+around the player. This walks a scratch world east across `--crossings` borders at each
+keep radius asked for (loading one chunk less than it keeps, as the game does) and prints
+the median and worst sync, and the median spent keeping the scenery indexes up to date
+(`_index_scenery`, `_unindex_scenery`) within it, in all and per chunk loaded or dropped:
+
+    python -m game.sync_bench
+    python -m game.sync_bench --radii 3 5 8 --crossings 12
+
+The chunks entering are built on the chunk worker and waited for before each crossing, so
+what is timed is the sync and not the generation (`python -m game.chunk_bench` times that).
+The world is saved to a temporary directory, the chunk cache is off (the player's cached
+chunks are neither read nor pruned, and every chunk is built) and its LLM calls are
+scripted: the player's own save is never touched and no model is loaded.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import types
+
+import pygame
+
+import core.constants as c
+import game.chunk_cache as chunk_cache
+import llm.llm_request_queue as q
+from core import llm_log
+from core.save import SaveSystem
+from llm.backends import ScriptedBackend
+
+# How long to wait for the worker to build a row before timing the crossing anyway.
+BUILD_TIMEOUT_S = 60.0
+
+
+def _wait_built(world, chunks: list[tuple[int, int]]):
+    wanted = [chunk for chunk in chunks if chunk not in world._chunks and not world._village_unbuilt(chunk)]
+    world._chunk_worker.request([(chunk, *world._chunk_inputs(chunk)) for chunk in wanted])
+    deadline = time.monotonic() + BUILD_TIMEOUT_S
+    while time.monotonic() < deadline:
+        if set(wanted) <= {payload.chunk for payload in world._chunk_worker.built()}:
+            return
+        time.sleep(0.005)
+
+
+def run(screen, directory: str, keep_radius: int, crossings: int, origin: tuple[int, int]) -> dict:
+    """Walk a new world east across `crossings` borders, timing each sync."""
+    from game.world import World
+    from ui.menus.context_menu import ContextMenu
+
+    c.World.CHUNK_KEEP_RADIUS = keep_radius
+    c.World.CHUNK_LOAD_RADIUS = keep_radius - 1
+    save = SaveSystem(os.path.join(directory, f"save_{keep_radius}.json"))
+    world = World(save, ContextMenu(screen), lambda *a, **k: None)
+    size = c.World.CHUNK_SIZE
+    player = types.SimpleNamespace(x=(origin[0] + 0.5) * size, y=(origin[1] + 0.5) * size, size=30)
+    world.prepare(player)
+    load_r = c.World.CHUNK_LOAD_RADIUS
+    timings = []
+    indexing = [0.0]
+
+    def timed(method):
+        def run(items):
+            start = time.perf_counter()
+            method(items)
+            indexing[0] += time.perf_counter() - start
+
+        return run
+
+    world._index_scenery = timed(world._index_scenery)
+    world._unindex_scenery = timed(world._unindex_scenery)
+    index_timings = []
+    changed = []
+    try:
+        for _ in range(crossings):
+            cx, cy = world._current_chunk
+            _wait_built(world, [(cx + 1 + load_r, cy + dy) for dy in range(-load_r, load_r + 1)])
+            player.x += size
+            # A step of a whole chunk is not a velocity: nothing is prefetched past the row.
+            world._last_seen = None
+            indexing[0] = 0.0
+            before = set(world._chunks)
+            start = time.perf_counter()
+            world._sync_chunks(player)
+            timings.append(time.perf_counter() - start)
+            index_timings.append(indexing[0])
+            changed.append(len(before ^ set(world._chunks)))
+        return {
+            "chunks": len(world._chunks),
+            "scenery": len(world.scenery),
+            "median_ms": statistics.median(timings) * 1000,
+            "max_ms": max(timings) * 1000,
+            "index_ms": statistics.median(index_timings) * 1000,
+            "index_ms_per_chunk": sum(index_timings) * 1000 / max(1, sum(changed)),
+        }
+    finally:
+        world.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--radii", type=int, nargs="+", default=[3, 4, 5, 6, 8], help="keep radii to time")
+    parser.add_argument("--crossings", type=int, default=10, help="borders crossed at each radius")
+    parser.add_argument("--origin", type=int, nargs=2, default=[12, 12], metavar=("CX", "CY"), help="first chunk")
+    args = parser.parse_args(argv)
+
+    # No window and no sound: SDL reads these when it starts, not when pygame is imported.
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    pygame.init()
+    screen = pygame.display.set_mode((c.Screen.WIDTH, c.Screen.HEIGHT))
+    c.Fonts = c.Fonts.load()
+    with tempfile.TemporaryDirectory() as directory:
+        llm_log.LOG_PATH = os.path.join(directory, "llm_calls.jsonl")
+        c.World.CHUNK_CACHE_DIR = None
+        chunk_cache._cache = None
+        q.use_backend(ScriptedBackend(default="Name", token_latency=0.0))
+        print(
+            f"{'keep radius':<13}{'chunks':>8}{'scenery':>9}{'median ms':>11}{'max ms':>9}"
+            f"{'index ms':>10}{'per chunk':>11}"
+        )
+        for radius in args.radii:
+            result = run(screen, directory, radius, args.crossings, tuple(args.origin))
+            print(
+                f"{radius:<13}{result['chunks']:>8}{result['scenery']:>9}"
+                f"{result['median_ms']:>11.2f}{result['max_ms']:>9.2f}{result['index_ms']:>10.2f}"
+                f"{result['index_ms_per_chunk']:>11.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
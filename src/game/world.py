@@ -12,6 +12,8 @@ import core.constants as c
 from core.audio import play_sound
 from core.daynight import DayNightCycle
 from core.decals import get_decals
+from game.chunk_cache import get_chunk_cache
+from game.chunk_worker import ChunkPayload, ChunkWorker
 from game.combat import WorldCombat
 from game.entities.boss import Boss
 from game.entities.breakables import Breakable, generate_breakables
@@ -21,10 +23,8 @@ from game.entities.entities import advance_impulse
 from game.entities.items import AMMO_BUNDLE, Item
 from game.entities.monsters import Monster, pick_monster_kind
 from game.entities.npcs import NPC
-from game.entities.poi import PointOfInterest
 from game.entities.projectile import ARROW_COLOR, STONE_COLOR, Projectile
 from game.entities.scenery import Scenery
-from game.entities.traps import BearTrap
 from game.entities.village import Village, generate_starting_world, register_world_sites
 from game.events import EventSystem
 from game.loot import roll_shop_stock
@@ -32,8 +32,8 @@ from game.navigation import Point, WorldNavigation
 from game.places import WorldPlaces
 from game.projectiles import WorldProjectiles
 from game.streaming import WorldStreaming
-from llm.llm_request_queue import generate_response_queued
-from llm.merchant_system import generate_shop_inventories
+from llm.merchant_system import request_shop_inventories, shop_inventories_from
+from llm.pregen import ContentPool, register_pool, submit_pooled
 
 if TYPE_CHECKING:
     from core.save import SaveSystem
@@ -43,6 +43,22 @@ if TYPE_CHECKING:
     from ui.menus.context_menu import ContextMenu
 
 
+def _boss_name_prompt(context: str | None, flavor: str) -> tuple[str, str]:
+    system_prompt = (
+        "You name bosses for a dark fantasy RPG. Reply with only the name, optionally as "
+        "'Name, the Epithet'. No quotes, no other text."
+    )
+    return f"World: {context}\nName {flavor}. 2 to 5 words.", system_prompt
+
+
+# A name per boss kind kept ready (`llm.pregen`), so a quest's boss is named as it spawns.
+BOSS_NAMES = register_pool(
+    ContentPool(
+        "boss_names", "Boss naming", tuple(kind.flavor for kind in c.BOSS_KINDS), _boss_name_prompt, c.Pregen.BOSS_NAMES
+    )
+)
+
+
 class World(WorldCombat, WorldProjectiles, WorldStreaming, WorldPlaces, WorldNavigation):
     """The living world and everything standing in it.
 
@@ -91,19 +107,26 @@ class World(WorldCombat, WorldProjectiles, WorldStreaming, WorldPlaces, WorldNav
 
     def _init_state(self):
         """Every list, index and timer the world keeps, before anything is loaded or built."""
-        # Regenerated on the fly as the player explores; see _sync_chunks.
-        self.floor_details = []
-        # The wilderness: trees, rocks, grass, ponds and roads, streamed with the chunks
-        # and never saved. Indexed by `_reindex_scenery` into what is drawn under the
-        # entities, what is drawn with the props, and a fine grid of the solid ones for
-        # `blocked`.
-        self.scenery: list[Scenery] = []
+        # The chunks loaded around the player, each with its floor details, POIs, traps and
+        # wilderness (trees, rocks, grass, ponds and roads): regenerated on the fly as the
+        # player explores (see _sync_chunks), loaded and dropped whole, never saved.
+        # `floor_details`, `scenery`, `pois` and `traps` read across all of them. The
+        # scenery is indexed by `_index_scenery` into what is drawn under the entities, what
+        # is drawn with the props, and a fine grid of the solid ones for `blocked`.
+        self._chunks: dict[tuple[int, int], ChunkPayload] = {}
         self._ground_by_chunk: dict = {}
         self._props_by_chunk: dict = {}
         self._scenery_by_cell: dict = {}
         self._water_by_cell: dict = {}
-        self._loaded_chunks = set()
         self._current_chunk = None
+        # Builds chunks ahead of the player, off the main thread (game/chunk_worker.py), from
+        # where they are heading: their smoothed velocity, and their last sighting it comes
+        # from. `_prefetching` is what was last asked for, under `_prefetch_key`.
+        self._chunk_worker = ChunkWorker(cache=get_chunk_cache())
+        self._velocity = (0.0, 0.0)
+        self._last_seen = None
+        self._prefetch_key = None
+        self._prefetching: set = set()
 
         self.items: list[Item] = []
         self.npcs: list[NPC] = []
@@ -133,12 +156,9 @@ class World(WorldCombat, WorldProjectiles, WorldStreaming, WorldPlaces, WorldNav
         # settlement's NPCs carry affinity, quests and shop stock that a chunk seed can't
         # rebuild. `village_site` still decides where they go, so the map itself is endless.
         self.villages: list[Village] = []
-        # Only the POIs of the chunks currently loaded around the player; see _load_chunk.
-        self.pois: list[PointOfInterest] = []
-        # The hunters' bear traps of those same chunks, streamed and dropped with them. The
-        # one thing a player changes about a trap is springing it, so that is all that is
-        # saved (`trap_state`, by trap id), exactly like a POI.
-        self.traps: list[BearTrap] = []
+        # The POIs and the hunters' bear traps are only ever those of the loaded chunks
+        # (`pois`, `traps`). The one thing a player changes about a trap is springing it, so
+        # that is all that is saved (`trap_state`, by trap id), exactly like a POI.
         # The tunnel the player is standing in, or None on the surface. A tunnel is ordinary
         # world space a long way from anywhere (game/entities/tunnel.py); this is what tells
         # the world to stop streaming ground, stop spawning wildlife and stop drawing a sky
@@ -396,13 +416,16 @@ class World(WorldCombat, WorldProjectiles, WorldStreaming, WorldPlaces, WorldNav
         `closed` for the same reason, since a presage thread can outlive the session."""
         self.closed = True
         self.notify = None
+        # Before the next world registers its village sites: a chunk still being built
+        # against this one's would leave its roads in the terrain caches.
+        self._chunk_worker.close()
 
     def persist_world(self):
-        """Flush generated world state to disk. Called by the background generation threads
-        so finished work (context, shops, boss and landmark names) survives a restart
-        instead of being regenerated on the next continue.
+        """Flush generated world state to disk. Called as background generation lands so
+        finished work (context, shops, boss and landmark names) survives a restart instead
+        of being regenerated on the next continue.
 
-        Each call serialises the whole world, so a burst of threads finishing together (the
+        Each call serialises the whole world, so a burst of requests finishing together (the
         village names of a freshly found settlement, say) is throttled to one write: the work
         is already in memory, and `Game.save_data` writes it out on the next autosave anyway.
         """
@@ -575,6 +598,15 @@ class World(WorldCombat, WorldProjectiles, WorldStreaming, WorldPlaces, WorldNav
             for cy in range(int((y - radius) // size), int((y + radius) // size) + 1)
         ]
 
+    def chunk_contents_in_range(self, kind: str, x, y, radius):
+        """One kind of what the loaded chunks hold ("details", "pois", "traps"), from the
+        chunks covering the box of `radius` around (x, y) only. Each of them lies inside the
+        chunk that generated it, so nothing in range is missed."""
+        for chunk in self._chunk_window(x, y, radius):
+            payload = self._chunks.get(chunk)
+            if payload is not None:
+                yield from getattr(payload, kind)
+
     def scenery_ground_in_range(self, x, y, radius):
         """The ground itself around a point (patches, ponds, roads, grass), yielded kind by
         kind in draw order, so a road is never buried under the meadow it crosses."""
@@ -787,7 +819,7 @@ class World(WorldCombat, WorldProjectiles, WorldStreaming, WorldPlaces, WorldNav
         boss = Boss(x, y, template or random.choice(c.BOSS_KINDS), quest_tag=quest_tag)
         self.bosses.append(boss)
         if self.context:
-            threading.Thread(target=self._generate_boss_identity, args=(boss, announce), daemon=True).start()
+            self._request_boss_identity(boss, announce)
         return boss
 
     def boss_spawn_ok(self, x, y) -> bool:
@@ -836,14 +868,17 @@ class World(WorldCombat, WorldProjectiles, WorldStreaming, WorldPlaces, WorldNav
         tag = f"quest_boss_{random.randint(1000, 9999)}"
         return self.spawn_boss(x, y, quest_tag=tag)
 
-    def _generate_boss_identity(self, boss: Boss, announce: str | None = None):
-        system_prompt = (
-            "You name bosses for a dark fantasy RPG. Reply with only the name, optionally as "
-            "'Name, the Epithet'. No quotes, no other text."
+    def _request_boss_identity(self, boss: Boss, announce: str | None = None):
+        submit_pooled(
+            BOSS_NAMES,
+            boss.template.flavor,
+            self.context,
+            callback=lambda future: self._set_boss_identity(boss, announce, future),
+            on_main=True,
         )
-        prompt = f"World: {self.context}\nName {boss.template.flavor}. 2 to 5 words."
-        text = generate_response_queued(prompt, system_prompt, "Boss naming") or ""
-        boss.set_identity(text)
+
+    def _set_boss_identity(self, boss: Boss, announce: str | None, future):
+        boss.set_identity(future.result() or "")
         self.sync_quest_boss_names()
         self.persist_world()
         if announce and self.notify:
@@ -903,11 +938,15 @@ class World(WorldCombat, WorldProjectiles, WorldStreaming, WorldPlaces, WorldNav
         if not merchants or not self.context or self._shops_generating:
             return
         self._shops_generating = True
-        threading.Thread(target=self._generate_merchant_shops, args=(merchants,), daemon=True).start()
+        request_shop_inventories(
+            self.context,
+            len(merchants),
+            callback=lambda future: self._stock_merchant_shops(merchants, future),
+        )
 
-    def _generate_merchant_shops(self, merchants: list):
+    def _stock_merchant_shops(self, merchants: list, future):
         try:
-            stocks = generate_shop_inventories(self.context, len(merchants))
+            stocks = shop_inventories_from(future.result(), len(merchants))
             for merchant, stock in zip(merchants, stocks):
                 merchant.set_shop(stock + self._shop_staples())
         finally:
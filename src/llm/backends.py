@@ -0,0 +1,734 @@
+"""What the request queue runs its calls on: the real model, or a script standing in for it.
+
+The queue only ever talks to an `LLMBackend`, so everything that generates text (dialogue,
+quests, shops, names, the world's context) can be run and timed on a machine without the
+2.9 GB model. `LlamaCppBackend` is the game; `ScriptedBackend` replays canned or recorded
+replies at a chosen speed, deterministically, for benchmarks and tests.
+
+With `Hyperparameters.DRAFT_MODEL_PATH` set, `LlamaCppBackend` also loads a small model of
+the same family (`DraftModel`) and streams the calls that ask for it (`speculate`) by
+speculative decoding: the draft guesses the next few tokens greedily, the model evaluates
+them all in one decode, and every guess up to the first it would not have sampled itself is
+kept. Each token is still sampled from the model, so the reply is the one it would have
+written; a decode step of a 7B model on the CPU costs about the same for five tokens as for
+one, so each guess that holds is a step saved.
+
+Batch decoding, speculative streaming and state files drive llama.cpp below `Llama`'s public
+API (`llama_cpp._internals`, the context's KV cache, context parameters). pyproject pins the
+llama-cpp-python release they were written against; an install that lacks any of it is
+found when the model loads (`_missing_internals`), and those three then fall back instead
+of failing mid-call: calls are never batched, dialogue streams without the draft, and no
+warm state is written to or read from disk.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import json
+import random
+import re
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from typing import Any, Protocol
+
+import core.constants as c
+
+
+@dataclass
+class Completion:
+    text: str
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+
+
+class LLMBackend(Protocol):
+    """One loaded model. Called from the queue's worker thread only, one call at a time."""
+
+    model_path: str
+    # (tokens drafted, of them accepted) by the last `stream` run with `speculate`, kept up
+    # to date as it goes; (0, 0) when it had nothing drafting for it.
+    draft_counts: tuple[int, int]
+    # What a state file (`save_state_file`) depends on besides the model: one made under
+    # another format is never loaded.
+    state_format: str
+    # Whether `complete_batch` can be asked for at all: the queue never batches otherwise.
+    batches: bool
+
+    def complete(self, prompt: str, max_tokens: int, stop: list[str], grammar: str | None = None) -> Completion:
+        """`grammar`, GBNF text (see `llm.grammars`), restricts the reply to what it accepts.
+        A backend that cannot constrain sampling may ignore it: callers still parse."""
+        ...
+
+    def stream(
+        self, prompt: str, max_tokens: int, stop: list[str], grammar: str | None = None, speculate: bool = False
+    ) -> Iterator[str]:
+        """Yield the reply one token's text at a time. Closing the iterator early stops
+        generation where it is. `speculate` asks for draft-model decoding where the backend
+        has a draft model; the text is the same either way, only how fast it comes."""
+        ...
+
+    def complete_batch(
+        self, prompts: list[str], max_tokens: list[int], stop: list[str], keep_going: Callable[[int], bool]
+    ) -> list[Completion]:
+        """Several independent prompts decoded side by side, one result per prompt in order.
+        `keep_going(i)` is asked between decode steps: False drops sequence i there, and it
+        may raise to abandon the whole batch (the queue's preemption)."""
+        ...
+
+    def tokenize(self, text: str) -> list[int]: ...
+
+    def cached_prefix(self, prompt: str) -> int:
+        """How many of this prompt's leading tokens the model already holds evaluated, and
+        so would not evaluate again if it were run now."""
+        ...
+
+    def save_state(self) -> Any: ...
+
+    def load_state(self, state: Any) -> None: ...
+
+    def state_size(self, state: Any) -> int:
+        """Bytes a saved state holds, which is what `PromptStateCache` budgets by."""
+        ...
+
+    def prefill(self, prompt: str) -> int:
+        """Evaluate `prompt` into the model and stop there, without generating. Returns its
+        length in tokens."""
+        ...
+
+    def save_state_file(self, path: str) -> None:
+        """Write the tokens the model holds evaluated, and its cache of them, to `path`."""
+        ...
+
+    def load_state_file(self, path: str) -> int:
+        """Put the model back to a `save_state_file`. Returns the tokens it holds now, 0 if
+        the file could not be loaded (the model then holds nothing)."""
+        ...
+
+
+class LlamaCppBackend:
+    def __init__(
+        self,
+        model_path: str = c.Hyperparameters.MODEL_PATH,
+        draft_model_path: str | None = c.Hyperparameters.DRAFT_MODEL_PATH,
+    ):
+        # Imported here, not at the top: a stub run must not need llama_cpp installed.
+        import llama_cpp
+        from llama_cpp import Llama
+
+        self.model_path = model_path
+        # A state file is the context's KV cache as this llama.cpp lays it out, for a
+        # context of this size.
+        self.state_format = f"llama_cpp {llama_cpp.__version__}, n_ctx {c.Hyperparameters.CONTEXT_SIZE}"
+        # Built on the first batch: a second context over the same weights, sized for
+        # short background work, so a batch never evicts the dialogue's KV cache.
+        self._batch_ctx = None
+        # Compiled grammars by their text: the same few are sent over and over.
+        self._grammars = {}
+        self.llm = Llama(
+            model_path=model_path,
+            n_gpu_layers=c.Hyperparameters.GPU_LAYERS,
+            verbose=False,
+            n_ctx=c.Hyperparameters.CONTEXT_SIZE,
+            flash_attn=True,
+            use_mlock=True,
+            n_threads=8,
+            seed=int(time.time() * 1000) % (2**31),
+        )
+        self.draft_counts = (0, 0)
+        missing = _missing_internals(self.llm)
+        if missing is not None:
+            print(
+                f"llama_cpp {llama_cpp.__version__} has no {missing}: running without batches, "
+                "the draft model or warm state files"
+            )
+        self._internals = missing is None
+        self.batches = self._internals
+        self.draft = self._load_draft(draft_model_path) if draft_model_path and self._internals else None
+        # The model's rows of one verification step: the last token and the draft's guesses.
+        self._verify_batch = None
+
+    def _load_draft(self, path: str):
+        try:
+            draft = DraftModel(path)
+        except (OSError, ValueError) as e:
+            print(f"Draft model {path} could not be loaded, streaming without it: {e}")
+            return None
+        # Guesses are token ids: a draft that splits text differently only ever misses.
+        probe = b"Player: Hi!\nNPC: Well met, traveller. The road north is not safe."
+        if draft.llm.tokenize(probe, special=True) != self.llm.tokenize(probe, special=True):
+            print(f"Draft model {path} does not share the model's tokenizer, streaming without it")
+            return None
+        return draft
+
+    def _grammar(self, grammar):
+        if grammar is None:
+            return None
+        if grammar not in self._grammars:
+            from llama_cpp import LlamaGrammar
+
+            self._grammars[grammar] = LlamaGrammar.from_string(grammar, verbose=False)
+        return self._grammars[grammar]
+
+    def complete(self, prompt, max_tokens, stop, grammar=None):
+        # No llm.reset(): keeping the KV cache lets llama_cpp skip re-evaluating the
+        # shared prefix (system prompt + prior turns) on each call.
+        response = self.llm(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=c.Hyperparameters.TEMPERATURE,
+            repeat_penalty=c.Hyperparameters.REPETITION_PENALTY,
+            stop=stop,
+            grammar=self._grammar(grammar),
+        )
+        usage = response.get("usage", {})
+        return Completion(
+            text=response.get("choices", [{}])[0].get("text", ""),
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+        )
+
+    def stream(self, prompt, max_tokens, stop, grammar=None, speculate=False):
+        self.draft_counts = (0, 0)
+        # A grammar's state can't be rewound past a rejected guess: those stream as usual.
+        if speculate and self.draft is not None and grammar is None:
+            yield from self._speculative_stream(prompt, max_tokens, stop)
+            return
+        stream = self.llm(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=c.Hyperparameters.TEMPERATURE,
+            repeat_penalty=c.Hyperparameters.REPETITION_PENALTY,
+            stream=True,
+            stop=stop,
+            grammar=self._grammar(grammar),
+        )
+        try:
+            for output in stream:
+                yield output.get("choices", [{}])[0].get("text", "")
+        finally:
+            stream.close()
+
+    def _speculative_stream(self, prompt, max_tokens, stop):
+        from llama_cpp import Llama, _internals, llama_cpp
+
+        llm = self.llm
+        ctx = llm._ctx
+        vocab = llm._model.vocab
+        if self._verify_batch is None:
+            self._verify_batch = _internals.LlamaBatch(n_tokens=c.Hyperparameters.DRAFT_TOKENS + 1, embd=0, n_seq_max=1)
+        raw = self._verify_batch.batch
+        # The same chain as a batch decode, which accepts each token as it samples it: every
+        # token sampled here is one the reply keeps, guessed or not.
+        sampler = self._sampler(int(time.time() * 1000) % (2**31))
+
+        # As a completion would: keep what the model holds of the prompt, but evaluate at
+        # least its last token, whose logits give the reply's first.
+        tokens = llm.tokenize(prompt.encode("utf-8"), special=True)
+        llm.n_tokens = min(Llama.longest_token_prefix(llm.input_ids[: llm.n_tokens].tolist(), tokens), len(tokens) - 1)
+        llm.eval(tokens[llm.n_tokens :])
+
+        reply = bytearray()
+        sent = 0
+        generated = drafted = accepted = 0
+
+        def take(token):
+            """Add a sampled token to the reply: (text now safe to show, whether it ends it)."""
+            nonlocal sent, generated
+            if llama_cpp.llama_vocab_is_eog(vocab, token):
+                return reply.decode("utf-8", errors="ignore")[sent:], True
+            reply.extend(llm.detokenize([token]))
+            generated += 1
+            text = reply.decode("utf-8", errors="ignore")
+            cut = _stop_index(text, stop)
+            if cut is not None:
+                return text[sent:cut], True
+            done = generated >= max_tokens
+            # Text that may be the start of a stop string waits until it is known not to be.
+            ready = len(text) if done else len(text) - _held_back(text, stop)
+            chunk, sent = text[sent:ready], max(sent, ready)
+            return chunk, done
+
+        token = sampler.sample(ctx, -1)
+        while True:
+            chunk, done = take(token)
+            if chunk:
+                yield chunk
+            if done:
+                return
+            # `token` is sampled but not evaluated yet: it opens the rows of this step, and
+            # the draft guesses what comes after it.
+            n_past = llm.n_tokens
+            room = min(c.Hyperparameters.DRAFT_TOKENS, max_tokens - generated - 1, llm.n_ctx() - n_past - 1)
+            if room < 0:
+                return
+            guesses = self.draft.propose([*llm.input_ids[: llm.n_tokens].tolist(), token], room) if room else []
+            rows = [token, *guesses]
+            raw.n_tokens = len(rows)
+            for j, row_token in enumerate(rows):
+                raw.token[j] = row_token
+                raw.pos[j] = n_past + j
+                raw.seq_id[j][0] = 0
+                raw.n_seq_id[j] = 1
+                raw.logits[j] = True
+            ctx.decode(self._verify_batch)
+            llm.input_ids[n_past : n_past + len(rows)] = rows
+            drafted += len(guesses)
+            kept = 0
+            try:
+                # Row j's logits give the token after rows[j]: a guess holds while it is
+                # what the model samples there, and the first that doesn't is replaced by
+                # what it did sample. When all hold, the last row gives one more for free.
+                for j in range(len(rows)):
+                    token = sampler.sample(ctx, j)
+                    if j == len(guesses) or token != guesses[j]:
+                        break
+                    kept += 1
+                    accepted += 1
+                    chunk, done = take(token)
+                    if chunk:
+                        yield chunk
+                    if done:
+                        return
+            finally:
+                # Rows past the last guess that held are tokens the reply doesn't have.
+                llm.n_tokens = n_past + 1 + kept
+                ctx.kv_cache_seq_rm(-1, llm.n_tokens, -1)
+                self.draft_counts = (drafted, accepted)
+
+    def tokenize(self, text):
+        return self.llm.tokenize(text.encode("utf-8"), add_bos=False, special=True)
+
+    def cached_prefix(self, prompt):
+        from llama_cpp import Llama
+
+        # Tokenized the way a completion tokenizes it (BOS included), then compared with the
+        # tokens in the KV cache the same way llama_cpp's own prefix match does.
+        tokens = self.llm.tokenize(prompt.encode("utf-8"), special=True)
+        return Llama.longest_token_prefix(self.llm.input_ids[: self.llm.n_tokens].tolist(), tokens)
+
+    def _batch_context(self):
+        if self._batch_ctx is None:
+            from llama_cpp import _internals, llama_cpp
+
+            params = llama_cpp.llama_context_default_params()
+            main = self.llm.context_params
+            params.n_ctx = c.Hyperparameters.BATCH_CONTEXT_SIZE
+            params.n_batch = main.n_batch
+            params.n_ubatch = main.n_ubatch
+            params.n_threads = main.n_threads
+            params.n_threads_batch = main.n_threads_batch
+            params.flash_attn_type = main.flash_attn_type
+            params.n_seq_max = c.Hyperparameters.BATCH_SIZE
+            # One pool of cells for every sequence: the prompts differ in length, and a
+            # per-sequence split would cap each at BATCH_CONTEXT_SIZE / BATCH_SIZE.
+            params.kv_unified = True
+            self._batch_ctx = _internals.LlamaContext(model=self.llm._model, params=params, verbose=False)
+        return self._batch_ctx
+
+    def _sampler(self, seed: int):
+        from llama_cpp import _internals
+
+        # The same chain llama_cpp's own completion runs, with the game's settings.
+        sampler = _internals.LlamaSampler()
+        sampler.add_penalties(64, c.Hyperparameters.REPETITION_PENALTY, 0.0, 0.0)
+        sampler.add_top_k(40)
+        sampler.add_top_p(0.95, 1)
+        sampler.add_min_p(0.05, 1)
+        sampler.add_temp(c.Hyperparameters.TEMPERATURE)
+        sampler.add_dist(seed)
+        return sampler
+
+    def complete_batch(self, prompts, max_tokens, stop, keep_going):
+        if not self.batches:
+            raise RuntimeError("complete_batch called on a backend that does not batch")
+        prompt_tokens = [self.llm.tokenize(p.encode("utf-8"), special=True) for p in prompts]
+        # Sequences share the batch context's cells, so they go in groups that fit it.
+        results: list[Completion | None] = [None] * len(prompts)
+        group, used = [], 0
+        for i, tokens in enumerate(prompt_tokens):
+            need = len(tokens) + max_tokens[i]
+            if group and used + need > c.Hyperparameters.BATCH_CONTEXT_SIZE:
+                self._decode_group(group, prompt_tokens, max_tokens, stop, keep_going, results)
+                group, used = [], 0
+            group.append(i)
+            used += need
+        self._decode_group(group, prompt_tokens, max_tokens, stop, keep_going, results)
+        return results
+
+    def _decode_group(self, group, prompt_tokens, max_tokens, stop, keep_going, results):
+        from llama_cpp import _internals, llama_cpp
+
+        ctx = self._batch_context()
+        ctx.kv_cache_clear()
+        vocab = self.llm._model.vocab
+        n_batch = self.llm.n_batch
+        batch = _internals.LlamaBatch(n_tokens=max(n_batch, len(group)), embd=0, n_seq_max=1)
+        base_seed = int(time.time() * 1000) % (2**31)
+        samplers = {i: self._sampler(base_seed + seq) for seq, i in enumerate(group)}
+        seq_of = {i: seq for seq, i in enumerate(group)}
+        n_past = {i: len(prompt_tokens[i]) for i in group}
+        pieces: dict[int, bytearray] = {i: bytearray() for i in group}
+        generated = dict.fromkeys(group, 0)
+        pending: dict[int, int] = {}
+
+        def fill(rows):
+            raw = batch.batch
+            raw.n_tokens = len(rows)
+            for j, (token, pos, seq, logits) in enumerate(rows):
+                raw.token[j] = token
+                raw.pos[j] = pos
+                raw.seq_id[j][0] = seq
+                raw.n_seq_id[j] = 1
+                raw.logits[j] = logits
+
+        def take(i, row):
+            """Sample sequence i's next token off batch row `row`; False once it is done."""
+            token = samplers[i].sample(ctx, row)
+            if llama_cpp.llama_vocab_is_eog(vocab, token):
+                return False
+            pieces[i] += self.llm.detokenize([token])
+            generated[i] += 1
+            text = pieces[i].decode("utf-8", errors="ignore")
+            if any(s and s in text for s in stop) or generated[i] >= max_tokens[i]:
+                return False
+            pending[i] = token
+            return True
+
+        # Prompt evaluation, every sequence in one flat run of n_batch-sized chunks. Logits
+        # only exist for the last decode, so a sequence's first token is sampled in the
+        # chunk that holds the end of its prompt.
+        rows = [
+            (token, pos, seq_of[i], pos == len(prompt_tokens[i]) - 1, i)
+            for i in group
+            for pos, token in enumerate(prompt_tokens[i])
+        ]
+        for start in range(0, len(rows), n_batch):
+            chunk = rows[start : start + n_batch]
+            fill([row[:4] for row in chunk])
+            ctx.decode(batch)
+            for j, row in enumerate(chunk):
+                if row[3]:
+                    take(row[4], j)
+
+        # Then one token per live sequence per decode, which is where the batch pays off.
+        while pending:
+            live = [i for i in pending if keep_going(i)]
+            if not live:
+                break
+            fill([(pending[i], n_past[i], seq_of[i], True) for i in live])
+            ctx.decode(batch)
+            pending.clear()
+            for j, i in enumerate(live):
+                n_past[i] += 1
+                take(i, j)
+
+        for i in group:
+            text = pieces[i].decode("utf-8", errors="ignore")
+            for s in stop:
+                if s and s in text:
+                    text = text[: text.index(s)]
+            results[i] = Completion(text, len(prompt_tokens[i]), generated[i])
+
+    def save_state(self):
+        return self.llm.save_state()
+
+    def load_state(self, state):
+        self.llm.load_state(state)
+
+    def state_size(self, state):
+        return state.llama_state_size
+
+    def prefill(self, prompt):
+        from llama_cpp import Llama
+
+        # As a completion would: keep what the model holds of the prompt, evaluate the rest.
+        # `eval` drops whatever the cache held past that first.
+        tokens = self.llm.tokenize(prompt.encode("utf-8"), special=True)
+        self.llm.n_tokens = Llama.longest_token_prefix(self.llm.input_ids[: self.llm.n_tokens].tolist(), tokens)
+        self.llm.eval(tokens[self.llm.n_tokens :])
+        return len(tokens)
+
+    def save_state_file(self, path):
+        from llama_cpp import llama_cpp
+
+        if not self._internals:
+            raise OSError("this llama_cpp cannot write state files")
+
+        n_tokens = self.llm.n_tokens
+        tokens = (llama_cpp.llama_token * n_tokens)(*self.llm.input_ids[: self.llm.n_tokens].tolist())
+        if not llama_cpp.llama_state_save_file(self.llm._ctx.ctx, path.encode("utf-8"), tokens, n_tokens):
+            raise OSError(f"llama.cpp could not write {path}")
+
+    def load_state_file(self, path):
+        from llama_cpp import llama_cpp
+
+        if not self._internals:
+            return 0
+
+        capacity = self.llm.n_ctx()
+        tokens = (llama_cpp.llama_token * capacity)()
+        n_tokens = ctypes.c_size_t(0)
+        if not llama_cpp.llama_state_load_file(
+            self.llm._ctx.ctx, path.encode("utf-8"), tokens, capacity, ctypes.byref(n_tokens)
+        ):
+            # The cache may be half overwritten: holding nothing, the next call evaluates
+            # its whole prompt (`eval` clears the cache past `n_tokens`).
+            self.llm.n_tokens = 0
+            return 0
+        self.llm.input_ids[: n_tokens.value] = tokens[: n_tokens.value]
+        self.llm.n_tokens = n_tokens.value
+        return n_tokens.value
+
+
+# What the batch decode, the speculative stream and the state files reach for below the
+# public API, from the module (`_internals`, `llama_cpp`) or the loaded `Llama` (`llm`).
+_INTERNALS = (
+    "_internals.LlamaBatch",
+    "_internals.LlamaContext.decode",
+    "_internals.LlamaContext.kv_cache_clear",
+    "_internals.LlamaContext.kv_cache_seq_rm",
+    "_internals.LlamaSampler.sample",
+    "_internals.LlamaSampler.add_penalties",
+    "_internals.LlamaSampler.add_greedy",
+    "llama_cpp.llama_vocab_is_eog",
+    "llama_cpp.llama_state_save_file",
+    "llama_cpp.llama_state_load_file",
+    "llm._ctx.ctx",
+    "llm._model.vocab",
+    "llm.context_params.flash_attn_type",
+)
+# Context parameters `_batch_context` sets. A ctypes structure takes any attribute without
+# complaint, so these are looked for among its fields instead.
+_CONTEXT_FIELDS = ("n_seq_max", "flash_attn_type", "kv_unified")
+
+
+def _missing_internals(llm) -> str | None:
+    """The first of `_INTERNALS` or `_CONTEXT_FIELDS` this llama_cpp lacks, None if none."""
+    try:
+        from llama_cpp import _internals, llama_cpp
+    except ImportError:
+        return "llama_cpp._internals"
+    roots = {"_internals": _internals, "llama_cpp": llama_cpp, "llm": llm}
+    for path in _INTERNALS:
+        root, *names = path.split(".")
+        target = roots[root]
+        for name in names:
+            if not hasattr(target, name):
+                return path
+            target = getattr(target, name)
+    fields = {name for name, *_ in type(llama_cpp.llama_context_default_params())._fields_}
+    for field in _CONTEXT_FIELDS:
+        if field not in fields:
+            return f"llama_context_params.{field}"
+    return None
+
+
+class DraftModel:
+    """The small model that guesses ahead for `LlamaCppBackend._speculative_stream`. It keeps
+    its own KV cache, so each guess only evaluates what the reply added since the last."""
+
+    def __init__(self, model_path: str):
+        from llama_cpp import Llama, _internals
+
+        self.llm = Llama(
+            model_path=model_path,
+            n_gpu_layers=c.Hyperparameters.GPU_LAYERS,
+            verbose=False,
+            n_ctx=c.Hyperparameters.CONTEXT_SIZE,
+            flash_attn=True,
+            n_threads=8,
+        )
+        self._greedy = _internals.LlamaSampler()
+        self._greedy.add_greedy()
+
+    def propose(self, tokens: list[int], count: int) -> list[int]:
+        """Up to `count` tokens the draft expects after `tokens`, fewer if it ends the reply."""
+        from llama_cpp import Llama, llama_cpp
+
+        llm = self.llm
+        llm.n_tokens = min(Llama.longest_token_prefix(llm.input_ids[: llm.n_tokens].tolist(), tokens), len(tokens) - 1)
+        llm.eval(tokens[llm.n_tokens :])
+        guesses = []
+        while len(guesses) < count:
+            token = self._greedy.sample(llm._ctx, -1)
+            if llama_cpp.llama_vocab_is_eog(llm._model.vocab, token):
+                break
+            guesses.append(token)
+            if len(guesses) < count:
+                llm.eval([token])
+        return guesses
+
+
+def _stop_index(text: str, stop: list[str]) -> int | None:
+    """Where the first stop string in `text` starts, or None."""
+    found = [i for i in (text.find(s) for s in stop if s) if i >= 0]
+    return min(found) if found else None
+
+
+def _held_back(text: str, stop: list[str]) -> int:
+    """How many characters at the end of `text` could be the start of a stop string."""
+    held = 0
+    for s in stop:
+        for n in range(min(len(s) - 1, len(text)), held, -1):
+            if text.endswith(s[:n]):
+                held = n
+                break
+    return held
+
+
+# What the stub counts as a token: a word with the whitespace in front of it, or a single
+# punctuation mark. Close enough to a BPE split for latency figures to be in proportion.
+_STUB_TOKEN_RE = re.compile(r"\s*(?:\w+|[^\w\s])|\s+")
+
+
+class ScriptedBackend:
+    """A model that answers from a script, for running the game's LLM code without one.
+
+    `script` maps a formatted prompt to its reply; a callable gets the prompt and returns
+    the reply, so a test can answer by whatever it finds in it. Anything unscripted gets
+    `default`. Latencies are per token, prompt and reply separately, so a run against it
+    has the same shape in time as one against the model: long prompts are slow to start,
+    long replies slow to finish. A prompt that shares a prefix with the previous call is
+    charged only for the rest, as llama_cpp's own cache would.
+
+    With `draft_acceptance`, a `speculate` stream plays a draft model that gets each of its
+    `DRAFT_TOKENS` guesses right with that probability (stopping at the first miss): a
+    step costs one token's latency and yields the guesses that held plus one.
+    """
+
+    def __init__(
+        self,
+        script: dict[str, str] | Callable[[str], str | None] | None = None,
+        default: str = "...",
+        prompt_token_latency: float = 0.0,
+        token_latency: float = 0.0,
+        model_path: str = "scripted",
+        draft_acceptance: float | None = None,
+    ):
+        self.script = script or {}
+        self.default = default
+        self.prompt_token_latency = prompt_token_latency
+        self.token_latency = token_latency
+        self.model_path = model_path
+        self.state_format = "scripted"
+        self.batches = True
+        self.draft_acceptance = draft_acceptance
+        self.draft_counts = (0, 0)
+        # Seeded: the same run gets the same guesses right.
+        self._draft_rng = random.Random(0)
+        self._evaluated: list[int] = []
+
+    @classmethod
+    def from_log(cls, path: str, format_prompt: Callable[[str, str], str], **kwargs) -> ScriptedBackend:
+        """Replay what the model actually said, from a `llm_log` JSONL file. Prompts are
+        formatted the way the queue formats them so a replayed call finds its own reply."""
+        script = {}
+        with open(path) as f:
+            for line in f:
+                entry = json.loads(line)
+                if "prompt" not in entry or "response" not in entry:
+                    continue
+                script[format_prompt(entry["prompt"], entry["system_prompt"])] = entry["response"]
+        return cls(script, **kwargs)
+
+    def _reply(self, prompt: str) -> str:
+        reply = self.script(prompt) if callable(self.script) else self.script.get(prompt)
+        return self.default if reply is None else reply
+
+    def _shared(self, tokens: list[int]) -> int:
+        shared = 0
+        for old, new in zip(self._evaluated, tokens, strict=False):
+            if old != new:
+                break
+            shared += 1
+        return shared
+
+    def cached_prefix(self, prompt):
+        return self._shared(self.tokenize(prompt))
+
+    def _evaluate(self, prompt: str) -> int:
+        tokens = self.tokenize(prompt)
+        shared = self._shared(tokens)
+        time.sleep((len(tokens) - shared) * self.prompt_token_latency)
+        self._evaluated = tokens
+        return len(tokens)
+
+    def _pieces(self, prompt: str, max_tokens: int, stop: list[str]) -> list[str]:
+        reply = self._reply(prompt)
+        cut = min((i for i in (reply.find(s) for s in stop if s) if i >= 0), default=len(reply))
+        return _STUB_TOKEN_RE.findall(reply[:cut])[:max_tokens]
+
+    def complete(self, prompt, max_tokens, stop, grammar=None):
+        # Grammars are ignored: the script already says what comes back.
+        prompt_tokens = self._evaluate(prompt)
+        pieces = self._pieces(prompt, max_tokens, stop)
+        time.sleep(len(pieces) * self.token_latency)
+        return Completion("".join(pieces), prompt_tokens, len(pieces))
+
+    def stream(self, prompt, max_tokens, stop, grammar=None, speculate=False):
+        self._evaluate(prompt)
+        self.draft_counts = (0, 0)
+        pieces = self._pieces(prompt, max_tokens, stop)
+        if not speculate or self.draft_acceptance is None:
+            for piece in pieces:
+                time.sleep(self.token_latency)
+                yield piece
+            return
+        done = drafted = accepted = 0
+        while done < len(pieces):
+            guesses = min(c.Hyperparameters.DRAFT_TOKENS, len(pieces) - done - 1)
+            held = 0
+            while held < guesses and self._draft_rng.random() < self.draft_acceptance:
+                held += 1
+            drafted += guesses
+            accepted += held
+            self.draft_counts = (drafted, accepted)
+            time.sleep(self.token_latency)
+            yield from pieces[done : done + held + 1]
+            done += held + 1
+
+    def complete_batch(self, prompts, max_tokens, stop, keep_going):
+        # Prompts are charged in full (the batch has a context of its own), then decoding
+        # costs one step per token of the longest reply rather than of all of them.
+        time.sleep(sum(len(self.tokenize(p)) for p in prompts) * self.prompt_token_latency)
+        pieces = [self._pieces(p, n, stop) for p, n in zip(prompts, max_tokens, strict=True)]
+        taken = [0] * len(prompts)
+        for step in range(max((len(p) for p in pieces), default=0)):
+            live = [i for i, p in enumerate(pieces) if taken[i] == step and step < len(p) and keep_going(i)]
+            if not live:
+                break
+            time.sleep(self.token_latency)
+            for i in live:
+                taken[i] += 1
+        return [
+            Completion("".join(p[: taken[i]]), len(self.tokenize(prompts[i])), taken[i]) for i, p in enumerate(pieces)
+        ]
+
+    def tokenize(self, text):
+        # Stable across runs, unlike hash(): the stub is for reproducible numbers.
+        return [sum(map(ord, piece)) for piece in _STUB_TOKEN_RE.findall(text)]
+
+    def save_state(self):
+        return list(self._evaluated)
+
+    def load_state(self, state):
+        self._evaluated = list(state)
+
+    def state_size(self, state):
+        return len(state) * 8
+
+    def prefill(self, prompt):
+        return self._evaluate(prompt)
+
+    def save_state_file(self, path):
+        with open(path, "w") as f:
+            json.dump(self._evaluated, f)
+
+    def load_state_file(self, path):
+        try:
+            with open(path) as f:
+                self._evaluated = json.load(f)
+        except (OSError, ValueError):
+            self._evaluated = []
+        return len(self._evaluated)
@@ -5,7 +5,8 @@ import threading
 from typing import TYPE_CHECKING
 
 import core.constants as c
-from llm.llm_request_queue import generate_response_queued
+from llm.llm_request_queue import submit_queued
+from llm.name_generator import TOKENS_PER_ITEM, numbered_items
 
 if TYPE_CHECKING:
     from core.save import SaveSystem
@@ -16,8 +17,9 @@ class DeathTauntGenerator:
 
     Same shape as `NPCNameGenerator`, and for the same reason: the death screen is blocking
     and holds for a couple of seconds, so waiting on the model there would turn every death
-    into a stall. A small buffer is filled on a background thread and topped back up after
-    each death; an empty buffer falls back to `Death.FALLBACK_TAUNTS` rather than making the
+    into a stall. A small buffer is filled in the background,
+    `Death.TAUNT_BATCH` lines to a call, and topped back up once deaths have drawn it down
+    to `TAUNT_LOW_WATER`; an empty buffer falls back to `Death.FALLBACK_TAUNTS` rather than making the
     player wait. The taunts never name a killer, because they are written before anyone knows
     who it will be: the death screen puts that on its own line.
     """
@@ -39,45 +41,61 @@ class DeathTauntGenerator:
     def start_generation(self):
         """Keep the buffer topped up, one background call at a time."""
         with self.cond:
-            if self.closed or self.is_generating or len(self.ready_taunts) >= c.Death.TAUNT_BUFFER:
+            if self.closed or self.is_generating or len(self.ready_taunts) > c.Death.TAUNT_LOW_WATER:
                 return
             self.is_generating = True
 
-        threading.Thread(target=self._generate_background, daemon=True).start()
+        self.save_system.when_context(self._request_taunt)
 
-    def _generate_background(self):
-        context = self.save_system.await_context(lambda: self.closed)
-        if context is None:
+    def _request_taunt(self, context: str):
+        if self.closed:
             return
 
         with self.cond:
             already = list(self.ready_taunts)
         avoid = f" Do not write any of these: {' | '.join(already)}." if already else ""
+        count = c.Death.TAUNT_BATCH
         system_prompt = (
             f"You write the death screen of an RPG set in this world: {context}. "
-            "Reply with ONE short mocking line addressed to the adventurer who has just died, "
-            "at most twelve words, cruel and dry rather than cheerful. Never name who or what "
-            "killed them, and never use quotation marks. Single line, no explanation."
+            f"Reply with a numbered list of {count} different short mocking lines addressed to "
+            "the adventurer who has just died, one per line, each at most twelve words, cruel "
+            "and dry rather than cheerful. Never name who or what killed them, and never use "
+            "quotation marks. No explanation."
             f"{avoid}"
         )
 
-        taunt = generate_response_queued("Write one death screen taunt.", system_prompt, "Death taunt").strip()
-        taunt = taunt.strip('"').strip()
+        submit_queued(
+            f"Write {count} death screen taunts.",
+            system_prompt,
+            "Death taunt",
+            max_tokens=count * TOKENS_PER_ITEM,
+            raw=True,
+            callback=self._on_taunts,
+        )
+
+    def _on_taunts(self, future):
+        try:
+            taunts = numbered_items(future.result())
+        except Exception:
+            taunts = []
         with self.cond:
-            if taunt:
-                self.ready_taunts.append(taunt)
+            added = 0
+            for taunt in taunts:
+                if taunt not in self.ready_taunts:
+                    self.ready_taunts.append(taunt)
+                    added += 1
             self.is_generating = False
         self.persist()
-        if not taunt:
-            # A reply that came back with nothing in it (the stream cut at a leading line
-            # break, the model answered with punctuation) used to re-arm immediately and
+        if not added:
+            # A reply with nothing usable in it (the model answered with punctuation, or
+            # only repeated what the buffer already holds) used to re-arm immediately and
             # never fill the buffer, so one bad generation turned into a call every few
             # seconds for the rest of the session, in front of everything the player was
             # actually waiting on. The canned lines are there for exactly this: leave the
             # buffer as it is and let the next death ask again.
             return
-        # One call per thread, so a buffer that wants three lines queues them one behind the
-        # other instead of firing three LLM calls at once in front of the player's dialogue.
+        # Still at the low-water mark after a thin batch: one more call, queued behind the
+        # player's dialogue like any other background work.
         self.start_generation()
 
     def take(self) -> str:
@@ -14,8 +14,9 @@ from core.utils import ConversationHistory
 from game.entities.item_icons import draw_shape_with_border
 from game.entities.items import potion_description
 from game.quest import COUNTED_QUEST_TYPES
-from llm.llm_request_queue import generate_response_stream_queued
+from llm.llm_request_queue import SPECULATIVE_GREETING, LLMStream, generate_response_stream_queued, llm_idle
 from llm.quest_system import QuestSystem, coin_band
+from llm.transcript import compact
 from ui import widgets
 from ui.conversation_ui import ConversationUI
 from ui.quest_tracker import QuestTracker
@@ -47,6 +48,9 @@ SENTENCE_END_RE = re.compile(r"[.!?…]['\"]?(?=\s|$)")
 # nothing. The stream itself drops everything past the first line break instead.
 DIALOGUE_STOPS = ["Player:", "player:"]
 
+# What the player "says" to open a conversation; the NPC's greeting is the reply to it.
+GREETING_PROMPT = "Player: Hi!\nNPC:"
+
 # A bracketed fill-in the model left in a reply ("[amount] coins", "{item}"). Never
 # something an NPC says out loud, so it is cut from what reaches the screen.
 PLACEHOLDER_RE = re.compile(r"\s*[\[{][^\]}]{0,60}[\]}]")
@@ -94,6 +98,16 @@ FETCH_LINES = (
 )
 
 
+def _dialogue_preamble(context: str) -> str:
+    """How every conversation's system prompt opens, identical for every NPC in a world."""
+    return (
+        f"You are a character in an RPG with this context: {context}. The player comes to talk to you. "
+        "Reply naturally to messages, staying within the context of the conversation, in one short sentence. "
+        "Usually just reply normally. Only if the player says goodbye, or you have clearly finished "
+        f"your business with them, add {END_MARKER} after your reply. "
+    )
+
+
 def _ware_effect(item) -> str:
     """How a shop item is described to the merchant's LLM prompt: what it actually does."""
     if item.item_type == "potion":
@@ -145,7 +159,14 @@ class DialogueManager:
         self.conversation_ended = False
         self._is_first_message = False
 
-        self.generator = None
+        self.generator: LLMStream | None = None
+        # A greeting being written ahead of the player pressing talk, see speculate_greeting:
+        # {"npc", "system_prompt", "stream"}.
+        self._speculation: dict | None = None
+        # The last `_opening` built, against the state it was built from (`_opening_key`):
+        # (npc, key, opening). Asked for every frame the player stands by someone, and the
+        # state it reads changes far less often than that.
+        self._opening_cache: tuple | None = None
 
         self.pending_quest_analysis = False
         self.pending_quest_completion = None
@@ -159,18 +180,16 @@ class DialogueManager:
         self._npc_name_generator: NPCNameGenerator | None = None
 
     def _build_system_prompt(self, npc: NPC, context: str, quest_complete: bool, delivered: str = "") -> str:
-        persuasion_hint = self.quest_system.player.stats.persuasion_descriptor()
-        affinity_hint = npc.affinity_descriptor()
+        # Ordered from most shared to least: the preamble every conversation has word for
+        # word, then what the player is like (the same whoever they talk to), then what is
+        # the same for every NPC of a kind, and only then this NPC. llama_cpp reuses the KV
+        # cache up to the first token that differs from the call before, so talking to a
+        # second villager evaluates from their name on rather than from the first word.
+        system_prompt = _dialogue_preamble(context) + self.quest_system.player.stats.persuasion_descriptor()
 
         if npc.is_merchant:
-            system_prompt = (
-                (
-                    f"You are {npc.name}, a merchant in an RPG with this context: {context}. "
-                    "The player comes to talk to you. "
-                )
-                + persuasion_hint
-                + affinity_hint
-            )
+            system_prompt += "You are a merchant: you can mention your wares but keep it brief. "
+            system_prompt += f"Your name is {npc.name}. " + npc.affinity_descriptor()
             if npc.shop_ready and npc.shop_items:
                 wares = ", ".join(
                     f"{item.name} ({item.rarity} {item.item_type}, {_ware_effect(item)})"
@@ -180,28 +199,9 @@ class DialogueManager:
                 system_prompt += f"You sell: {wares}. "
             else:
                 system_prompt += "You are a trader who buys and sells adventuring gear. "
-            system_prompt += (
-                "Reply naturally to messages in one short sentence. You can mention your wares but keep it brief. "
-                "Usually just reply normally. Only if the player says goodbye, or you have clearly finished "
-                f"your business with them, add {END_MARKER} after your reply."
-            )
-            return system_prompt
-
-        system_prompt = (
-            (f"You are {npc.name}, an NPC in an RPG with this context: {context}. The player comes to talk to you. ")
-            + persuasion_hint
-            + affinity_hint
-        )
+            return system_prompt.rstrip()
 
-        if delivered:
-            system_prompt += (
-                f"The player has just handed you {delivered}, sent to you by someone else. "
-                "Take it and thank them; you owe them nothing, the sender pays them. "
-            )
-
-        if npc.has_active_quest:
-            system_prompt += self._quest_lines(npc.quest, quest_complete)
-        else:
+        if not npc.has_active_quest:
             system_prompt += (
                 "You may have needs or problems. "
                 "The player can help you by fetching a specific item, dealing with dangerous creatures, "
@@ -213,13 +213,18 @@ class DialogueManager:
                 "You may also simply want to chat. "
             )
 
-        system_prompt += (
-            "Reply naturally to messages, staying within the context of the conversation, in one short sentence. "
-            "Usually just reply normally. Only if the player says goodbye, or you have clearly finished "
-            f"your business with them, add {END_MARKER} after your reply."
-        )
+        system_prompt += f"Your name is {npc.name}. " + npc.affinity_descriptor()
 
-        return system_prompt
+        if delivered:
+            system_prompt += (
+                f"The player has just handed you {delivered}, sent to you by someone else. "
+                "Take it and thank them; you owe them nothing, the sender pays them. "
+            )
+
+        if npc.has_active_quest:
+            system_prompt += self._quest_lines(npc.quest, quest_complete)
+
+        return system_prompt.rstrip()
 
     def _quest_lines(self, quest, quest_complete: bool) -> str:
         """What to tell an NPC about the quest they gave: that the player has just finished
@@ -264,14 +269,34 @@ class DialogueManager:
         promise = f"You promised them your {quest.reward_item_name} as a reward. " if quest.reward_item_name else ""
         return asked_line.format(**fields) + promise + pending_line.format(**fields)
 
-    def interact_with_npc(self, npc: NPC, npc_name_generator: NPCNameGenerator, world: World):
-        npc.assign_name(npc_name_generator)
-        self._npc_name_generator = npc_name_generator
-
-        # Walking up to the person a parcel is addressed to is the delivery: it happens as
-        # the conversation opens, so they can react to it in their first line.
-        delivered_quest = self.quest_system.on_delivery(npc)
+    def _opening_key(self, npc: NPC, context: str) -> tuple:
+        """Everything `_opening` reads that can change, as plain values: what the player is
+        carrying and working on, how persuasive they are, and how the NPC feels, trades and
+        what they asked for. Equal keys give equal openings."""
+        player = self.quest_system.player
+        quest = npc.quest if npc.has_active_quest else None
+        return (
+            context,
+            npc.name,
+            npc.affinity_descriptor(),
+            player.stats.level["persuasion"],
+            tuple(map(id, player.inventory)),
+            tuple((id(q), q.kills_done) for q in self.quest_system.active_quests),
+            npc.is_merchant and npc.shop_ready,
+            tuple(npc.shop_prices.items()) if npc.is_merchant else (),
+            quest,
+            quest.kills_done if quest is not None else None,
+        )
 
+    def _opening(self, npc: NPC, context: str) -> tuple[str, bool]:
+        """The system prompt a conversation opened with `npc` now would start from, and
+        whether it hands their quest in. Changes nothing: the delivery it mentions is only
+        made by `interact_with_npc`. Built again only when `_opening_key` changes."""
+        key = self._opening_key(npc, context)
+        cached = self._opening_cache
+        if cached is not None and cached[0] is npc and cached[1] == key:
+            return cached[2]
+        delivered_quest = self.quest_system.pending_delivery(npc)
         quest_complete = False
         if npc.has_active_quest:
             quest = npc.quest
@@ -279,13 +304,79 @@ class DialogueManager:
                 quest_complete = quest.kills_done >= quest.kill_count
             else:
                 quest_complete = self.quest_system.carried_item(quest) is not None
+        system_prompt = self._build_system_prompt(
+            npc, context, quest_complete, delivered=delivered_quest.item_name if delivered_quest else ""
+        )
+        self._opening_cache = (npc, key, (system_prompt, quest_complete))
+        return system_prompt, quest_complete
+
+    def speculate_greeting(self, npc: NPC | None, npc_name_generator: NPCNameGenerator, world: World):
+        """Write `npc`'s first line while the player walks up to them, so that pressing talk
+        shows it at once instead of a spinner for the whole prompt evaluation and reply.
+
+        Called every frame with whoever the talk key would open a conversation with, None
+        for nobody. A speculation is only started while the model has nothing else to do,
+        and at background priority, so anything real preempts it. It is kept against the
+        NPC and the system prompt it was written from, which is where their affinity, their
+        quest and any parcel the player carries for them all show: walking away, or any of
+        those changing, throws it away. Someone still nameless is named here only from a
+        name already buffered; the frame never waits for one."""
+        if self.active:
+            return
+        if npc is not None:
+            npc.assign_name(npc_name_generator, wait=False)
+        if npc is None or npc.name is None:
+            self._drop_speculation()
+            return
+        system_prompt, _ = self._opening(npc, world.context)
+        spec = self._speculation
+        if spec is not None and spec["npc"] is npc and spec["system_prompt"] == system_prompt:
+            return
+        self._drop_speculation()
+        if not llm_idle():
+            return
+        self._speculation = {
+            "npc": npc,
+            "system_prompt": system_prompt,
+            "stream": generate_response_stream_queued(
+                GREETING_PROMPT,
+                system_prompt,
+                SPECULATIVE_GREETING,
+                max_tokens=c.Hyperparameters.DIALOGUE_MAX_TOKENS,
+                stop=DIALOGUE_STOPS,
+                poll=True,
+            ),
+        }
+
+    def _drop_speculation(self):
+        if self._speculation is not None:
+            self._speculation["stream"].cancel()
+            self._speculation = None
+
+    def _take_speculation(self, npc: NPC, system_prompt: str) -> LLMStream | None:
+        """The greeting already written (or being written) for exactly this opening, if any.
+        Someone is waiting on it now: it is promoted to a first message, so one still queued
+        is served before the background work it was behind."""
+        spec, self._speculation = self._speculation, None
+        if spec is None:
+            return None
+        if spec["npc"] is npc and spec["system_prompt"] == system_prompt:
+            spec["stream"].handle.promote("First message")
+            return spec["stream"]
+        spec["stream"].cancel()
+        return None
+
+    def interact_with_npc(self, npc: NPC, npc_name_generator: NPCNameGenerator, world: World):
+        npc.assign_name(npc_name_generator)
+        self._npc_name_generator = npc_name_generator
+
+        self.system_prompt, quest_complete = self._opening(npc, world.context)
+        # Walking up to the person a parcel is addressed to is the delivery: it happens as
+        # the conversation opens, so they can react to it in their first line.
+        self.quest_system.on_delivery(npc)
         if quest_complete:
             self.pending_quest_completion = npc
 
-        self.system_prompt = self._build_system_prompt(
-            npc, world.context, quest_complete, delivered=delivered_quest.item_name if delivered_quest else ""
-        )
-
         self.current_npc = npc
         self.active = True
         self._opened_at_ms = pygame.time.get_ticks()
@@ -297,9 +388,10 @@ class DialogueManager:
         self.ui.reset()
         self.pending_quest_analysis = False
 
-        initial_prompt = "Player: Hi!\nNPC:"
-        self.generator = generate_response_stream_queued(
-            initial_prompt,
+        # A greeting speculated for this very opening is picked up where it is: finished, it
+        # shows on the first frame; still running, it streams in as a normal one would.
+        self.generator = self._take_speculation(npc, self.system_prompt) or generate_response_stream_queued(
+            GREETING_PROMPT,
             self.system_prompt,
             "First message",
             max_tokens=c.Hyperparameters.DIALOGUE_MAX_TOKENS,
@@ -372,59 +464,77 @@ class DialogueManager:
         self.ui.scroll(direction, self.conversation, self.current_npc.name)
 
     def update(self):
-        if self.active and self.generator is not None:
-            try:
-                partial = next(self.generator)
-                # Nothing generated yet this frame: the stream is polled, not waited on, so
-                # the game keeps running and the spinner keeps saying the NPC is thinking.
-                if partial is None:
-                    return
-                match = END_RE.search(partial)
-                if match:
-                    stripped = partial[: match.start()].rstrip()
-                    # The model sometimes tags [END] on the opening greeting, or right
-                    # after asking the player a question, both premature. Drop the tag
-                    # but keep the conversation open in those cases.
-                    if not self._is_first_message and not stripped.endswith("?"):
-                        self.conversation_ended = True
-                    partial = stripped
-                else:
-                    partial = _trim_partial_marker(partial)
-                self.conversation.update_last_assistant_message(_strip_placeholders(partial))
-                self.ui.auto_scroll(self.conversation, self.current_npc.name)
-                self.waiting_for_llm = False
-            except StopIteration:
-                self.generator = None
-                was_first_message = self._is_first_message
-                self._is_first_message = False
-
-                content = self.conversation.get_last_message()["content"]
-
-                # The model sometimes prefixes its reply with a speaker label; drop it
-                if ":" in content:
-                    cleaned_content = content.split(":", 1)[-1].strip()
-                    if len(cleaned_content) <= 25:
-                        content = cleaned_content
-
-                # Second pass on the finished text: catches an end marker that only
-                # became recognisable once the reply was complete, and trims a reply the
-                # token cap cut off mid-sentence.
-                match = END_RE.search(content)
-                if match:
-                    content = content[: match.start()].rstrip()
-                    if not was_first_message and not content.endswith("?"):
-                        self.conversation_ended = True
-                content = _trim_to_sentence(_strip_placeholders(content))
-
-                self.conversation.update_last_assistant_message(content)
-                self.ui.auto_scroll(self.conversation, self.current_npc.name)
+        if not self.active or self.generator is None:
+            return
+        # Everything that arrived since the last frame, newest kept: each chunk is the whole
+        # reply so far. A greeting written ahead of time arrives all at once, and is shown
+        # whole on the first frame rather than replayed a token a frame.
+        latest = None
+        try:
+            # None is "nothing generated yet": the stream is polled, not waited on, so the
+            # game keeps running and the spinner keeps saying the NPC is thinking.
+            while (partial := next(self.generator)) is not None:
+                latest = partial
+        except StopIteration:
+            if latest is not None:
+                self._show_partial(latest)
+            self._finish_reply()
+            return
+        if latest is not None:
+            self._show_partial(latest)
+
+    def _show_partial(self, partial: str):
+        match = END_RE.search(partial)
+        if match:
+            stripped = partial[: match.start()].rstrip()
+            # The model sometimes tags [END] on the opening greeting, or right
+            # after asking the player a question, both premature. Drop the tag
+            # but keep the conversation open in those cases.
+            if not self._is_first_message and not stripped.endswith("?"):
+                self.conversation_ended = True
+            partial = stripped
+        else:
+            partial = _trim_partial_marker(partial)
+        self.conversation.update_last_assistant_message(_strip_placeholders(partial))
+        self.ui.auto_scroll(self.conversation, self.current_npc.name)
+        self.waiting_for_llm = False
+
+    def _finish_reply(self):
+        self.generator = None
+        was_first_message = self._is_first_message
+        self._is_first_message = False
+
+        content = self.conversation.get_last_message()["content"]
+
+        # The model sometimes prefixes its reply with a speaker label; drop it
+        if ":" in content:
+            cleaned_content = content.split(":", 1)[-1].strip()
+            if len(cleaned_content) <= 25:
+                content = cleaned_content
+
+        # Second pass on the finished text: catches an end marker that only
+        # became recognisable once the reply was complete, and trims a reply the
+        # token cap cut off mid-sentence.
+        match = END_RE.search(content)
+        if match:
+            content = content[: match.start()].rstrip()
+            if not was_first_message and not content.endswith("?"):
+                self.conversation_ended = True
+        content = _trim_to_sentence(_strip_placeholders(content))
+
+        self.conversation.update_last_assistant_message(content)
+        self.ui.auto_scroll(self.conversation, self.current_npc.name)
 
     def close(self):
         if not self.active:
             return
 
-        # Escape can be pressed mid-stream; abandon the in-flight generator rather than
-        # waiting for it, so closing the dialogue is never blocked on the LLM.
+        # Escape can be pressed mid-stream; cancel the in-flight reply rather than waiting
+        # for it, so closing the dialogue is never blocked on the LLM. The worker stops at
+        # its next token, and a greeting that never started is dropped from the queue, so
+        # the next NPC is not kept waiting behind words nobody will read.
+        if self.generator is not None:
+            self.generator.cancel()
         self.generator = None
 
         log_path = dialogue_log.write_conversation(self.current_npc, self.system_prompt, self.conversation)
@@ -448,7 +558,7 @@ class DialogueManager:
 
     def _execute_pending_actions(self, log_path):
         # Snapshot the conversation now: close() clears it right after this returns,
-        # so the background threads must not read it directly.
+        # so the background work must not read it directly.
         npc = self.current_npc
         conversation_text = self.conversation.format_for_prompt()
         last_msg = self.conversation.get_last_message()
@@ -464,9 +574,10 @@ class DialogueManager:
 
         # Quest analysis second (only for new quests)
         if self.pending_quest_analysis:
-            threading.Thread(
-                target=self._execute_quest_analysis, args=(npc, conversation_text, log_path), daemon=True
-            ).start()
+            if conversation_text:
+                self.quest_system.analyze_conversation_for_quest(
+                    conversation_text, lambda quest_info: self._on_quest_analysis(npc, quest_info, log_path)
+                )
             self.pending_quest_analysis = False
 
     def draw(self):
@@ -514,6 +625,9 @@ class DialogueManager:
         self.conversation.add_user_message(message)
         self._is_first_message = False
 
+        # A long conversation's oldest turns are folded into a summary here, so the turn's
+        # prompt (and the quest analysis at the end) stays the same size however long it runs.
+        compact(self.conversation)
         conversation_text = self.conversation.format_for_prompt()
 
         self.generator = generate_response_stream_queued(
@@ -525,16 +639,16 @@ class DialogueManager:
             poll=True,
         )
 
-    def _execute_quest_analysis(self, npc: NPC, conversation_text: str, log_path):
-        if conversation_text:
-            quest_info = self.quest_system.analyze_conversation_for_quest(conversation_text)
-            dialogue_log.append_section(log_path, "Quest analysis", json.dumps(quest_info, ensure_ascii=False))
-            if quest_info["has_quest"]:
-                self.quest_system.create_quest_from_analysis(npc, quest_info, self._npc_name_generator)
-                quest = npc.quest
-                if quest:
-                    self.quest_tracker.notify_new_quest(quest)
-                    play_sound("quest_new")
+    def _on_quest_analysis(self, npc: NPC, quest_info: dict, log_path):
+        # On the main thread (the analysis callback is drained there): the quest it creates
+        # spawns items, thieves and bosses into lists the frame is iterating.
+        dialogue_log.append_section(log_path, "Quest analysis", json.dumps(quest_info, ensure_ascii=False))
+        if quest_info["has_quest"]:
+            self.quest_system.create_quest_from_analysis(npc, quest_info, self._npc_name_generator)
+            quest = npc.quest
+            if quest:
+                self.quest_tracker.notify_new_quest(quest)
+                play_sound("quest_new")
 
     def _execute_quest_completion(self, npc: NPC, last_msg, log_path):
         if last_msg and npc.quest:
@@ -0,0 +1,62 @@
+"""GBNF grammars for the calls whose reply is a structure rather than prose.
+
+Passed with a request (`submit_queued(..., grammar=...)`), a grammar restricts sampling to
+tokens that keep the reply inside it: the model cannot write a key the parser doesn't know,
+a quest type the game can't build, or a stray line of commentary, and generation ends the
+moment the structure closes instead of running on to `max_tokens`. The parsers in
+`core.utils` still read the result, and still repair it: a backend that ignores grammars
+(`ScriptedBackend`, replaying logged replies) must keep working.
+
+Free text inside a structure is bounded as well as filtered, so a rambling description
+cannot eat the whole token budget of a call.
+"""
+
+import core.constants as c
+
+# What a free-text field may hold: one line, no quotes or backslashes to escape.
+_JSON_TEXT = r'"\"" [^"\\\n]{0,120} "\""'
+_LINE_FIELD = r"[^|\n]{1,40}"
+
+
+def _alternatives(words) -> str:
+    return " | ".join(f'"{word}"' for word in words)
+
+
+def quest_analysis(quest_types) -> str:
+    """The quest analyzer's JSON object: every key, in the order the prompt gives them, with
+    `quest_type` limited to the types the game can build (or empty) and `kill_count` to a
+    number. The booleans are real JSON booleans, never the strings `_as_bool` has to read."""
+    # Parenthesised so the rule may span lines: GBNF only allows a newline inside a group.
+    return rf"""
+root ::= ("{{" ws "\"has_quest\": " bool "," ws "\"player_accepted\": " bool "," ws
+    "\"quest_type\": \"" type? "\"," ws
+    "\"quest_description\": " text "," ws
+    "\"item_name\": " text "," ws
+    "\"monster_hint\": " text "," ws
+    "\"kill_count\": \"" [0-9]{{0,3}} "\"," ws
+    "\"reward_item\": " text ws "}}")
+bool ::= "true" | "false"
+type ::= {_alternatives(quest_types)}
+text ::= {_JSON_TEXT}
+ws ::= [ ]?
+"""
+
+
+def yes_no() -> str:
+    """A one-word answer, for a question whose only use is to decide whether to ask a longer one."""
+    return 'root ::= "yes" | "no"'
+
+
+def shop_stock(shop_count: int, items_per_shop: int, item_types, prices: tuple[int, int]) -> str:
+    """`shop|name|type|rarity|price` lines: exactly `items_per_shop` for each shop, shops in
+    order, so the reply always stocks every shop and stops after the last line. The price
+    is a whole number within `prices` (inclusive), listed out since the range is short."""
+    shops = " ".join(f"shop{i}" for i in range(1, shop_count + 1))
+    rules = "\n".join(f'shop{i} ::= ("{i}|" item "\\n"){{{items_per_shop}}}' for i in range(1, shop_count + 1))
+    rarities = _alternatives(tier.name for tier in c.Rarity.TIERS)
+    price = _alternatives(range(prices[0], prices[1] + 1))
+    return rf"""
+root ::= {shops}
+{rules}
+item ::= {_LINE_FIELD} "|" ({_alternatives(item_types)}) "|" ({rarities}) "|" ({price})
+"""
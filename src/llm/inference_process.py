@@ -0,0 +1,548 @@
+"""The model in a process of its own, and the game's side of talking to it.
+
+On a thread of the game process, everything the model does that is Python (sampling's
+bookkeeping, the per-token loop of a stream, the glyph filter, encoding each call's log
+line) takes the GIL from `Game.run` a few hundred times a reply, and the frame time shows
+it whenever an NPC talks. Here the model, the request queue and all of that live in a
+spawned process; the game holds an `InferenceClient`, which has the queue's API and does
+nothing but pass messages over a pipe.
+
+The process runs an ordinary `LLMRequestQueue` behind a `QueueServer` (priorities,
+preemption, batching, the state cache, logging: none of it knows it is in a subprocess);
+the LLM service (`llm.service`) is the same server with several connections. The client mirrors just enough of
+its state to answer the questions the game asks every frame without a round trip: which
+tasks are in flight, and whether dialogue would have to wait. Futures and streams are the
+same classes the in-process queue returns, settled by a reader thread as replies arrive.
+
+If the process dies (a crash in llama.cpp, the OOM killer) every request in flight ends
+with an "LLM error" rather than taking the game with it, and a new process is started in
+the background; requests made meanwhile wait in the outgoing queue for it. A model that
+fails to load at all is not retried: the error is raised from `start()`.
+
+The process writes no log of its own: its records (`core.llm_log`) come back over the pipe
+and the game's log writer writes them, so one process appends to and rotates
+logs/llm_calls.jsonl, never two renaming it under each other.
+
+Messages, all tuples, client to process: ("submit", id, kwargs), ("stream", id, kwargs),
+("warmup", id, prefixes), ("cancel", id), ("promote", id, category), ("tokenize", id, text),
+("metrics", id), ("close", id).
+Process to client: ("ready",), ("failed", error), ("state", id, state, preemptions, decision),
+("result", id, text or warm-up counts), ("error", id, "cancelled" / "expired" / None, error),
+("chunk", id, text), ("done", id), ("tokens", id, count), ("metrics", id, summary),
+("log", None, line).
+"""
+
+from __future__ import annotations
+
+import atexit
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from queue import Queue
+
+from core import llm_log
+from core.log_writer import get_log_writer
+from llm.backends import LlamaCppBackend
+from llm.llm_request_queue import (
+    MAX_PREEMPTIONS,
+    PRIORITY_INTERACTIVE,
+    WARM_UP,
+    LLMCancelled,
+    LLMExpired,
+    LLMFuture,
+    LLMStream,
+    _priority_of,
+    _task_snapshot,
+    estimate_tokens,
+    stream_chunks,
+)
+
+# How long `count_tokens` waits on the process before estimating instead. It is asked from
+# the main thread, which must not hang on a process that is restarting.
+TOKENIZE_TIMEOUT_S = 2.0
+# How stale the telemetry `get_metrics` hands back may get before it asks for more.
+METRICS_REFRESH_S = 1.0
+# How long the game, quitting, gives the process to write out its log before it is killed.
+SHUTDOWN_TIMEOUT_S = 3.0
+
+
+def _serve(conn, backend_factory):
+    """The inference process: load the model, then run requests until the game goes."""
+    import llm.llm_request_queue as q
+
+    try:
+        q.use_backend(backend_factory())
+        llm_queue = q.get_llm_queue()
+    except Exception as e:
+        conn.send(("failed", f"{type(e).__name__}: {e}"))
+        return
+    server = QueueServer(llm_queue)
+    conn.send(("ready",))
+    # Returns when the game is gone; so is any reason to keep the model loaded.
+    server.serve_connection(conn, forward_logs=True)
+
+
+class QueueServer:
+    """The process side of the protocol: runs each connection's requests on one queue.
+
+    The inference process serves a single connection, the game's; the LLM service
+    (`llm.service`) one per tool or game attached to it, each in a lane of its own."""
+
+    def __init__(self, llm_queue):
+        self.llm_queue = llm_queue
+        # The queue's task id of each request -> (send, the client's id for it), so the
+        # queue's state changes reach the connection that asked. Filled under the lock
+        # *while* submitting, and read under it by the listener, so a request the worker
+        # starts at once is still found.
+        self._lock = threading.Lock()
+        self._owners = {}
+        llm_queue.listener = self._on_state
+
+    def _on_state(self, handle, state):
+        with self._lock:
+            owner = self._owners.get(handle.task_id)
+        if owner is not None:
+            send, client_id = owner
+            send(("state", client_id, state, handle.preemptions, handle.decision))
+
+    def serve_connection(self, conn, lane=None, forward_logs=False):
+        """Read one connection's messages until it closes; what it still had in flight is
+        cancelled then, since nobody is left to read the reply. With `forward_logs`, this
+        process's log records go down the connection for the other end to write."""
+        send_lock = threading.Lock()
+        # The client's id -> the request's handle, for cancelling.
+        handles = {}
+
+        def send(message):
+            with send_lock:
+                try:
+                    conn.send(message)
+                except (OSError, EOFError):
+                    pass  # gone; the loop below notices and cleans up
+
+        if forward_logs:
+            llm_log.forward_to(lambda line: send(("log", None, line)))
+
+        def forget(client_id):
+            with self._lock:
+                handle = handles.pop(client_id, None)
+                if handle is not None:
+                    self._owners.pop(handle.task_id, None)
+
+        def reply(client_id, future):
+            forget(client_id)
+            if not future.cancelled() and future.exception() is None:
+                send(("result", client_id, future.result()))
+            else:
+                error = None if future.cancelled() else future.exception()
+                if isinstance(error, LLMExpired):
+                    reason = "expired"
+                elif error is None or isinstance(error, LLMCancelled):
+                    reason = "cancelled"
+                else:
+                    reason = None
+                send(("error", client_id, reason, str(error)))
+
+        def forward(client_id, stream):
+            chunks = iter(stream)
+            next(chunks)  # the "" every stream opens with; the client's stream yields its own
+            for chunk in chunks:
+                send(("chunk", client_id, chunk))
+            forget(client_id)
+            send(("done", client_id))
+
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind, client_id = message[0], message[1]
+            if kind == "close":
+                break
+            if kind == "submit":
+                with self._lock:
+                    future = self.llm_queue.submit(**message[2], lane=lane)
+                    self._owners[future.handle.task_id] = (send, client_id)
+                    handles[client_id] = future.handle
+                future.add_done_callback(lambda done, client_id=client_id: reply(client_id, done))
+            elif kind == "stream":
+                with self._lock:
+                    stream = self.llm_queue.generate_response_stream(**message[2], lane=lane)
+                    self._owners[stream.handle.task_id] = (send, client_id)
+                    handles[client_id] = stream.handle
+                threading.Thread(target=forward, args=(client_id, stream), daemon=True).start()
+            elif kind == "warmup":
+                with self._lock:
+                    future = self.llm_queue.warm_up(message[2], lane=lane)
+                    self._owners[future.handle.task_id] = (send, client_id)
+                    handles[client_id] = future.handle
+                future.add_done_callback(lambda done, client_id=client_id: reply(client_id, done))
+            elif kind == "cancel":
+                with self._lock:
+                    handle = handles.get(client_id)
+                if handle is not None:
+                    handle.cancel()
+            elif kind == "promote":
+                with self._lock:
+                    handle = handles.get(client_id)
+                if handle is not None:
+                    handle.promote(message[2])
+            elif kind == "tokenize":
+                # Answered here, not queued: a tokenizer call needs the vocabulary, not the model.
+                send(("tokens", client_id, self.llm_queue.count_tokens(message[2])))
+            elif kind == "metrics":
+                send(("metrics", client_id, self.llm_queue.get_metrics()))
+
+        with self._lock:
+            orphans = list(handles.values())
+        for handle in orphans:
+            handle.cancel()
+        conn.close()
+
+
+class RemoteHandle:
+    """The client's `RequestHandle`: cancelling it tells the process. Preemption is the
+    process's business, and the count of it lives in the client's task list."""
+
+    def __init__(self, client: InferenceClient, task_id: int, category: str):
+        self._client = client
+        self.task_id = task_id
+        self.category = category
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._client._cancel(self.task_id)
+
+    def promote(self, category: str):
+        self.category = category
+        self._client._promote(self.task_id, category)
+
+
+class InferenceClient:
+    """`LLMRequestQueue`'s API, served by an inference process. See the module docstring."""
+
+    # What `_on_exit` says it does about a lost connection.
+    RECOVERY = "restarting it"
+
+    def __init__(self, backend_factory=LlamaCppBackend):
+        # Called in the new process to build its backend: so it must pickle, which a class
+        # or a `functools.partial` of one does.
+        self.backend_factory = backend_factory
+        self.lock = threading.Lock()
+        self._ids = itertools.count()
+        # task_id -> the queue's task dict (see `LLMRequestQueue.tasks`) and preemptions, as
+        # the process reports them.
+        self.tasks = {}
+        # task_id -> ("future", LLMFuture) or ("stream", Queue), for what is still owed.
+        self._pending = {}
+        self._tokenized = {}
+        # The last telemetry summary the process sent, and when it was asked for.
+        self._metrics = {}
+        self._metrics_asked = 0.0
+        self._main_callbacks = Queue()
+        self._outgoing = Queue()
+        self._ready = threading.Event()
+        self._process = None
+        self._conn = None
+        self._closing = threading.Event()
+
+    def start(self):
+        # Made before `_shutdown` is registered, so closed after it (atexit runs last in,
+        # first out): the records the process forwards while it winds down still get written.
+        get_log_writer()
+        self._launch()
+        threading.Thread(target=self._write, daemon=True).start()
+        # Runs before multiprocessing's own exit hook (registered first, run last), which
+        # terminates the process.
+        atexit.register(self._shutdown)
+
+    def _shutdown(self):
+        """The game is quitting: not a crash to recover from. The process is asked to end
+        rather than left to be terminated, so it exits normally and writes out what its log
+        writer still holds (`core.log_writer`)."""
+        self._closing.set()
+        self._outgoing.put(("close", 0))
+        if self._process is not None:
+            self._process.join(SHUTDOWN_TIMEOUT_S)
+
+    def _launch(self):
+        """Start a process and wait for its model to load. Raises if the model can't.
+        Ends by starting the reader, which `_on_exit`s when the connection closes."""
+        context = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(target=_serve, args=(child_conn, self.backend_factory), daemon=True)
+        process.start()
+        child_conn.close()
+        try:
+            message = parent_conn.recv()
+        except EOFError:
+            process.join()
+            message = ("failed", f"inference process exited with code {process.exitcode}")
+        if message[0] == "failed":
+            raise RuntimeError(f"LLM failed to load: {message[1]}")
+        self._process, self._conn = process, parent_conn
+        threading.Thread(target=self._read, args=(parent_conn,), daemon=True).start()
+        self._ready.set()
+
+    def _write(self):
+        """The one thread that sends, so a message is never interleaved with another, and
+        the one that holds messages back while the process restarts."""
+        while True:
+            message = self._outgoing.get()
+            while True:
+                self._ready.wait()
+                try:
+                    self._conn.send(message)
+                    break
+                except (OSError, EOFError):
+                    # Process gone: the reader is about to notice and restart it, which
+                    # clears `_ready` until the new one is up. Try again once it is.
+                    time.sleep(0.05)
+
+    def _read(self, conn):
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            self._handle(message)
+        self._on_exit()
+
+    def _handle(self, message):
+        kind, task_id = message[0], message[1]
+        if kind == "state":
+            with self.lock:
+                task = self.tasks.get(task_id)
+                if task is not None:
+                    task["state"] = message[2]
+                    task["preemptions"] = message[3]
+                    task["decision"] = message[4]
+                    if message[2] == "running":
+                        task["start"] = time.monotonic()
+                        task["wait"] = task["start"] - task["submitted"]
+            return
+        if kind == "tokens":
+            waiter = self._tokenized.get(task_id)
+            if waiter is not None:
+                waiter[1] = message[2]
+                waiter[0].set()
+            return
+        if kind == "metrics":
+            self._metrics = message[2]
+            return
+        if kind == "log":
+            llm_log.write_forwarded(message[2])
+            return
+        if kind == "chunk":
+            pending = self._pending.get(task_id)
+            if pending is not None:
+                pending[1].put(("chunk", message[2]))
+            return
+
+        with self.lock:
+            self.tasks.pop(task_id, None)
+            pending = self._pending.pop(task_id, None)
+        if pending is None:
+            return
+        if kind == "done":
+            pending[1].put(("done", None))
+            return
+        future = pending[1]
+        if future.done():
+            return
+        if kind == "result":
+            future.set_result(message[2])
+        elif message[2] == "expired":
+            future.set_exception(LLMExpired(message[3]))
+        elif message[2] == "cancelled":
+            future.set_exception(LLMCancelled(future.handle.category))
+        else:
+            future.set_exception(Exception(message[3]))
+
+    def _on_exit(self):
+        """The connection is gone: fail what was in flight, then bring up another one."""
+        self._ready.clear()
+        if self._closing.is_set():
+            return
+        reason = self._exit_reason()
+        print(f"LLM {reason}; {self.RECOVERY}")
+        with self.lock:
+            pending, self._pending = self._pending, {}
+            self.tasks.clear()
+        for kind, target in pending.values():
+            if kind == "stream":
+                target.put(("done", None))
+            elif not target.done():
+                target.set_exception(Exception(f"LLM error: {reason}"))
+        for event, _ in list(self._tokenized.values()):
+            event.set()
+        self._relaunch()
+
+    def _exit_reason(self) -> str:
+        self._process.join(timeout=5)
+        return f"inference process exited with code {self._process.exitcode}"
+
+    def _relaunch(self):
+        try:
+            self._launch()
+        except RuntimeError as e:
+            # Loaded once, so this is not a missing file; the next restart may fare better.
+            print(e)
+
+    def _register(self, category: str, kind: str, target) -> int:
+        task_id = next(self._ids)
+        now = time.monotonic()
+        with self.lock:
+            self.tasks[task_id] = {
+                "category": category,
+                "priority": _priority_of(category),
+                "state": "queued",
+                "submitted": now,
+                "start": now,
+                "wait": 0.0,
+                "decision": None,
+                "preemptions": 0,
+            }
+            self._pending[task_id] = (kind, target)
+        return task_id
+
+    def _cancel(self, task_id):
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is not None and task["state"] == "queued":
+                del self.tasks[task_id]
+        self._outgoing.put(("cancel", task_id))
+
+    def _promote(self, task_id, category: str):
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is not None:
+                task["category"] = category
+                task["priority"] = _priority_of(category)
+        self._outgoing.put(("promote", task_id, category))
+
+    def get_active_tasks(self):
+        now = time.monotonic()
+        with self.lock:
+            tasks = [dict(t) for t in self.tasks.values()]
+        return _task_snapshot(tasks, now)
+
+    def holds_dialogue(self) -> bool:
+        with self.lock:
+            for task in self.tasks.values():
+                if task["priority"] == PRIORITY_INTERACTIVE:
+                    return True
+                if task["state"] == "running" and task["preemptions"] >= MAX_PREEMPTIONS:
+                    return True
+        return False
+
+    def submit(
+        self,
+        prompt: str,
+        system_prompt: str,
+        category: str,
+        max_tokens: int | None = None,
+        raw: bool = False,
+        callback=None,
+        on_main: bool = False,
+        grammar: str | None = None,
+    ) -> LLMFuture:
+        future = LLMFuture()
+        task_id = self._register(category, "future", future)
+        future.handle = RemoteHandle(self, task_id, category)
+        if callback is not None:
+            if on_main:
+                future.add_done_callback(lambda done: self.call_on_main(callback, done))
+            else:
+                future.add_done_callback(callback)
+        request = {
+            "prompt": prompt,
+            "system_prompt": system_prompt,
+            "category": category,
+            "max_tokens": max_tokens,
+            "raw": raw,
+            "grammar": grammar,
+        }
+        self._outgoing.put(("submit", task_id, request))
+        return future
+
+    def warm_up(self, system_prefixes: list[str]) -> LLMFuture:
+        future = LLMFuture()
+        task_id = self._register(WARM_UP, "future", future)
+        future.handle = RemoteHandle(self, task_id, WARM_UP)
+        self._outgoing.put(("warmup", task_id, system_prefixes))
+        return future
+
+    def call_on_main(self, callback, future):
+        self._main_callbacks.put((callback, future))
+
+    def drain_callbacks(self):
+        while True:
+            try:
+                callback, future = self._main_callbacks.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                callback(future)
+            except Exception as e:
+                print(f"LLM callback failed: {type(e).__name__}: {e}")
+
+    def generate_response(
+        self,
+        prompt: str,
+        system_prompt: str,
+        category: str,
+        max_tokens: int | None = None,
+        raw: bool = False,
+        grammar: str | None = None,
+    ) -> str:
+        return self.submit(prompt, system_prompt, category, max_tokens=max_tokens, raw=raw, grammar=grammar).result()
+
+    def generate_response_stream(
+        self,
+        prompt: str,
+        system_prompt: str,
+        category: str,
+        max_tokens: int | None = None,
+        stop: list | None = None,
+        poll=False,
+    ) -> LLMStream:
+        stream_queue = Queue()
+        task_id = self._register(category, "stream", stream_queue)
+        handle = RemoteHandle(self, task_id, category)
+        request = {
+            "prompt": prompt,
+            "system_prompt": system_prompt,
+            "category": category,
+            "max_tokens": max_tokens,
+            "stop": stop,
+        }
+        self._outgoing.put(("stream", task_id, request))
+        return LLMStream(handle, stream_chunks(stream_queue, handle, poll))
+
+    def get_metrics(self) -> dict:
+        """The queue's telemetry, up to `METRICS_REFRESH_S` old: never waits on the process,
+        the panel asks every frame."""
+        now = time.monotonic()
+        if now - self._metrics_asked >= METRICS_REFRESH_S:
+            self._metrics_asked = now
+            self._outgoing.put(("metrics", next(self._ids)))
+        return self._metrics
+
+    def count_tokens(self, text: str) -> int:
+        request_id = next(self._ids)
+        waiter = [threading.Event(), None]
+        self._tokenized[request_id] = waiter
+        self._outgoing.put(("tokenize", request_id, text))
+        waiter[0].wait(TOKENIZE_TIMEOUT_S)
+        self._tokenized.pop(request_id, None)
+        if waiter[1] is None:
+            return estimate_tokens(text)
+        return waiter[1]
@@ -1,14 +1,19 @@
 import itertools
+import os
 import queue
 import re
 import threading
 import time
-from queue import PriorityQueue, Queue
-
-from llama_cpp import Llama
+from concurrent.futures import Future
+from dataclasses import dataclass
+from queue import Queue
 
 import core.constants as c
 from core import llm_log
+from llm.backends import Completion, LlamaCppBackend, LLMBackend
+from llm.state_cache import PromptStateCache
+from llm.telemetry import LLMTelemetry, call_metrics
+from llm.warm_states import WarmStates
 
 CHAR_FILTER = str.maketrans("", "", '"«»')
 
@@ -20,43 +25,296 @@ UNSUPPORTED_GLYPH_RE = re.compile("[^\t\n\r\x20-\x7e -ɏ‐-―‘-‟…]")
 
 ENGLISH_ONLY_REMINDER = "Respond only in English, using standard Latin letters and punctuation."
 
+# A rough token length in characters, for `estimate_tokens`: English prose in the model's
+# tokenizer runs to about four.
+CHARS_PER_TOKEN = 4
+
+# ChatML turn markers: past either one the model is writing a turn that isn't its own.
+STOPS = ["<|im_end|>", "<|im_start|>"]
+
 # The player is waiting on the screen for these, so they go to the front of the queue.
 # Everything else (naming, shop stock, world context, quest analysis) happens in the
 # background and can wait: what it must not do is hold up the next line of dialogue.
 INTERACTIVE_CATEGORIES = frozenset({"First message", "Continuing conversation"})
 PRIORITY_INTERACTIVE = 0
 PRIORITY_BACKGROUND = 1
+# Content made ahead of need while the model has nothing else to do (`llm.pregen`): served
+# after everything else, and called off the moment anything else is submitted.
+PREGENERATION = "Pre-generation"
+PRIORITY_IDLE = 2
+
+# A greeting written while the player walks up to an NPC (DialogueManager.speculate_greeting):
+# background priority, since nobody is waiting on it yet, but snapshotted like dialogue,
+# because when it is used the conversation carries on from it.
+SPECULATIVE_GREETING = "Speculative greeting"
+SNAPSHOT_CATEGORIES = INTERACTIVE_CATEGORIES | {SPECULATIVE_GREETING}
+
+# Evaluating the openings of system prompts ahead of the calls that share them, see
+# `warm_up_internal`.
+WARM_UP = "Warm-up"
+
+# Short, self-contained background calls: a one-line reply to a prompt that shares nothing
+# with the conversation the model holds. Queued next to each other (a world's worth of
+# village names, a refill of the name buffer) they are decoded together as one batch, see
+# `generate_batch_internal`.
+BATCHABLE_CATEGORIES = frozenset(
+    {"Village naming", "Landmark naming", "Boss naming", "Name generation", "Death taunt", "Event flavor text"}
+)
+
+
+@dataclass(frozen=True)
+class Deadline:
+    """When a category of call should be served by, and what it is worth as it waits.
+
+    A queued request is worth `value` when submitted and its urgency rises by one for every
+    `soft_s` it waits, so anything left waiting long enough outranks even fresh dialogue:
+    a chatty player delays a new village's shop stock, but never starves it. Past `soft_s`
+    (overdue), `expiry` says what becomes of it: "age" carries on rising, "shrink" still
+    runs but with `max_tokens` cut to `DOWN_SCOPE` of what was asked, and "drop" is not worth
+    running any more and ends with `LLMExpired`, leaving the caller to its fallback."""
+
+    soft_s: float
+    value: float
+    expiry: str = "age"
+
+
+DEADLINES = {
+    # The player is looking at an empty dialogue box.
+    "First message": Deadline(2.0, 3.0),
+    "Continuing conversation": Deadline(2.0, 3.0),
+    # Asked in the middle of a quest turn-in, which waits on it.
+    "Extract reward": Deadline(3.0, 2.0),
+    # Loading screen of a new world: nothing else can start before it.
+    "Context generation": Deadline(5.0, 2.0),
+    # The game's own loading screen waits on it, but then nothing else is queued; in a game
+    # it only saves the calls after it some time.
+    WARM_UP: Deadline(10.0, 1.0),
+    # Never dropped here, even once stale: it may be adopted as the "First message" of a
+    # conversation the player has just opened, and is promoted to one then
+    # (`RequestHandle.promote`). Walking away cancels it instead
+    # (`DialogueManager._drop_speculation`).
+    SPECULATIVE_GREETING: Deadline(4.0, 1.5),
+    # The quest the player was just offered should be in the journal before they look.
+    "Conversation analyze": Deadline(10.0, 1.5),
+    # Decides whether "Conversation analyze" is needed at all, so it has the same clock.
+    "Quest check": Deadline(10.0, 1.5),
+    # NPCs of a new village stand nameless until these arrive.
+    "Name generation": Deadline(10.0, 1.0),
+    "Shop generation": Deadline(15.0, 1.0),
+    "Village naming": Deadline(20.0, 1.0),
+    "Landmark naming": Deadline(20.0, 1.0),
+    "Boss naming": Deadline(20.0, 1.0),
+    # A stale rumour or omen is worse than the canned line it falls back to.
+    "Event flavor text": Deadline(10.0, 1.0, "drop"),
+    "Village crisis": Deadline(20.0, 0.5, "drop"),
+    # The extractive summary already stands in for it.
+    "Conversation summary": Deadline(10.0, 0.5, "drop"),
+    # A buffer refill: a shorter list, sooner, keeps the death screen fed.
+    "Death taunt": Deadline(30.0, 0.5, "shrink"),
+    # Nobody is waiting on it at all.
+    PREGENERATION: Deadline(60.0, 0.0),
+}
+DEFAULT_DEADLINE = Deadline(10.0, 1.0)
+
+# What an overdue "shrink" request keeps of its `max_tokens`.
+DOWN_SCOPE = 0.5
+# Urgency a lane gives up per request it has had served ahead of the others, see
+# `LLMRequestQueue._lane_lead`: one, so lanes of equal work alternate.
+LANE_SHARE = 1.0
 
 
 def _priority_of(category: str) -> int:
-    return PRIORITY_INTERACTIVE if category in INTERACTIVE_CATEGORIES else PRIORITY_BACKGROUND
+    if category in INTERACTIVE_CATEGORIES:
+        return PRIORITY_INTERACTIVE
+    return PRIORITY_IDLE if category == PREGENERATION else PRIORITY_BACKGROUND
+
+
+def _deadline_of(category: str) -> Deadline:
+    return DEADLINES.get(category, DEFAULT_DEADLINE)
+
+
+def urgency(category: str, waited: float) -> float:
+    deadline = _deadline_of(category)
+    return deadline.value + waited / deadline.soft_s
+
+
+def _overdue(request, now: float) -> bool:
+    return now - request["submitted"] > _deadline_of(request["category"]).soft_s
+
+
+def _scoped(max_tokens: int, handle) -> int:
+    """`max_tokens` for a request, cut down if the scheduler down-scoped it."""
+    if handle is not None and handle.down_scoped:
+        return max(1, int(max_tokens * DOWN_SCOPE))
+    return max_tokens
+
+
+def _task_snapshot(tasks, now: float):
+    """`get_active_tasks` from the task dicts of a queue, or of a client's mirror of one."""
+    for task in tasks:
+        task["urgency"] = urgency(task["category"], now - task["submitted"])
+        if task["decision"] is None and task["state"] == "queued":
+            if now - task["submitted"] > _deadline_of(task["category"]).soft_s:
+                task["decision"] = "overdue"
+    tasks.sort(key=lambda t: (t["state"] != "running", -t["urgency"]))
+    return [
+        {
+            "category": t["category"],
+            "state": t["state"],
+            "elapsed": now - t["start"],
+            "wait": now - t["submitted"] if t["state"] == "queued" else t["wait"],
+            "urgency": t["urgency"],
+            "decision": t["decision"],
+        }
+        for t in tasks
+    ]
 
 
 def _strip_unsupported_glyphs(text: str) -> str:
     return UNSUPPORTED_GLYPH_RE.sub("", text)
 
 
+def _system_head(system_prompt: str) -> str:
+    # The reminder leads, not trails: it is the same for every call, and the model only
+    # reuses the KV cache up to the first token that differs from the call before.
+    return f"<|im_start|>system\n{ENGLISH_ONLY_REMINDER} {system_prompt}"
+
+
 def _format_prompt(prompt: str, system_prompt: str) -> str:
-    system_prompt = f"{system_prompt} {ENGLISH_ONLY_REMINDER}"
-    return (
-        f"<|im_start|>system\n{system_prompt}<|im_end|>\n<|im_start|>user\n{prompt}<|im_end|>\n<|im_start|>assistant\n"
-    )
+    return f"{_system_head(system_prompt)}<|im_end|>\n<|im_start|>user\n{prompt}<|im_end|>\n<|im_start|>assistant\n"
+
+
+class LLMCancelled(Exception):
+    """The request was cancelled before it produced a result."""
+
+
+class LLMExpired(LLMCancelled):
+    """The request waited past its deadline, in a category that isn't worth running late
+    (`Deadline.expiry == "drop"`); the scheduler called it off."""
+
+
+class Preempted(Exception):
+    """Raised inside a background call when interactive work wants the model; the worker
+    puts the request back in the queue rather than failing it."""
+
+
+# How many times one background call may be pushed back for dialogue. A chatty player
+# would otherwise keep the same quest analysis restarting forever; past this it runs out.
+MAX_PREEMPTIONS = 2
+
+
+class RequestHandle:
+    """What a submitted request hands back: enough to call it off.
+
+    Checked by the generation loop between tokens, so a cancelled call stops within one
+    token, and by the worker when it dequeues, so one that never started never does."""
+
+    def __init__(self, llm_queue, task_id: int, category: str):
+        self._queue = llm_queue
+        self.task_id = task_id
+        self.category = category
+        # Wall-clock, for the log: when the caller asked, however long it then waited.
+        self.submitted_at = time.time()
+        self._cancelled = threading.Event()
+        self._preempted = threading.Event()
+        self.preemptions = 0
+        # Set by the scheduler: run with fewer tokens (`_scoped`), and its last decision
+        # about this request, for `get_active_tasks`.
+        self.down_scoped = False
+        self.decision = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._queue._forget_if_queued(self.task_id)
+
+    def preempt(self):
+        self._preempted.set()
+
+    def promote(self, category: str):
+        """Serve this request from now on as one of `category`: its priority and deadline,
+        whether it is still queued or already running. How a speculated greeting becomes
+        the first line of the conversation the player has just opened."""
+        self.category = category
+        self._queue._promote(self.task_id, category)
+
+    def check(self) -> bool:
+        """Between tokens: False to stop here (cancelled), raises `Preempted` to yield the
+        model to interactive work, True to carry on."""
+        if self._cancelled.is_set():
+            return False
+        if self._preempted.is_set():
+            self._preempted.clear()
+            raise Preempted
+        return True
+
+
+class LLMFuture(Future):
+    """A `concurrent.futures.Future` for one request's text. `cancel()` reaches a call the
+    worker has already started as well, through its handle, where a plain Future would
+    refuse; it then ends with `LLMCancelled` rather than a result."""
+
+    def __init__(self):
+        super().__init__()
+        self.handle: RequestHandle | None = None
+
+    def cancel(self) -> bool:
+        if self.handle is not None:
+            self.handle.cancel()
+        return super().cancel()
+
+
+class LLMStream:
+    """A streamed reply: iterated for its partial texts, and cancellable like any request."""
+
+    def __init__(self, handle: RequestHandle, chunks):
+        self.handle = handle
+        self._chunks = chunks
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def cancel(self):
+        self.handle.cancel()
 
 
 class LLMRequestQueue:
     def __init__(self):
-        # Priority queue, not FIFO: one model serves the whole game, so a background job
-        # queued the moment a conversation closes (quest analysis) would otherwise make the
-        # next NPC's first line wait for it. Ties break on arrival order.
-        self.request_queue = PriorityQueue()
+        # Served by urgency, not arrival: one model serves the whole game, so a background
+        # job queued the moment a conversation closes (quest analysis) would otherwise make
+        # the next NPC's first line wait for it. Urgency changes as requests wait, so there
+        # is no heap to keep it in: the worker scores what is queued each time it takes one,
+        # see `_take`. A few dozen requests at the very most.
+        self._queued = []
+        self._available = threading.Condition()
         self._sequence = itertools.count()
+        # Fair share between lanes (the clients of an LLM service, `llm.service`): requests
+        # served per lane, see `_lane_lead`.
+        self._lane_served = {}
         self.worker_thread = None
         self.running = False
         self.lock = threading.Lock()
 
-        # task_id -> {category, priority, state ("queued"/"running"), start (monotonic)}.
+        # task_id -> {category, priority, state ("queued"/"running"), submitted and start
+        # (monotonic), wait (seconds queued before it ran), decision (the scheduler's last
+        # word on it, or None)}.
         self.tasks = {}
         self._next_task_id = 0
+        # The requests the worker is on (several when it runs a batch), so an interactive
+        # arrival can preempt them.
+        self._running_requests = []
+        # (callback, future) pairs waiting to run on the main thread, see `drain_callbacks`.
+        self._main_callbacks = Queue()
+        # Told listener(handle, state) when a task starts running or goes back in the queue;
+        # how a queue inside the inference process keeps its client's task list current.
+        # Called from the worker, never with the lock held.
+        self.listener = None
 
     def start(self):
         if not self.running:
@@ -65,15 +323,26 @@ class LLMRequestQueue:
             self.worker_thread.start()
 
     def get_active_tasks(self):
-        """Snapshot of in-flight tasks: category, state, and elapsed seconds, in the order
-        they will be served (the running one first, then by priority)."""
+        """Snapshot of in-flight tasks, in the order they will be served as things stand
+        (running first, then by urgency): category, state, elapsed seconds in that state,
+        seconds it waited in the queue, its urgency now, and the scheduler's last decision
+        about it ("overdue", "down-scoped", "preempted", or None)."""
         now = time.monotonic()
         with self.lock:
-            tasks = list(self.tasks.values())
-        tasks.sort(key=lambda t: (t["state"] != "running", t["priority"]))
-        return [{"category": t["category"], "state": t["state"], "elapsed": now - t["start"]} for t in tasks]
+            tasks = [dict(t) for t in self.tasks.values()]
+        return _task_snapshot(tasks, now)
+
+    def holds_dialogue(self) -> bool:
+        """Whether a conversation opened now would have to wait: dialogue already in flight,
+        or a background call that can no longer be preempted."""
+        with self.lock:
+            for task in self.tasks.values():
+                if task["priority"] == PRIORITY_INTERACTIVE:
+                    return True
+            return any(r["handle"].preemptions >= MAX_PREEMPTIONS for r in self._running_requests)
 
     def _register_task(self, category):
+        now = time.monotonic()
         with self.lock:
             task_id = self._next_task_id
             self._next_task_id += 1
@@ -81,54 +350,365 @@ class LLMRequestQueue:
                 "category": category,
                 "priority": _priority_of(category),
                 "state": "queued",
-                "start": time.monotonic(),
+                "submitted": now,
+                "start": now,
+                "wait": 0.0,
+                "decision": None,
             }
         return task_id
 
-    def _submit(self, request: dict, category: str):
-        self.request_queue.put((_priority_of(category), next(self._sequence), request))
+    def _forget_if_queued(self, task_id):
+        """A queued request that is cancelled leaves the task list at once, so nothing
+        waits on it; the worker drops its queue entry when it reaches it."""
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is not None and task["state"] == "queued":
+                del self.tasks[task_id]
+
+    def _promote(self, task_id, category: str):
+        """See `RequestHandle.promote`. Still queued and interactive now, it asks what is on
+        the model to give way to it, as a request submitted in that category would."""
+        priority = _priority_of(category)
+        with self._available:
+            queued = next((r for r in self._queued if r["handle"].task_id == task_id), None)
+            with self.lock:
+                running = next((r for r in self._running_requests if r["handle"].task_id == task_id), None)
+                task = self.tasks.get(task_id)
+                if task is not None:
+                    task["category"] = category
+                    task["priority"] = priority
+            for request in (queued, running):
+                if request is not None:
+                    request["category"] = category
+                    request["priority"] = priority
+        if queued is not None and priority == PRIORITY_INTERACTIVE:
+            self._yield_idle()
+            self._preempt_background(queued)
+
+    def _decide(self, request, decision: str):
+        request["handle"].decision = decision
+        with self.lock:
+            task = self.tasks.get(request["handle"].task_id)
+            if task is not None:
+                task["decision"] = decision
+
+    def _submit(self, func, category: str, batch_args=None, lane=None) -> LLMFuture:
+        future = LLMFuture()
+        handle = RequestHandle(self, self._register_task(category), category)
+        future.handle = handle
+        priority = _priority_of(category)
+        request = {
+            "func": func,
+            "future": future,
+            "handle": handle,
+            "priority": priority,
+            "category": category,
+            "lane": lane,
+            "submitted": time.monotonic(),
+            "sequence": next(self._sequence),
+        }
+        if batch_args is not None:
+            # What `generate_batch_internal` needs to run this one as part of a batch.
+            request["batch_args"] = batch_args
+        self._enqueue(request)
+        if priority != PRIORITY_IDLE:
+            self._yield_idle()
+        if priority == PRIORITY_INTERACTIVE:
+            self._preempt_background(request)
+        return future
+
+    def _yield_idle(self):
+        """Call off the pre-generation on the model, if any: it stops at its next token. Not
+        put back in the queue like a preempted call: `llm.pregen` asks again once the model
+        is idle, which is the only time it was worth running."""
+        with self.lock:
+            running = list(self._running_requests)
+        for request in running:
+            if request["priority"] == PRIORITY_IDLE:
+                request["handle"].cancel()
+
+    def _enqueue(self, request):
+        with self._available:
+            lane = request["lane"]
+            if not any(queued["lane"] == lane for queued in self._queued):
+                # A lane coming back from idle starts level with the least served of those
+                # with work queued: a turn now, not a backlog of turns it never asked for.
+                active = [self._lane_served.get(queued["lane"], 0) for queued in self._queued]
+                floor = min(active) if active else 0
+                self._lane_served[lane] = max(self._lane_served.get(lane, 0), floor)
+            self._queued.append(request)
+            self._available.notify()
+
+    def _lane_lead(self, lane) -> int:
+        """How many more requests this lane has had served than the least served lane with
+        work queued: with `LANE_SHARE`, what keeps one busy client from crowding out the
+        others. Always 0 for a queue with one lane, the game on its own. `_available` held."""
+        served = self._lane_served.get(lane, 0)
+        return served - min(self._lane_served.get(queued["lane"], 0) for queued in self._queued)
+
+    def _ranked(self, now: float):
+        """What is queued, most urgent first. `_available` held."""
+
+        def key(request):
+            score = urgency(request["category"], now - request["submitted"])
+            idle = request["priority"] == PRIORITY_IDLE
+            return idle, -(score - LANE_SHARE * self._lane_lead(request["lane"])), request["sequence"]
+
+        return sorted(self._queued, key=key)
+
+    def _take(self, timeout: float) -> list:
+        """The most urgent request, and when it is batchable the batchable ones ranked right
+        after it (see `_gather_batch`); [] if nothing came within `timeout`. Requests whose
+        category drops them once overdue are settled on the way, never run."""
+        with self._available:
+            if not self._queued:
+                self._available.wait(timeout)
+            now = time.monotonic()
+            for request in list(self._queued):
+                if _overdue(request, now) and _deadline_of(request["category"]).expiry == "drop":
+                    self._queued.remove(request)
+                    self._expire(request, now)
+            if not self._queued:
+                return []
+            ranked = self._ranked(now)
+            taken = [ranked[0]]
+            if "batch_args" in ranked[0]:
+                taken += self._gather_batch(ranked[1:])
+            for request in taken:
+                self._queued.remove(request)
+                self._lane_served[request["lane"]] = self._lane_served.get(request["lane"], 0) + 1
+        return [request for request in taken if self._claim(request, now)]
+
+    def _expire(self, request, now: float):
+        handle = request["handle"]
+        deadline = _deadline_of(request["category"])
+        # Cancelled, as far as its reader can tell: a stream's ends on the flag.
+        handle._cancelled.set()
+        telemetry.count(handle.category, "expired")
+        with self.lock:
+            self.tasks.pop(handle.task_id, None)
+        if not request["future"].done():
+            waited = now - request["submitted"]
+            message = f"{handle.category}: waited {waited:.1f}s, deadline {deadline.soft_s:g}s"
+            request["future"].set_exception(LLMExpired(message))
+
+    def submit(
+        self,
+        prompt: str,
+        system_prompt: str,
+        category: str,
+        max_tokens: int | None = None,
+        raw: bool = False,
+        callback=None,
+        on_main: bool = False,
+        grammar: str | None = None,
+        lane=None,
+    ) -> LLMFuture:
+        """Queue a call and return at once with a Future for its text.
+
+        `callback(future)` runs once it is done, cancelled or failed: on the worker thread by
+        default, which suits a callback that only files the result away, or on the main
+        thread from `drain_callbacks` with `on_main=True`, for one that touches the world.
+        A worker callback holds the model while it runs, so it must be short and must never
+        wait on another LLM call: the worker it would be waiting on is itself.
+
+        `grammar` (GBNF, see `llm.grammars`) constrains the reply to a structure; such a
+        call is never batched, the batch decode samples without one.
+
+        `lane` is whose call it is, when several clients share the queue (`llm.service`):
+        each lane gets its share of the model, see `_lane_lead`.
+
+        A call whose category drops it once overdue (`DEADLINES`) may end with `LLMExpired`
+        without having run."""
+
+        def request_func(handle):
+            return generate_response_internal(
+                prompt, system_prompt, category, max_tokens=max_tokens, raw=raw, handle=handle, grammar=grammar
+            )
+
+        batch_args = None
+        if (
+            category in BATCHABLE_CATEGORIES
+            and c.Hyperparameters.BATCH_SIZE > 1
+            and grammar is None
+            and backend.batches
+        ):
+            batch_args = (prompt, system_prompt, category, max_tokens, raw)
+        future = self._submit(request_func, category, batch_args, lane)
+        if callback is not None:
+            if on_main:
+                future.add_done_callback(lambda done: self.call_on_main(callback, done))
+            else:
+                future.add_done_callback(callback)
+        return future
+
+    def call_on_main(self, callback, future):
+        """Have `drain_callbacks` run `callback(future)`, as `submit(..., on_main=True)` does."""
+        self._main_callbacks.put((callback, future))
+
+    def drain_callbacks(self):
+        """Run the callbacks finished requests handed to the main thread. Called once a
+        frame by the game loop; a callback that raises is dropped, not the frame."""
+        while True:
+            try:
+                callback, future = self._main_callbacks.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                callback(future)
+            except Exception as e:
+                print(f"LLM callback failed: {type(e).__name__}: {e}")
+
+    def _preempt_background(self, arrival):
+        """The preempt hook: ask the background call on the model to give way to `arrival`.
+        It stops at its next token and goes back in the queue, where its urgency is what it
+        was (the time it has waited counts from its submission); what it had generated is
+        thrown away. A call already pushed back `MAX_PREEMPTIONS` times is left to finish,
+        and so is one that has aged past the arrival's urgency; so is any batch it is part
+        of: a batch gives way as a whole or not at all."""
+        with self.lock:
+            running = list(self._running_requests)
+        if not running or running[0]["priority"] == PRIORITY_INTERACTIVE:
+            return
+        now = time.monotonic()
+        if urgency(running[0]["category"], now - running[0]["submitted"]) >= urgency(arrival["category"], 0.0):
+            return
+        if all(r["handle"].preemptions < MAX_PREEMPTIONS for r in running):
+            for request in running:
+                request["handle"].preempt()
+
+    def _claim(self, request, now: float) -> bool:
+        """Whether a dequeued request is still wanted; if not it is settled and dropped here.
+        One past a deadline that calls for it is down-scoped on the way through."""
+        handle = request["handle"]
+        future = request["future"]
+        # A Future cancelled while queued says so here and is dropped; one already
+        # started before a preemption is still running and goes straight back in.
+        if not future.running() and not future.set_running_or_notify_cancel():
+            return False
+        if handle.cancelled:
+            future.set_exception(LLMCancelled(handle.category))
+            telemetry.count(handle.category, "cancelled")
+            return False
+        if _overdue(request, now) and _deadline_of(request["category"]).expiry == "shrink" and not handle.down_scoped:
+            handle.down_scoped = True
+            self._decide(request, "down-scoped")
+        return True
+
+    def _gather_batch(self, ranked):
+        """More batchable requests to run alongside the one just taken, from the rest of
+        the queue in serving order: the first that cannot join ends the batch, and nothing
+        is served out of turn to fill one. `_available` held."""
+        batch = []
+        for request in ranked[: c.Hyperparameters.BATCH_SIZE - 1]:
+            if "batch_args" not in request:
+                break
+            batch.append(request)
+        return batch
 
     def _process_queue(self):
         while self.running:
-            try:
-                # Get next request with timeout to allow checking self.running
-                _, _, request = self.request_queue.get(timeout=0.1)
+            # Timed, to allow checking self.running
+            requests = self._take(timeout=0.1)
+            if requests:
+                self._run(requests)
+            telemetry.maybe_dump()
+
+    def _run(self, requests):
+        """Run one request, or a batch of them in a single decode, and settle their futures."""
+        now = time.monotonic()
+        with self.lock:
+            for request in requests:
+                task = self.tasks.get(request["handle"].task_id)
+                if task is not None:
+                    task["state"] = "running"
+                    task["wait"] = now - task["submitted"]
+                    task["start"] = now
+                    if task["decision"] is None and _overdue(request, now):
+                        # Ran late, aged into it: the deadline it missed is worth seeing.
+                        task["decision"] = request["handle"].decision = "overdue"
+            self._running_requests = requests
+        for request in requests:
+            if request["handle"].preemptions == 0:
+                telemetry.record(request["category"], queue_wait_s=now - request["submitted"])
+        self._notify(requests, "running")
 
-                task_id = request["task_id"]
-                with self.lock:
-                    task = self.tasks.get(task_id)
+        try:
+            if len(requests) == 1:
+                results = [requests[0]["func"](requests[0]["handle"])]
+            else:
+                results = generate_batch_internal([r["batch_args"] for r in requests], [r["handle"] for r in requests])
+            for request, result in zip(requests, results, strict=True):
+                handle = request["handle"]
+                telemetry.count(handle.category, "calls")
+                if request["future"].done():
+                    continue
+                if handle.cancelled:
+                    request["future"].set_exception(LLMCancelled(handle.category))
+                    telemetry.count(handle.category, "cancelled")
+                else:
+                    request["future"].set_result(result)
+        except Preempted:
+            with self.lock:
+                for request in requests:
+                    handle = request["handle"]
+                    handle.preemptions += 1
+                    # Only the sequence that noticed first cleared its flag on the way out.
+                    handle._preempted.clear()
+                    handle.decision = "preempted"
+                    telemetry.count(handle.category, "preempted")
+                    task = self.tasks.get(handle.task_id)
                     if task is not None:
-                        task["state"] = "running"
-                        task["start"] = time.monotonic()
-
-                try:
-                    result = request["func"]()
-                    request["result_queue"].put(("success", result))
-                except Exception as e:
-                    request["result_queue"].put(("error", str(e)))
-                finally:
-                    with self.lock:
-                        self.tasks.pop(task_id, None)
-                    self.request_queue.task_done()
+                        task["state"] = "queued"
+                        task["decision"] = "preempted"
+                self._running_requests = []
+            self._notify(requests, "queued")
+            with self._available:
+                for request in requests:
+                    # Back where it was; the turn it had is not counted against its lane.
+                    self._lane_served[request["lane"]] -= 1
+            for request in requests:
+                self._enqueue(request)
+            return
+        except Exception as e:
+            for request in requests:
+                telemetry.count(request["category"], "calls")
+                # One settled before the error (earlier in a batch, or by whoever raced it)
+                # keeps its outcome: setting it again would raise here and end the worker.
+                if not request["future"].done():
+                    request["future"].set_exception(Exception(f"LLM error: {e}"))
+        with self.lock:
+            self._running_requests = []
+            for request in requests:
+                self.tasks.pop(request["handle"].task_id, None)
 
-            except queue.Empty:
-                continue
+    def _notify(self, requests, state: str):
+        if self.listener is not None:
+            for request in requests:
+                self.listener(request["handle"], state)
 
-    def generate_response(
-        self, prompt: str, system_prompt: str, category: str, max_tokens: int | None = None, raw: bool = False
-    ) -> str:
-        result_queue = Queue()
+    def warm_up(self, system_prefixes: list[str], lane=None) -> LLMFuture:
+        """Queue the evaluation of these openings of system prompts, see `warm_up_internal`.
+        The future's result is how many were evaluated and how many loaded from disk."""
+        return self._submit(lambda handle: warm_up_internal(system_prefixes, handle), WARM_UP, lane=lane)
 
-        def request_func():
-            return generate_response_internal(prompt, system_prompt, category, max_tokens=max_tokens, raw=raw)
+    def count_tokens(self, text: str) -> int:
+        return len(backend.tokenize(text))
 
-        task_id = self._register_task(category)
-        self._submit({"func": request_func, "result_queue": result_queue, "task_id": task_id}, category)
+    def get_metrics(self) -> dict:
+        """Live latency figures per category, see `llm.telemetry.LLMTelemetry.summary`."""
+        return telemetry.summary()
 
-        status, result = result_queue.get()
-        if status == "error":
-            raise Exception(f"LLM error: {result}")
-        return result
+    def generate_response(
+        self,
+        prompt: str,
+        system_prompt: str,
+        category: str,
+        max_tokens: int | None = None,
+        raw: bool = False,
+        grammar: str | None = None,
+    ) -> str:
+        return self.submit(prompt, system_prompt, category, max_tokens=max_tokens, raw=raw, grammar=grammar).result()
 
     def generate_response_stream(
         self,
@@ -138,167 +718,468 @@ class LLMRequestQueue:
         max_tokens: int | None = None,
         stop: list | None = None,
         poll=False,
-    ):
-        result_queue = Queue()
+        lane=None,
+    ) -> LLMStream:
         stream_queue = Queue()
 
-        def request_func():
-            for partial in generate_response_stream_internal(
-                prompt, system_prompt, category, max_tokens=max_tokens, stop=stop
-            ):
-                stream_queue.put(("chunk", partial))
+        def request_func(handle):
+            # A preempted stream starts over from its first token; the chunks are each the
+            # whole reply so far, so the restart simply overwrites what the reader had.
+            try:
+                # Read off the handle, not the call: a speculated greeting promoted to a first
+                # message (`RequestHandle.promote`) runs, is logged and is counted as one.
+                for partial in generate_response_stream_internal(
+                    prompt, system_prompt, handle.category, max_tokens=max_tokens, stop=stop, handle=handle
+                ):
+                    stream_queue.put(("chunk", partial))
+            except Preempted:
+                raise
+            except Exception:
+                # A failed call ends the stream: its reader would otherwise wait forever.
+                stream_queue.put(("done", None))
+                raise
             stream_queue.put(("done", None))
 
-        task_id = self._register_task(category)
-        self._submit({"func": request_func, "result_queue": result_queue, "task_id": task_id}, category)
+        handle = self._submit(request_func, category, lane=lane).handle
+        return LLMStream(handle, stream_chunks(stream_queue, handle, poll))
 
-        # Yield empty string immediately so UI doesn't block
-        yield ""
 
-        while True:
-            if poll:
-                # Drained rather than waited on: this generator is stepped once per frame
-                # from the main thread, and the worker may be busy with an earlier request
-                # (a closing conversation's quest analysis, world context, shop stock).
-                # Blocking here froze the whole game until that finished. None means
-                # "nothing new yet", the caller simply draws another frame.
-                try:
-                    status, data = stream_queue.get_nowait()
-                except queue.Empty:
-                    yield None
-                    continue
-            else:
-                status, data = stream_queue.get()
-            if status == "done":
-                break
-            yield data
+def stream_chunks(stream_queue: Queue, handle, poll: bool):
+    """What an `LLMStream` iterates: ("chunk", text) and ("done", None) entries off
+    `stream_queue`, put there by whoever runs the call, until done or cancelled."""
+    # Yield empty string immediately so UI doesn't block
+    yield ""
+
+    while True:
+        if poll:
+            # Drained rather than waited on: this generator is stepped once per frame
+            # from the main thread, and the worker may be busy with an earlier request
+            # (a closing conversation's quest analysis, world context, shop stock).
+            # Blocking here froze the whole game until that finished. None means
+            # "nothing new yet", the caller simply draws another frame.
+            try:
+                status, data = stream_queue.get_nowait()
+            except queue.Empty:
+                if handle.cancelled:
+                    break
+                yield None
+                continue
+        else:
+            try:
+                status, data = stream_queue.get(timeout=0.1)
+            except queue.Empty:
+                if handle.cancelled:
+                    break
+                continue
+        if status == "done":
+            break
+        yield data
 
 
 llm_queue = None
-llm = None
+backend: LLMBackend | None = None
+state_cache = PromptStateCache(c.Hyperparameters.STATE_CACHE_MB * 1024 * 1024)
+# Made with the first warm-up, for the backend loaded by then.
+warm_states: WarmStates | None = None
+telemetry = LLMTelemetry(c.Hyperparameters.TELEMETRY_WINDOW)
 _init_lock = threading.Lock()
 
 
+def use_backend(new_backend: LLMBackend):
+    """Run every call on this backend instead of loading the model, e.g. a `ScriptedBackend`
+    for a benchmark or a test. Must come before the first `get_llm_queue()`. The queue then
+    runs in this process, whatever `Hyperparameters.LLM_PROCESS` says: it is also how the
+    inference process sets itself up."""
+    global backend
+    with _init_lock:
+        if llm_queue is not None:
+            raise RuntimeError("LLM queue already started; use_backend() must be called first")
+        backend = new_backend
+
+
 def get_llm_queue():
-    global llm_queue, llm
+    global llm_queue, backend
     if llm_queue is None:
         with _init_lock:
             # Double-check pattern
             if llm_queue is None:  # double-checked after acquiring the lock
-                llm = Llama(
-                    model_path="./models/Qwen2.5-7B-Instruct-Q2_K.gguf",
-                    n_gpu_layers=c.Hyperparameters.GPU_LAYERS,
-                    verbose=False,
-                    n_ctx=c.Hyperparameters.CONTEXT_SIZE,
-                    flash_attn=True,
-                    use_mlock=True,
-                    n_threads=8,
-                    seed=int(time.time() * 1000) % (2**31),
-                )
-                llm_queue = LLMRequestQueue()
-                llm_queue.start()
+                new_queue = _connect_to_service() if backend is None else None
+                if new_queue is None:
+                    if backend is None and c.Hyperparameters.LLM_PROCESS:
+                        # Imported here: the inference process imports this module.
+                        from llm.inference_process import InferenceClient
+
+                        new_queue = InferenceClient()
+                    else:
+                        if backend is None:
+                            backend = LlamaCppBackend()
+                        new_queue = LLMRequestQueue()
+                    new_queue.start()
+                llm_queue = new_queue
     return llm_queue
 
 
+def _connect_to_service():
+    """A started client of the LLM service at `Hyperparameters.LLM_SERVICE`, or None when
+    there is none configured or it doesn't answer: then the model is loaded here instead."""
+    if not c.Hyperparameters.LLM_SERVICE:
+        return None
+    from llm.service import ServiceClient
+
+    client = ServiceClient(c.Hyperparameters.LLM_SERVICE)
+    try:
+        client.start()
+    except RuntimeError as e:
+        print(f"{e}; loading the model in this process")
+        return None
+    return client
+
+
 def get_llm_tasks():
     return get_llm_queue().get_active_tasks()
 
 
+def get_llm_metrics() -> dict:
+    """`get_metrics()` of the queue, {} if there is none yet. Never forces the model to load."""
+    return llm_queue.get_metrics() if llm_queue is not None else {}
+
+
 def llm_busy() -> bool:
-    """True while the worker has anything running or queued. One model serves the whole
-    game and a running call cannot be preempted, so a conversation opened on top of one
-    would sit there with an empty box until it finished; the interaction prompt says the
-    NPC is busy instead. Never forces the model to load: no queue means nothing in flight."""
-    return bool(llm_queue and llm_queue.get_active_tasks())
+    """True while a conversation opened now would sit on an empty box: dialogue already in
+    flight, or background work that can no longer be preempted (`holds_dialogue`). The
+    interaction prompt says the NPC is busy instead. Never forces the model to load: no
+    queue means nothing in flight."""
+    return bool(llm_queue and llm_queue.holds_dialogue())
+
+
+def count_tokens(text: str) -> int:
+    """Tokens `text` takes in the model's own tokenizer: budgets are about what the model
+    evaluates, which characters only approximate. Loads the model if nothing has yet, and
+    with the model in its own process it is a round trip to it: never for the frame's path,
+    which has `estimate_tokens`."""
+    return get_llm_queue().count_tokens(text)
+
+
+def estimate_tokens(text: str) -> int:
+    """`count_tokens` from the length alone (`CHARS_PER_TOKEN`), for a budget checked on
+    the main thread, which must not wait on the model."""
+    return len(text) // CHARS_PER_TOKEN + 1
 
 
-def generate_response_queued(prompt, system_prompt, log, max_tokens=None, raw=False):
-    return get_llm_queue().generate_response(prompt, system_prompt, log, max_tokens=max_tokens, raw=raw)
+def llm_idle() -> bool:
+    """True when nothing at all is queued or running: the only time speculative work is
+    worth starting. Pre-generation doesn't count, it gives way to whatever is submitted.
+    Never forces the model to load."""
+    return llm_queue is None or all(task["category"] == PREGENERATION for task in llm_queue.get_active_tasks())
 
 
-def generate_response_stream_queued(prompt, system_prompt, log, max_tokens=None, stop=None, poll=False):
-    yield from get_llm_queue().generate_response_stream(
+def drain_llm_callbacks():
+    """Per-frame hook for `submit(..., on_main=True)` callbacks. Never forces the model to
+    load: no queue means nothing was ever submitted."""
+    if llm_queue is not None:
+        llm_queue.drain_callbacks()
+
+
+def submit_queued(
+    prompt, system_prompt, log, max_tokens=None, raw=False, callback=None, on_main=False, grammar=None
+) -> LLMFuture:
+    """Non-blocking `generate_response_queued`: see `LLMRequestQueue.submit`."""
+    return get_llm_queue().submit(
+        prompt, system_prompt, log, max_tokens=max_tokens, raw=raw, callback=callback, on_main=on_main, grammar=grammar
+    )
+
+
+def generate_response_queued(prompt, system_prompt, log, max_tokens=None, raw=False, grammar=None):
+    return get_llm_queue().generate_response(
+        prompt, system_prompt, log, max_tokens=max_tokens, raw=raw, grammar=grammar
+    )
+
+
+def generate_response_stream_queued(prompt, system_prompt, log, max_tokens=None, stop=None, poll=False) -> LLMStream:
+    return get_llm_queue().generate_response_stream(
         prompt, system_prompt, log, max_tokens=max_tokens, stop=stop, poll=poll
     )
 
 
-def generate_response_internal(prompt, system_prompt, category, max_tokens=None, raw=False):
-    max_tokens = max_tokens or c.Hyperparameters.MAX_TOKENS
+def warm_up_queued(system_prefixes: list[str]) -> LLMFuture:
+    return get_llm_queue().warm_up(system_prefixes)
+
+
+def _restore_state(formatted: str, category: str):
+    """Put back the saved state of the conversation this dialogue call continues, if any.
+
+    Only dialogue is snapshotted: it is the one kind of call that comes back to the same
+    long prefix after other work has run in between. Nothing is copied when the model still
+    holds that state already (no other call ran since it was saved)."""
+    if category in SNAPSHOT_CATEGORIES:
+        snapshot = state_cache.lookup(formatted)
+        if snapshot is not None:
+            if snapshot is not state_cache.resident:
+                backend.load_state(snapshot.state)
+                state_cache.resident = snapshot
+            return
+    else:
+        # Whatever this call does to the model, finished or not, the resident state is gone.
+        state_cache.resident = None
+    _restore_warm_state(formatted)
+
+
+def _restore_warm_state(formatted: str):
+    """Failing a conversation of its own, put the model back to the longest warmed opening
+    of this prompt (`llm.warm_states`), when it holds less of the prompt than that."""
+    if warm_states is None:
+        return
+    warmed = warm_states.longest(formatted)
+    if warmed is None:
+        return
+    text, path, tokens = warmed
+    if backend.cached_prefix(formatted) >= tokens:
+        return
+    state_cache.resident = None
+    if not backend.load_state_file(path):
+        print(f"Warm state for {text[-40:]!r} failed to load; evaluating it again next time")
+        warm_states.forget(text)
+
+
+def _warm_states() -> WarmStates:
+    global warm_states
+    if warm_states is None:
+        warm_states = WarmStates.for_backend(backend)
+        os.makedirs(warm_states.directory, exist_ok=True)
+    return warm_states
+
+
+def warm_up_internal(system_prefixes: list[str], handle=None) -> dict:
+    """Evaluate how system prompts open, so the calls that open the same way start past it.
+
+    Each opening is formatted as a call's would be (`_system_head`) and cut back to its last
+    word: the prompt goes on with more words, and a trailing space is tokenized differently
+    on its own than before them. Its state file is loaded if an earlier launch left one, or
+    it is evaluated and saved. Checked between openings, so it can be cancelled or preempted
+    like any call; one warmed already is not warmed again when it runs a second time."""
+    store = _warm_states()
+    counts = {"evaluated": 0, "loaded": 0}
+    for prefix in system_prefixes:
+        if handle is not None and not handle.check():
+            break
+        text = _system_head(prefix).rstrip()
+        if store.knows(text):
+            continue
+        path = store.path_for(text)
+        # The model is about to hold something else than the conversation it held.
+        state_cache.resident = None
+        tokens = backend.load_state_file(path) if os.path.exists(path) else 0
+        if tokens:
+            counts["loaded"] += 1
+        else:
+            tokens = backend.prefill(text)
+            try:
+                backend.save_state_file(path)
+            except OSError as e:
+                print(f"Could not save a warm state: {e}")
+                continue
+            counts["evaluated"] += 1
+        store.add(text, path, tokens)
+    store.prune()
+    return counts
+
+
+def _reused_prefix(formatted: str) -> int:
+    """Prompt tokens the model already holds, for the telemetry; in the call log only with
+    `Hyperparameters.LOG_PREFIX_REUSE` (see `_logged`)."""
+    return backend.cached_prefix(formatted)
+
+
+def _logged(reused: int) -> int | None:
+    return reused if c.Hyperparameters.LOG_PREFIX_REUSE else None
+
+
+def _save_state(formatted: str, category: str):
+    """Snapshot the model after a dialogue call; any other call just leaves it overwritten."""
+    if category not in SNAPSHOT_CATEGORIES:
+        return
+    state = backend.save_state()
+    state_cache.save(formatted, state, backend.state_size(state))
+
+
+def generate_response_internal(prompt, system_prompt, category, max_tokens=None, raw=False, handle=None, grammar=None):
+    max_tokens = _scoped(max_tokens or c.Hyperparameters.MAX_TOKENS, handle)
     start = time.monotonic()
+    formatted = _format_prompt(prompt, system_prompt)
 
-    # No llm.reset(): keeping the KV cache lets llama_cpp skip re-evaluating the
-    # shared prefix (system prompt + prior turns) on each call.
-    response = llm(
-        prompt=_format_prompt(prompt, system_prompt),
-        max_tokens=max_tokens,
-        temperature=c.Hyperparameters.TEMPERATURE,
-        repeat_penalty=c.Hyperparameters.REPETITION_PENALTY,
-        stop=["<|im_end|>", "<|im_start|>"],
+    # A dialogue call that other work has run in front of gets its conversation's state
+    # put back first, so only the new line is evaluated.
+    _restore_state(formatted, category)
+    reused = _reused_prefix(formatted)
+    if handle is None:
+        response, first_token_at = backend.complete(formatted, max_tokens, STOPS, grammar), None
+    else:
+        # Streamed even though nobody reads it a token at a time: between tokens is the
+        # only place a call can be cancelled or preempted.
+        response, first_token_at = _complete_interruptibly(formatted, max_tokens, handle, grammar)
+    finished = time.monotonic()
+    duration = finished - start
+    _save_state(formatted, category)
+    telemetry.record(
+        category,
+        **call_metrics(response.prompt_tokens, response.completion_tokens, reused, start, first_token_at, finished),
     )
-    duration = time.monotonic() - start
 
-    generated_text = _strip_unsupported_glyphs(response.get("choices", [{}])[0].get("text", "").strip())
+    generated_text = _clean_reply(response.text, raw)
 
-    if not raw:
-        generated_text = generated_text.translate(CHAR_FILTER).strip("\n")
-        if "\n" in generated_text:
-            generated_text = generated_text.split("\n", 1)[0].strip()
-
-    usage = response.get("usage", {})
     llm_log.log_call(
         category=category,
         system_prompt=system_prompt,
         prompt=prompt,
         response=generated_text,
         duration=duration,
-        model_path=llm.model_path,
+        model_path=backend.model_path,
         max_tokens=max_tokens,
         temperature=c.Hyperparameters.TEMPERATURE,
         repeat_penalty=c.Hyperparameters.REPETITION_PENALTY,
         streaming=False,
-        prompt_tokens=usage.get("prompt_tokens"),
-        completion_tokens=usage.get("completion_tokens"),
+        prompt_tokens=response.prompt_tokens,
+        completion_tokens=response.completion_tokens,
+        cancelled=handle is not None and handle.cancelled,
+        constrained=grammar is not None,
+        reused_prompt_tokens=_logged(reused),
+        submitted=handle.submitted_at if handle is not None else None,
     )
 
     return generated_text
 
 
-def generate_response_stream_internal(prompt, system_prompt, category, max_tokens=None, stop=None):
-    # See generate_response_internal: skip reset() to reuse the cached prefix.
-    max_tokens = max_tokens or c.Hyperparameters.MAX_TOKENS
+def _clean_reply(text: str, raw: bool) -> str:
+    text = _strip_unsupported_glyphs(text.strip())
+    if not raw:
+        text = text.translate(CHAR_FILTER).strip("\n")
+        if "\n" in text:
+            text = text.split("\n", 1)[0].strip()
+    return text
+
+
+def generate_batch_internal(batch_args, handles):
+    """Several queued background calls run as one multi-sequence decode.
+
+    Their prompts have nothing in common to reuse, so run one after another each would pay a
+    full prompt evaluation and then a full decode on its own; together the prompts go
+    through the model in shared chunks and every decode step advances all of them at once.
+    The backend runs them in a context of its own, leaving the dialogue's state (and
+    `state_cache.resident`) as it was. Each call is logged on its own line, with the
+    duration of the whole batch and the batch's size."""
     start = time.monotonic()
-    stream = llm(
-        prompt=_format_prompt(prompt, system_prompt),
-        max_tokens=max_tokens,
-        temperature=c.Hyperparameters.TEMPERATURE,
-        repeat_penalty=c.Hyperparameters.REPETITION_PENALTY,
-        stream=True,
-        stop=["<|im_end|>", "<|im_start|>", *list(stop or [])],
-    )
+    formatted = [_format_prompt(prompt, system_prompt) for prompt, system_prompt, *_ in batch_args]
+    max_tokens = [
+        _scoped(args[3] or c.Hyperparameters.MAX_TOKENS, handle)
+        for args, handle in zip(batch_args, handles, strict=True)
+    ]
+    # A cancelled sequence drops out of the batch; a preempted one raises and takes the
+    # whole batch back to the queue with it.
+    responses = backend.complete_batch(formatted, max_tokens, STOPS, lambda i: handles[i].check())
+    duration = time.monotonic() - start
+
+    texts = []
+    for (prompt, system_prompt, category, _, raw), response, limit, handle in zip(
+        batch_args, responses, max_tokens, handles, strict=True
+    ):
+        text = _clean_reply(response.text, raw)
+        llm_log.log_call(
+            category=category,
+            system_prompt=system_prompt,
+            prompt=prompt,
+            response=text,
+            duration=duration,
+            model_path=backend.model_path,
+            max_tokens=limit,
+            temperature=c.Hyperparameters.TEMPERATURE,
+            repeat_penalty=c.Hyperparameters.REPETITION_PENALTY,
+            streaming=False,
+            prompt_tokens=response.prompt_tokens,
+            completion_tokens=response.completion_tokens,
+            cancelled=handle.cancelled,
+            batch_size=len(batch_args),
+            submitted=handle.submitted_at,
+            # The batch context is cleared for every batch: nothing carries over.
+            reused_prompt_tokens=0 if c.Hyperparameters.LOG_PREFIX_REUSE else None,
+        )
+        texts.append(text)
+    return texts
+
+
+def _complete_interruptibly(formatted: str, max_tokens: int, handle: RequestHandle, grammar=None):
+    """The call's `Completion`, and when its first token came (monotonic, None if none did)."""
+    stream = backend.stream(formatted, max_tokens, STOPS, grammar)
+    pieces = []
+    first_token_at = None
+    try:
+        for piece in stream:
+            if first_token_at is None:
+                first_token_at = time.monotonic()
+            if not handle.check():
+                break
+            pieces.append(piece)
+    finally:
+        stream.close()
+    return Completion("".join(pieces), len(backend.tokenize(formatted)), len(pieces)), first_token_at
+
+
+def generate_response_stream_internal(prompt, system_prompt, category, max_tokens=None, stop=None, handle=None):
+    max_tokens = _scoped(max_tokens or c.Hyperparameters.MAX_TOKENS, handle)
+    start = time.monotonic()
+    formatted = _format_prompt(prompt, system_prompt)
+    _restore_state(formatted, category)
+    reused = _reused_prefix(formatted)
+    # The player watches these type out, so a draft model's guesses are worth checking.
+    speculate = category in INTERACTIVE_CATEGORIES
+    stream = backend.stream(formatted, max_tokens, [*STOPS, *list(stop or [])], speculate=speculate)
 
     accumulated_text = ""
-    usage = {}
-    for output in stream:
-        new_token = output.get("choices", [{}])[0].get("text", "")
-        usage = output.get("usage", usage)
-
-        # Skip the blank line the model sometimes opens with, so the first real token
-        # isn't preceded by whitespace that the newline cut below would trip on.
-        if not accumulated_text.strip() and not new_token.strip():
-            continue
+    completion_tokens = 0
+    first_token_at = None
+    try:
+        for new_token in stream:
+            if first_token_at is None:
+                first_token_at = time.monotonic()
+            # Checked between tokens: a reply nobody will read stops here, not at max_tokens.
+            if handle is not None and not handle.check():
+                break
+            completion_tokens += 1
 
-        accumulated_text += new_token
-        # Everything past the first line break is the model carrying on past its reply,
-        # often writing the player's next turn. Cut it here rather than trusting the
-        # tokenizer to hand us a token that is exactly "\n".
-        if "\n" in accumulated_text:
-            accumulated_text = accumulated_text.split("\n", 1)[0]
-            yield _strip_unsupported_glyphs(accumulated_text).translate(CHAR_FILTER)
-            break
+            # Skip the blank line the model sometimes opens with, so the first real token
+            # isn't preceded by whitespace that the newline cut below would trip on.
+            if not accumulated_text.strip() and not new_token.strip():
+                continue
 
-        yield _strip_unsupported_glyphs(accumulated_text).translate(CHAR_FILTER)
+            accumulated_text += new_token
+            # Everything past the first line break is the model carrying on past its reply,
+            # often writing the player's next turn. Cut it here rather than trusting the
+            # tokenizer to hand us a token that is exactly "\n".
+            if "\n" in accumulated_text:
+                accumulated_text = accumulated_text.split("\n", 1)[0]
+                yield _strip_unsupported_glyphs(accumulated_text).translate(CHAR_FILTER)
+                break
 
-    duration = time.monotonic() - start
+            yield _strip_unsupported_glyphs(accumulated_text).translate(CHAR_FILTER)
+    finally:
+        # Finish the backend's generator before snapshotting, so the state saved is the one
+        # it leaves behind rather than one it is still in the middle of. A preempted stream
+        # raises out of the loop and never reaches the snapshot: it will be run again.
+        stream.close()
+    finished = time.monotonic()
+    duration = finished - start
+    if handle is not None:
+        # Promoted while it ran: it ends as what the player was waiting on.
+        category = handle.category
+    _save_state(formatted, category)
+    # A stream reports no usage of its own: each chunk is one token, and the prompt is
+    # counted by the backend's tokenizer.
+    prompt_tokens = len(backend.tokenize(formatted))
+    drafted, accepted = backend.draft_counts if speculate else (0, 0)
+    telemetry.record(
+        category,
+        **call_metrics(prompt_tokens, completion_tokens, reused, start, first_token_at, finished),
+        draft_acceptance=accepted / drafted if drafted else None,
+    )
     accumulated_text = _strip_unsupported_glyphs(accumulated_text)
     llm_log.log_call(
         category=category,
@@ -306,11 +1187,16 @@ def generate_response_stream_internal(prompt, system_prompt, category, max_token
         prompt=prompt,
         response=accumulated_text.translate(CHAR_FILTER),
         duration=duration,
-        model_path=llm.model_path,
+        model_path=backend.model_path,
         max_tokens=max_tokens,
         temperature=c.Hyperparameters.TEMPERATURE,
         repeat_penalty=c.Hyperparameters.REPETITION_PENALTY,
         streaming=True,
-        prompt_tokens=usage.get("prompt_tokens"),
-        completion_tokens=usage.get("completion_tokens"),
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cancelled=handle is not None and handle.cancelled,
+        reused_prompt_tokens=_logged(reused),
+        draft_tokens=drafted or None,
+        accepted_draft_tokens=accepted if drafted else None,
+        submitted=handle.submitted_at if handle is not None else None,
     )
@@ -1,12 +1,18 @@
 from core.utils import parse_shop_inventories
 from game.loot import roll_shop_stock
-from llm.llm_request_queue import generate_response_queued
+from llm import grammars
+from llm.llm_request_queue import LLMFuture, submit_queued
 
 # What each shop trades in, so a batch of shops comes back varied instead of three
 # lists of the same moonlit blade. Cycled if a world ever has more shops than roles.
 SHOP_ROLES = ("blacksmith (weapons and armor)", "alchemist (potions and charms)", "general trader (odds and ends)")
 
 ITEMS_PER_SHOP = 4
+# The types the prompt offers; the grammar holds the model to them.
+ITEM_TYPES = ("weapon", "armor", "shield", "accessory", "potion", "misc")
+# What an item may cost, inclusive. The prompt asks for it, the grammar holds the model to
+# it, and a reply from a backend that ignores grammars is clamped into it.
+PRICE_RANGE = (5, 80)
 # One line per item is roughly 15 tokens; leave room for the model to be a bit verbose.
 TOKENS_PER_ITEM = 22
 
@@ -15,17 +21,15 @@ def _roles(shop_count: int) -> list:
     return [SHOP_ROLES[i % len(SHOP_ROLES)] for i in range(shop_count)]
 
 
-def generate_shop_inventories(context: str, shop_count: int) -> list:
+def request_shop_inventories(context: str, shop_count: int, callback) -> LLMFuture:
     """Stock every merchant in the world with a single LLM call.
 
     One call instead of one per merchant: shop generation used to be the most expensive
     thing the queue did, and the per-merchant prompts were identical, so the shops came
-    out identical too. Any shop the model fails to fill falls back to a procedural roll
-    rather than a second request.
+    out identical too. `callback(future)` gets the reply on the main thread, to be read
+    with `shop_inventories_from`. The reply is grammar-constrained to exactly
+    `ITEMS_PER_SHOP` well-formed lines per shop, so generation stops after the last one.
     """
-    if shop_count <= 0:
-        return []
-
     roles = _roles(shop_count)
     shop_list = "\n".join(f"{i + 1}. {role}" for i, role in enumerate(roles))
     system_prompt = "You stock RPG shops. Reply with the item lines only, no other text."
@@ -39,17 +43,28 @@ def generate_shop_inventories(context: str, shop_count: int) -> list:
         "Rules: shop is the shop number. "
         'type is "weapon", "armor", "shield", "accessory", "potion" or "misc". '
         'rarity is "common", "uncommon", "rare", "epic" or "legendary" (mostly common or uncommon). '
-        "price is 5 to 80. "
+        f"price is {PRICE_RANGE[0]} to {PRICE_RANGE[1]}. "
         "Each shop's items fit its trade, suit the world, and differ from the other shops'. "
         "No headers, no numbering, no commentary."
     )
-    response = generate_response_queued(
+    return submit_queued(
         prompt,
         system_prompt,
         "Shop generation",
         max_tokens=shop_count * ITEMS_PER_SHOP * TOKENS_PER_ITEM,
         raw=True,
+        callback=callback,
+        on_main=True,
+        grammar=grammars.shop_stock(shop_count, ITEMS_PER_SHOP, ITEM_TYPES, PRICE_RANGE),
     )
 
+
+def shop_inventories_from(response: str, shop_count: int) -> list:
+    """One stock list per shop out of the model's reply. Any shop the model failed to fill
+    falls back to a procedural roll rather than a second request."""
     stocks = parse_shop_inventories(response, shop_count)
+    low, high = PRICE_RANGE
+    for stock in stocks:
+        for entry in stock:
+            entry["price"] = min(high, max(low, entry["price"]))
     return [stock or roll_shop_stock(ITEMS_PER_SHOP) for stock in stocks]
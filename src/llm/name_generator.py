@@ -1,13 +1,47 @@
 from __future__ import annotations
 
+import re
 import threading
 from typing import TYPE_CHECKING
 
-from llm.llm_request_queue import generate_response_queued
+import core.constants as c
+from llm.llm_request_queue import CHAR_FILTER, submit_queued
 
 if TYPE_CHECKING:
     from core.save import SaveSystem
 
+# "1. Elena", "2) Bran Thatcher", "- Mira": the markers a list reply puts in front of each item.
+_LIST_MARKER_RE = re.compile(r"^\s*(?:\d+\s*[.):-]|[-*•])\s*")
+
+# Room for one item of either list: a name with an epithet, or a twelve-word taunt.
+TOKENS_PER_ITEM = 24
+
+
+def numbered_items(reply: str) -> list[str]:
+    """The items of a numbered list reply, markers and quotes stripped. Only the numbered
+    lines when there are any, so a "Here are eight names:" before the list is not taken as
+    one; a reply that ignored the numbering is read a line per item."""
+    lines = [line for line in reply.splitlines() if line.strip()]
+    numbered = [line for line in lines if _LIST_MARKER_RE.match(line)]
+    items = []
+    for line in numbered or lines:
+        item = _LIST_MARKER_RE.sub("", line).translate(CHAR_FILTER).strip().strip("'").strip()
+        if item:
+            items.append(item)
+    return items
+
+
+def _names_preamble(context: str) -> str:
+    """How every name list's system prompt opens, the same for every call in a world."""
+    count = c.Hyperparameters.NAME_BATCH
+    return (
+        f"You are an NPC generator for an RPG. Context: {context}. "
+        f"Reply with a numbered list of {count} different realistic names for NPCs, one per "
+        "line (first name, optionally with a last name), for example 'Elena', 'Bran "
+        "Thatcher', or 'Mira the herbalist'. You may optionally add a short profession or "
+        "epithet after a name, but never write a profession alone. No explanation."
+    )
+
 
 class NPCNameGenerator:
     def __init__(self, save_system):
@@ -30,17 +64,19 @@ class NPCNameGenerator:
         self.closed = True
 
     def start_generation(self):
-        """Ensure one name is being prepared ahead of the next NPC that needs one."""
+        """Ensure names are being prepared ahead of the NPCs that will need them: a batch is
+        asked for whenever the buffer is down to `NAME_LOW_WATER`."""
         with self.cond:
-            if self.closed or self.is_generating or self.ready_names:
+            if self.closed or self.is_generating or len(self.ready_names) > c.Hyperparameters.NAME_LOW_WATER:
                 return
             self.is_generating = True
 
-        threading.Thread(target=self._generate_name_background, daemon=True).start()
+        # No thread of its own: the request is queued once the world has a context to
+        # name people after, and the reply is filed from the LLM worker.
+        self.save_system.when_context(self._request_name)
 
-    def _generate_name_background(self):
-        context = self.save_system.await_context(lambda: self.closed)
-        if context is None:
+    def _request_name(self, context: str):
+        if self.closed:
             return
 
         with self.cond:
@@ -49,30 +85,53 @@ class NPCNameGenerator:
         already_generated = (
             f" Names already generated, do not reuse any of them: {', '.join(used_names)}." if used_names else ""
         )
-        system_prompt = (
-            f"You are an NPC generator for an RPG. Context: {context}. "
-            "Reply with ONE realistic name for an NPC (first name, optionally with a last "
-            "name), for example 'Elena', 'Bran Thatcher', or 'Mira the herbalist'. You may "
-            "optionally add a short profession or epithet after the name, but never reply "
-            "with a profession alone. Single line, no explanation."
-            f"{already_generated}"
+        count = c.Hyperparameters.NAME_BATCH
+        # A list per call rather than a name per call: the prompt (and the used-name list in
+        # it, which only grows) is evaluated once for the whole batch instead of once a name.
+        system_prompt = _names_preamble(context) + already_generated
+        prompt = f"Generate {count} names for RPG NPCs."
+
+        submit_queued(
+            prompt,
+            system_prompt,
+            "Name generation",
+            max_tokens=count * TOKENS_PER_ITEM,
+            raw=True,
+            callback=self._on_names,
         )
-        prompt = "Generate a name for an RPG NPC."
 
-        name = generate_response_queued(prompt, system_prompt, "Name generation").strip()
+    def _on_names(self, future):
+        try:
+            names = numbered_items(future.result())
+        except Exception:
+            # Cancelled or failed: nothing to file, but the next get_name must be able to
+            # ask again rather than wait on a generation that will never land.
+            names = []
 
         with self.cond:
-            self.ready_names.append(name)
-            self.used_names.append(name)
+            # The model repeats itself within a list as readily as across calls. A list with
+            # nothing new in it is kept regardless: get_name may be waiting on it, and asking
+            # again would only loop on the same answer, so a repeat beats a nameless NPC.
+            used = {name.lower() for name in self.used_names}
+            fresh = [name for name in names if name.lower() not in used] or names
+            seen = set()
+            for name in fresh:
+                if name.lower() not in seen:
+                    seen.add(name.lower())
+                    self.ready_names.append(name)
+                    self.used_names.append(name)
             self.is_generating = False
             self.cond.notify_all()
         self.persist()
 
-    def get_name(self) -> str:
-        """Return a prepared name, kicking off generation and waiting if none is buffered."""
+    def get_name(self, wait: bool = True) -> str | None:
+        """Return a prepared name, kicking off generation and waiting if none is buffered.
+        With `wait=False` an empty buffer returns None instead (and still starts a refill)."""
         with self.cond:
             while not self.ready_names:
                 self.start_generation()  # no-op if already generating; re-entrant lock
+                if not wait:
+                    return None
                 self.cond.wait(timeout=0.5)
             name = self.ready_names.pop(0)
         self.persist()
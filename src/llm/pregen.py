@@ -0,0 +1,233 @@
+"""Content made while the model would otherwise sit idle, kept until the game wants it.
+
+Between conversations the worker often has nothing queued, while several things the player
+will soon wait on need nothing but the world's context: an omen before a blood night, the
+name of the next boss, the name of a village about to load in, the context of the next new
+world. Each is a `ContentPool`, declared by the code that uses it: items kept ready per key
+(an omen's instruction, a boss kind, a village size), each made by the same prompt the code
+would otherwise send on the spot.
+
+The harvester thread asks for one item at a time, and only once the queue is idle
+(`llm_idle`). It asks under the "Pre-generation" category, which the queue serves after
+anything else and calls off as soon as anything else is submitted (`_yield_idle`). Consumers
+`take` from a pool first and call the model only when it is empty; `submit_pooled` does both
+for a consumer that submits with a callback. The pools are saved to `Pregen.PATH`, apart
+from the save, since a new game clears the save and the next world's context is exactly
+what it wants. A pool made for a world (`per_world`) holds items for the world last passed
+to `set_world` only, and is emptied when another world takes its place.
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import core.constants as c
+import llm.llm_request_queue as q
+from llm.llm_request_queue import PREGENERATION, LLMFuture
+
+
+@dataclass(frozen=True)
+class ContentPool:
+    name: str
+    # The calls made for it when it runs dry: what they are logged and scheduled as.
+    category: str
+    keys: tuple[str, ...]
+    # (context, key) -> (prompt, system_prompt). The context is None for a pool that isn't
+    # per world.
+    build: Callable[[str | None, str], tuple[str, str]]
+    # Items kept ready per key.
+    target: int
+    per_world: bool = True
+    max_tokens: int | None = None
+
+
+_pools: dict[str, ContentPool] = {}
+
+
+def register_pool(pool: ContentPool) -> ContentPool:
+    _pools[pool.name] = pool
+    return pool
+
+
+def _world_key(context: str) -> str:
+    return hashlib.sha1(context.encode("utf-8")).hexdigest()[:16]
+
+
+class PoolStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        # pool name -> key -> items, oldest first.
+        self.items: dict[str, dict[str, list[str]]] = {}
+        # The world the per-world items were made for, and its context while it is played.
+        self.world = None
+        self.context = None
+        self._dirty = False
+        self._inflight = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        self.world = data.get("world")
+        self.items = data.get("items", {})
+
+    def save_if_dirty(self):
+        with self.lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            data = {"world": self.world, "items": {name: dict(keys) for name, keys in self.items.items()}}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp, self.path)
+
+    def set_world(self, context: str | None):
+        """The world being played, or None between games. Items made for another world are
+        dropped; with None they are kept, and none are made, until a world is set again."""
+        with self.lock:
+            self.context = context
+            if context is None:
+                return
+            key = _world_key(context)
+            if key == self.world:
+                return
+            self.world = key
+            for name in list(self.items):
+                pool = _pools.get(name)
+                if pool is None or pool.per_world:
+                    del self.items[name]
+            self._dirty = True
+
+    def take(self, pool: ContentPool, key: str) -> str | None:
+        """The oldest item ready for `key`, or None when there is none."""
+        with self.lock:
+            if pool.per_world and self.context is None:
+                return None
+            ready = self.items.get(pool.name, {}).get(key)
+            if not ready:
+                return None
+            self._dirty = True
+            return ready.pop(0)
+
+    def _wanted(self) -> tuple[ContentPool, str] | None:
+        """The first pool and key short of their target, in the order pools were declared."""
+        with self.lock:
+            for pool in _pools.values():
+                if pool.per_world and self.context is None:
+                    continue
+                for key in pool.keys:
+                    if len(self.items.get(pool.name, {}).get(key, [])) < pool.target:
+                        return pool, key
+        return None
+
+    def _file(self, pool: ContentPool, key: str, world: str | None, future):
+        """Keep a finished item, unless it was called off or its world was left meanwhile."""
+        if future.cancelled() or future.exception() is not None:
+            return
+        text = future.result().strip()
+        with self.lock:
+            if not text or (pool.per_world and world != self.world):
+                return
+            self.items.setdefault(pool.name, {}).setdefault(key, []).append(text)
+            self._dirty = True
+
+    def harvest_once(self):
+        """Ask for one missing item if the model is idle and nothing is being made already.
+        Never forces the model to load."""
+        if self._inflight is not None and not self._inflight.done():
+            return
+        if q.llm_queue is None or not q.llm_idle():
+            return
+        wanted = self._wanted()
+        if wanted is None:
+            return
+        pool, key = wanted
+        with self.lock:
+            context, world = self.context, self.world
+        prompt, system_prompt = pool.build(context if pool.per_world else None, key)
+        self._inflight = q.submit_queued(
+            prompt,
+            system_prompt,
+            PREGENERATION,
+            max_tokens=pool.max_tokens,
+            callback=lambda future: self._file(pool, key, world, future),
+        )
+
+    def _run(self):
+        while True:
+            time.sleep(c.Pregen.IDLE_POLL_S)
+            try:
+                self.harvest_once()
+                self.save_if_dirty()
+            except Exception as e:
+                print(f"Pre-generation failed: {type(e).__name__}: {e}")
+
+
+_store = None
+_store_lock = threading.Lock()
+_harvesting = False
+
+
+def get_pool_store() -> PoolStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PoolStore(c.Pregen.PATH)
+    return _store
+
+
+def start_harvester():
+    """Start filling the pools whenever the model is idle, for the rest of the process."""
+    global _harvesting
+    store = get_pool_store()
+    with _store_lock:
+        if _harvesting:
+            return
+        _harvesting = True
+    threading.Thread(target=store._run, daemon=True).start()
+    # What was taken since the last save must not be handed out again next launch.
+    atexit.register(store.save_if_dirty)
+
+
+def set_world(context: str | None):
+    get_pool_store().set_world(context)
+
+
+def take(pool: ContentPool, key: str) -> str | None:
+    return get_pool_store().take(pool, key)
+
+
+def submit_pooled(pool: ContentPool, key: str, context: str | None, callback=None, on_main: bool = False) -> LLMFuture:
+    """`submit_queued` for an item of `pool`: settled at once from the pool when it has one
+    for `key`, with `callback` run the way `submit_queued` would run it, otherwise asked of
+    the model under the pool's own category."""
+    item = take(pool, key)
+    if item is None:
+        prompt, system_prompt = pool.build(context, key)
+        return q.submit_queued(
+            prompt, system_prompt, pool.category, max_tokens=pool.max_tokens, callback=callback, on_main=on_main
+        )
+    future = LLMFuture()
+    future.set_result(item)
+    if callback is not None:
+        if on_main:
+            q.get_llm_queue().call_on_main(callback, future)
+        else:
+            callback(future)
+    return future
@@ -12,7 +12,8 @@ from game.entities.items import Item, item_type_from_name, roll_bonus, roll_rari
 from game.entities.npcs import NPC
 from game.loot import roll_reward_item
 from game.quest import COUNTED_QUEST_TYPES, Quest
-from llm.llm_request_queue import generate_response_queued
+from llm import grammars
+from llm.llm_request_queue import LLMFuture, generate_response_queued, submit_queued
 
 if TYPE_CHECKING:
     from game.entities.player import Player
@@ -32,6 +33,82 @@ def coin_band(quest: Quest) -> tuple[int, int]:
     return round(floor * mult), round(ceiling * mult)
 
 
+_ANALYZER_SYSTEM_PROMPT = (
+    "You are a conversation analyzer for an RPG game. "
+    "Analyze the conversation and determine whether the NPC gave the player a quest, "
+    "and whether the player agreed to do it. "
+    "A quest is one of: "
+    "fetch (bring back a specific item), "
+    "kill_mob (kill a number of a kind of monster or creature), "
+    "loot_mob (kill monsters of a kind until a specific item drops from them), "
+    "recover_stolen (recover a specific item that was stolen from the NPC by someone else), "
+    "slay_boss (defeat a single powerful named boss, beast or warlord terrorizing the area), "
+    "clear_camp (wipe out a bandit camp in the wilds), "
+    "steal (steal a specific item from a neighbour's house), "
+    "deliver (carry a specific item to another person and come back). "
+    "Set player_accepted to false if the player refused, changed the subject, left without "
+    "answering, or only listened to a rumour or a complaint."
+)
+
+
+def _conversation_block(conversation_history: str) -> str:
+    return f"Conversation:\n{conversation_history}\n\n"
+
+
+# What `quest_cues` makes of a transcript.
+NO_QUEST = "none"
+ACCEPTED = "accepted"
+UNSURE = "unsure"
+
+# An NPC line that may be handing out work: asking for something, naming a target or a
+# payment. Deliberately broad, since a miss here is a quest lost; talk that trips it
+# without being an offer only costs the two-token check.
+_OFFER_CUES = re.compile(
+    r"\b(help|need|bring|fetch|find|retrieve|recover|return|stole|stolen|thie(f|ves)|kill|slay|hunt|"
+    r"clear|bandits?|camp|beasts?|monsters?|deliver|carry|reward|coins?|gold|pay|task|quest|job|"
+    r"favou?r|errand|could you|would you|will you|can you)\b",
+    re.IGNORECASE,
+)
+# A player line that agrees, and one that turns down or backs out. The refusals leave out
+# words that open acceptances as often ("no problem", "don't worry", "sorry, I'll go"), and
+# only ever make an answer UNSURE: a quest dropped here is lost for good, while a wrong
+# UNSURE costs the two-token check.
+_ACCEPT_CUES = re.compile(
+    r"\b(yes|yeah|yep|sure|ok(ay)?|alright|all right|deal|agreed?|accept|of course|certainly|gladly|"
+    r"i'?ll|i will|count me in|consider it done|on it|leave it to me)\b",
+    re.IGNORECASE,
+)
+_REFUSE_CUES = re.compile(
+    r"\b(nope|not now|can'?t|cannot|won'?t|will not|decline|refuse|not interested|busy|goodbye|farewell)\b",
+    re.IGNORECASE,
+)
+
+
+def quest_cues(conversation_history: str) -> str:
+    """Whether this transcript (`ConversationHistory.format_for_prompt`) can hold an agreed
+    quest, from its words alone: NO_QUEST when no NPC line sounds like an offer, or the
+    player never answered one; ACCEPTED when the player's last answer to it only agrees;
+    UNSURE otherwise, a refusal included. A folded summary counts as the NPC's."""
+    offered = answered = agreed = False
+    for line in conversation_history.splitlines():
+        speaker, _, text = line.partition(": ")
+        if speaker == "Player":
+            if not offered:
+                continue
+            answered = True
+            accepting, refusing = bool(_ACCEPT_CUES.search(text)), bool(_REFUSE_CUES.search(text))
+            # A question back or a haggle leaves the last real answer standing.
+            if accepting or refusing:
+                agreed = accepting and not refusing
+        elif _OFFER_CUES.search(line):
+            offered = True
+    if not answered:
+        return NO_QUEST
+    if agreed:
+        return ACCEPTED
+    return UNSURE
+
+
 class QuestSystem:
     def __init__(self, items, player, npcs):
         self.items: list[Item] = items
@@ -68,28 +145,52 @@ class QuestSystem:
             return None
         return max(candidates, key=lambda npc: npc.distance_to_point((giver.x, giver.y)))
 
-    def analyze_conversation_for_quest(self, conversation_history: str) -> dict:
-        """Returns {has_quest, quest_type, quest_description, item_name, monster_hint,
-        kill_count, reward_item}. `has_quest` already accounts for the player's answer: a
-        task the player turned down is not a quest, however clearly the NPC offered it."""
-        system_prompt = (
-            "You are a conversation analyzer for an RPG game. "
-            "Analyze the conversation and determine whether the NPC gave the player a quest, "
-            "and whether the player agreed to do it. "
-            "A quest is one of: "
-            "fetch (bring back a specific item), "
-            "kill_mob (kill a number of a kind of monster or creature), "
-            "loot_mob (kill monsters of a kind until a specific item drops from them), "
-            "recover_stolen (recover a specific item that was stolen from the NPC by someone else), "
-            "slay_boss (defeat a single powerful named boss, beast or warlord terrorizing the area), "
-            "clear_camp (wipe out a bandit camp in the wilds), "
-            "steal (steal a specific item from a neighbour's house), "
-            "deliver (carry a specific item to another person and come back). "
-            "Set player_accepted to false if the player refused, changed the subject, left without "
-            "answering, or only listened to a rumour or a complaint. "
-            "Reply ONLY with valid JSON, with no extra text."
+    def analyze_conversation_for_quest(self, conversation_history: str, callback) -> LLMFuture | None:
+        """Hand `callback` the quest agreed on in this conversation, on the main thread, as
+        {has_quest, quest_type, quest_description, item_name, monster_hint, kill_count,
+        reward_item}, or never call it when there was none.
+
+        The full analysis is a long JSON reply, and most conversations have no quest in them,
+        so two cheaper stages come first. `quest_cues` reads the transcript: no task offered,
+        or offered and never answered, and that is the end of it; offered and plainly
+        agreed to, and the analysis is queued at once. Anything it can't call either way gets
+        a yes/no from the model (`_confirm_quest`, two tokens) when `QUEST_CHECK_CALL` is
+        on, and the analysis only on a yes. Returns the first call queued, or None."""
+        verdict = quest_cues(conversation_history)
+        if verdict == NO_QUEST:
+            return None
+        if verdict == ACCEPTED or not c.Hyperparameters.QUEST_CHECK_CALL:
+            return self._extract_quest(conversation_history, callback)
+        return self._confirm_quest(conversation_history, callback)
+
+    def _confirm_quest(self, conversation_history: str, callback) -> LLMFuture:
+        """Ask whether a task was offered and agreed to, and queue the analysis on a yes. The
+        question opens like the analysis (same system prompt, same transcript), so after a
+        yes the model has the conversation evaluated already and only reads the JSON format."""
+        prompt = (
+            f"{_conversation_block(conversation_history)}"
+            "Did the NPC give the player a task, and did the player agree to do it? Answer yes or no."
         )
 
+        def answered(future):
+            if future.exception() is None and future.result().strip().lower().startswith("yes"):
+                self._extract_quest(conversation_history, callback)
+
+        return submit_queued(
+            prompt,
+            _ANALYZER_SYSTEM_PROMPT,
+            "Quest check",
+            max_tokens=2,
+            callback=answered,
+            grammar=grammars.yes_no(),
+        )
+
+    def _extract_quest(self, conversation_history: str, callback) -> LLMFuture:
+        """Queue the analysis and hand `callback` the result on the main thread. `has_quest`
+        already accounts for the player's answer: a task the player turned down is not a
+        quest, however clearly the NPC offered it. A call that fails or is cancelled never
+        reaches the callback. The reply is grammar-constrained to the JSON below, with
+        `quest_type` limited to the types `_QUEST_BUILDERS` knows."""
         json_format = (
             '{"has_quest": true/false, "player_accepted": true/false,'
             ' "quest_type": "fetch/kill_mob/loot_mob/recover_stolen/slay_boss/clear_camp/steal/deliver",'
@@ -104,14 +205,24 @@ class QuestSystem:
             " 'item_name': '', 'monster_hint': '', 'kill_count': '', 'reward_item': ''}"
         )
         prompt = (
-            f"Conversation:\n{conversation_history}\n\n"
-            f"Analyze this conversation. Reply with this exact JSON format:\n"
+            f"{_conversation_block(conversation_history)}"
+            f"Analyze this conversation. Reply ONLY with this exact JSON format, with no extra text:\n"
             f"{json_format}\n"
             f"If there is no quest, use: {no_quest}"
         )
 
-        response = generate_response_queued(prompt, system_prompt, "Conversation analyze")
-        return parse_response_quest_analysis(response)
+        def analyzed(future):
+            if future.exception() is None:
+                callback(parse_response_quest_analysis(future.result()))
+
+        return submit_queued(
+            prompt,
+            _ANALYZER_SYSTEM_PROMPT,
+            "Conversation analyze",
+            callback=analyzed,
+            on_main=True,
+            grammar=grammars.quest_analysis(_QUEST_BUILDERS),
+        )
 
     def create_quest_from_analysis(self, npc: NPC, quest_info: dict, npc_name_generator: NPCNameGenerator):
         """Turn the model's reading of the conversation into a real quest, or into nothing.
@@ -337,9 +448,8 @@ class QuestSystem:
             return stolen
         return None
 
-    def on_delivery(self, npc: NPC) -> Quest | None:
-        """Hand a parcel over to the person it was for, when the player talks to them. The
-        quest itself is still handed in to whoever gave it: the reward is theirs to pay."""
+    def pending_delivery(self, npc: NPC) -> Quest | None:
+        """The delivery the player is carrying for this NPC, if any, without handing it over."""
         for quest in self.active_quests:
             if quest.quest_type != "deliver" or quest.recipient_npc_name != npc.name:
                 continue
@@ -347,13 +457,21 @@ class QuestSystem:
                 continue
             if quest.item not in self.player.inventory:
                 continue
-            self.player.inventory.remove(quest.item)
-            if quest.item in self.items:
-                self.items.remove(quest.item)
-            quest.kills_done = quest.kill_count
             return quest
         return None
 
+    def on_delivery(self, npc: NPC) -> Quest | None:
+        """Hand a parcel over to the person it was for, when the player talks to them. The
+        quest itself is still handed in to whoever gave it: the reward is theirs to pay."""
+        quest = self.pending_delivery(npc)
+        if quest is None:
+            return None
+        self.player.inventory.remove(quest.item)
+        if quest.item in self.items:
+            self.items.remove(quest.item)
+        quest.kills_done = quest.kill_count
+        return quest
+
     def on_npc_killed(self, npc: NPC) -> Item | None:
         """Drop the stolen item this NPC was carrying, if they're the thief of an active quest."""
         for quest in self.active_quests:
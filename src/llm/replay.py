@@ -0,0 +1,176 @@
+"""Replay a recorded call log against the current backend and queue, and time it.
+
+Every call the game makes is in logs/llm_calls.jsonl with its category, prompts and
+`max_tokens`, and when it finished. This puts the same calls through `LLMRequestQueue` again,
+with the settings in `core.constants` as they are now (threads, context size, model file,
+batching, deadlines), at the moments they were first made or compressed by `--speed`. It
+then prints p50/p95/p99 queue wait, time to first token and decode rate per category, from
+the queue's own telemetry (`llm.telemetry`). So a change to any of those can be measured on
+the game's real mix of dialogue, naming and quest analysis, not on a single prompt:
+
+    python -m llm.replay logs/llm_calls.jsonl --speed 4
+    python -m llm.replay logs/llm_calls.jsonl --category "First message" --limit 50 --speed 0
+
+A call's arrival is when it was submitted (`submitted`, to the millisecond), so the time it
+waited in the game's queue is part of the pattern replayed rather than lost. A log written
+before that field existed falls back to when its line was written less its duration, to the
+second, which is when the call started running, not when it was asked for.
+
+What a replay cannot repeat: the grammar of a constrained call (the log only says there was
+one), and the stop strings the dialogue adds. Neither changes what the prompt costs; both
+can make a reply run longer than it did in the game. The replay's own calls are logged to
+`--log-to`, never to the file being read.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from datetime import datetime
+
+from core import llm_log
+from llm.backends import LlamaCppBackend, ScriptedBackend
+from llm.telemetry import LLMTelemetry
+
+FIGURES = (
+    ("queue_wait_s", "wait s"),
+    ("ttft_s", "ttft s"),
+    ("decode_tps", "tok/s"),
+    ("draft_acceptance", "draft kept"),
+)
+
+
+def load_calls(path: str, categories=None, limit: int | None = None) -> list[dict]:
+    """The call records of a log, oldest first, each with its `arrival` in seconds from the
+    first. Metrics and parse-failure lines are skipped, and so is anything outside
+    `categories` when given."""
+    calls = []
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            if "prompt" not in entry or "system_prompt" not in entry:
+                continue
+            if categories and entry["category"] not in categories:
+                continue
+            if "submitted" in entry:
+                entry["arrival"] = datetime.fromisoformat(entry["submitted"]).timestamp()
+            else:
+                finished = datetime.fromisoformat(entry["timestamp"]).timestamp()
+                entry["arrival"] = finished - entry.get("duration_seconds", 0.0)
+            calls.append(entry)
+    calls.sort(key=lambda entry: entry["arrival"])
+    if limit:
+        calls = calls[:limit]
+    if calls:
+        start = calls[0]["arrival"]
+        for entry in calls:
+            entry["arrival"] -= start
+    return calls
+
+
+def _submit(llm_queue, entry: dict):
+    """Queue one recorded call; something that finishes when the call does."""
+    if entry.get("streaming"):
+        stream = llm_queue.generate_response_stream(
+            entry["prompt"], entry["system_prompt"], entry["category"], max_tokens=entry.get("max_tokens")
+        )
+        # Read to the end, as the dialogue box would, on a thread of its own.
+        reader = threading.Thread(target=lambda: [None for _ in stream], daemon=True)
+        reader.start()
+        return reader.join
+    future = llm_queue.submit(
+        entry["prompt"], entry["system_prompt"], entry["category"], max_tokens=entry.get("max_tokens"), raw=True
+    )
+    return lambda: future.exception()
+
+
+def replay(calls: list[dict], speed: float) -> float:
+    """Submit `calls` at their arrivals divided by `speed` (0: all at once) and wait for
+    every one. Returns the wall time it took."""
+    import llm.llm_request_queue as q
+
+    llm_queue = q.get_llm_queue()
+    waits = []
+    start = time.monotonic()
+    for entry in calls:
+        if speed > 0:
+            delay = start + entry["arrival"] / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        waits.append(_submit(llm_queue, entry))
+    for wait in waits:
+        wait()
+    return time.monotonic() - start
+
+
+def report(summary: dict, wall_s: float, call_count: int) -> str:
+    """The per-category table: calls and expiries, then p50/p95/p99 of each figure."""
+    header = f"{'category':<26}{'calls':>6}{'expired':>8}"
+    for _, label in FIGURES:
+        header += f"  {label + ' p50/p95/p99':>24}"
+    lines = [header]
+    for category in sorted(summary):
+        entry = summary[category]
+        counts = entry["counts"]
+        row = f"{category:<26}{counts['calls']:>6}{counts['expired']:>8}"
+        for name, _ in FIGURES:
+            figure = entry.get(name)
+            cell = f"{figure['p50']:.2f}/{figure['p95']:.2f}/{figure['p99']:.2f}" if figure else "-"
+            row += f"  {cell:>24}"
+        lines.append(row)
+    lines.append(f"{call_count} calls in {wall_s:.1f}s")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("log", help="a call log to replay, e.g. logs/llm_calls.jsonl")
+    parser.add_argument("--category", action="append", help="only calls of this category (repeatable)")
+    parser.add_argument("--limit", type=int, help="only the first N calls")
+    parser.add_argument("--speed", type=float, default=1.0, help="arrival compression: 1 as recorded, 0 all at once")
+    parser.add_argument("--log-to", default="./logs/replay_calls.jsonl", help="where the replayed calls are logged")
+    parser.add_argument("--json", help="also write the per-category summary here")
+    parser.add_argument(
+        "--scripted",
+        type=float,
+        metavar="TOKEN_LATENCY",
+        help="no model: replay the recorded replies at this many seconds a token (a dry run of the harness)",
+    )
+    parser.add_argument(
+        "--draft-acceptance",
+        type=float,
+        help="with --scripted: stream dialogue as if a draft model guessed each token right this often",
+    )
+    args = parser.parse_args(argv)
+
+    import llm.llm_request_queue as q
+
+    calls = load_calls(args.log, args.category, args.limit)
+    if not calls:
+        print("No calls to replay")
+        return
+    llm_log.LOG_PATH = args.log_to
+    # Every call in the window, not the last few hundred the game keeps.
+    q.telemetry = LLMTelemetry(len(calls))
+    # In this process whatever `LLM_PROCESS` says: the telemetry and the log are read here.
+    if args.scripted is not None:
+        q.use_backend(
+            ScriptedBackend.from_log(
+                args.log, q._format_prompt, token_latency=args.scripted, draft_acceptance=args.draft_acceptance
+            )
+        )
+    else:
+        q.use_backend(LlamaCppBackend())
+
+    wall_s = replay(calls, args.speed)
+    summary = q.telemetry.summary()
+    print(report(summary, wall_s, len(calls)))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"wall_seconds": round(wall_s, 3), "calls": len(calls), "categories": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
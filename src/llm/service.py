@@ -0,0 +1,203 @@
+"""One model for every game and tool on the machine: the LLM service.
+
+Playtest bots, soak tests and the log analysis scripts each used to load their own copy of
+the model through `get_llm_queue()`. Started once (`python -m llm.service [address]`), the
+service loads it a single time, along with one `LLMRequestQueue` and its state cache, and
+serves any process that connects. A game or tool uses it by setting
+`Hyperparameters.LLM_SERVICE` to its address; when nothing answers there, `get_llm_queue()`
+loads the model in-process as it always did.
+
+It speaks the inference process's protocol (`llm.inference_process`), over a Unix socket or
+a localhost TCP port instead of a pipe, and a client is an `InferenceClient` that connects
+rather than spawns. Each connection gets a lane of its own in the queue: dialogue still
+goes ahead of background work whoever asked for it, and within a priority the lanes take
+turns, so one bot queuing a hundred names delays a game's shop stock by one call, not a
+hundred. A client that disconnects has whatever it left in flight cancelled.
+
+Connections carry pickles, and unpickling what a stranger sends runs their code, so only
+the user running the game may reach the service. A TCP address is loopback only
+(`parse_address` refuses any other host). The default socket is in a private directory,
+`$XDG_RUNTIME_DIR` or else `~/.local-ai-rpg`, made 0700 (`private_dir`), and the socket
+is made 0600 wherever it is. The key both ends authenticate with is random, made once per
+install into a 0600 file in `~/.local-ai-rpg` (`authkey`), so another user on the machine
+cannot read it either.
+"""
+
+from __future__ import annotations
+
+import itertools
+import os
+import secrets
+import stat
+import sys
+import threading
+import time
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+import core.constants as c
+from llm.backends import LlamaCppBackend
+from llm.inference_process import InferenceClient, QueueServer
+
+# Where the key is kept, and the socket too when there is no `$XDG_RUNTIME_DIR`.
+STATE_DIR = os.path.join(os.path.expanduser("~"), ".local-ai-rpg")
+KEY_FILE = "service.key"
+KEY_BYTES = 32
+SOCKET_NAME = "llm.sock"
+# The only hosts a "host:port" address may name.
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost")
+# The service's own call log: not logs/llm_calls.jsonl, which a game started in the same
+# directory writes and rotates, and two processes must never rotate one file.
+LOG_PATH = "./logs/llm_service_calls.jsonl"
+# Between attempts to reach a service that went away, see `ServiceClient._relaunch`.
+RECONNECT_S = 2.0
+
+
+def private_dir(path: str) -> str:
+    """`path`, made if need be, as a directory only this user can enter. Raises
+    RuntimeError when it is someone else's, or not a directory at all."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise RuntimeError(f"{path} is not a directory of this user's")
+    if stat.S_IMODE(info.st_mode) != 0o700:
+        os.chmod(path, 0o700)
+    return path
+
+
+def default_address() -> str:
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    directory = os.path.join(runtime, "local-ai-rpg") if runtime else STATE_DIR
+    return os.path.join(private_dir(directory), SOCKET_NAME)
+
+
+def authkey() -> bytes:
+    """This install's key, made on first use. Raises RuntimeError if the file holding it
+    could be read or changed by another user."""
+    path = os.path.join(private_dir(STATE_DIR), KEY_FILE)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(fd, "wb") as f:
+            f.write(secrets.token_bytes(KEY_BYTES))
+    # Read back even when just written: the game and a service starting together make it
+    # once between them, and the one that lost the race may find it half written.
+    for _ in range(50):
+        info = os.lstat(path)
+        if not stat.S_ISREG(info.st_mode) or info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o077:
+            raise RuntimeError(f"{path} must be a file only this user can read (0600)")
+        with open(path, "rb") as f:
+            key = f.read()
+        if len(key) >= KEY_BYTES:
+            return key
+        time.sleep(0.01)
+    raise RuntimeError(f"{path} holds no key")
+
+
+def parse_address(address: str):
+    """A socket path as given, "host:port" as the (host, port) `Listener` wants. Raises
+    ValueError for a host that isn't this machine's loopback."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        host = host or "127.0.0.1"
+        if host not in LOOPBACK_HOSTS:
+            raise ValueError(f"LLM service address {address}: only {' or '.join(LOOPBACK_HOSTS)} may be used")
+        return host, int(port)
+    return address
+
+
+class ServiceClient(InferenceClient):
+    """An `InferenceClient` on a running service's connection instead of a process of its own."""
+
+    RECOVERY = "reconnecting"
+
+    def __init__(self, address: str):
+        super().__init__(backend_factory=None)
+        self.address = address
+
+    def _launch(self):
+        """Connect and wait for the service's hello. Raises if nothing answers."""
+        try:
+            conn = Client(parse_address(self.address), authkey=authkey())
+            message = conn.recv()
+        except (OSError, EOFError, ValueError, RuntimeError, AuthenticationError) as e:
+            raise RuntimeError(f"LLM service unreachable at {self.address}: {e}") from e
+        if message[0] == "failed":
+            raise RuntimeError(f"LLM service failed: {message[1]}")
+        self._conn = conn
+        threading.Thread(target=self._read, args=(conn,), daemon=True).start()
+        self._ready.set()
+
+    def _exit_reason(self) -> str:
+        return f"service at {self.address} closed the connection"
+
+    def _relaunch(self):
+        # A service being restarted is the usual reason; requests made meanwhile wait for it.
+        while True:
+            time.sleep(RECONNECT_S)
+            try:
+                self._launch()
+                return
+            except RuntimeError:
+                continue
+
+
+def _claim_socket_path(address, key: bytes):
+    """A socket file left by a service that was killed blocks the bind, and is removed. One
+    that a live service is listening on must not be taken over, and anything else at the
+    path, or a socket of another user's, is left where it is."""
+    if not isinstance(address, str) or not os.path.lexists(address):
+        return
+    info = os.lstat(address)
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise RuntimeError(f"{address} exists and is not a socket of this user's; not replacing it")
+    try:
+        Client(address, authkey=key).close()
+    except AuthenticationError as e:
+        raise RuntimeError(f"Something else is listening on {address}") from e
+    except (OSError, EOFError):
+        os.unlink(address)
+        return
+    raise RuntimeError(f"An LLM service is already listening on {address}")
+
+
+def serve(address: str | None = None, backend_factory=LlamaCppBackend):
+    """Load the model and serve connections at `address` (`default_address()` if None)
+    until interrupted."""
+    import llm.llm_request_queue as q
+    from core import llm_log
+
+    llm_log.LOG_PATH = LOG_PATH
+    address = address or default_address()
+    listen_address = parse_address(address)
+    key = authkey()
+    _claim_socket_path(listen_address, key)
+
+    q.use_backend(backend_factory())
+    server = QueueServer(q.get_llm_queue())
+
+    # The socket is created 0600, not chmodded after: nobody else gets a window to connect.
+    umask = os.umask(0o177)
+    try:
+        listener = Listener(listen_address, authkey=key)
+    finally:
+        os.umask(umask)
+    with listener:
+        print(f"LLM service ({c.Hyperparameters.MODEL_PATH}) listening on {address}")
+        for lane in itertools.count():
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                print(f"LLM service refused a connection: {type(e).__name__}: {e}")
+                continue
+            conn.send(("ready",))
+            threading.Thread(target=server.serve_connection, args=(conn, lane), daemon=True).start()
+
+
+def main():
+    serve(sys.argv[1] if len(sys.argv) > 1 else c.Hyperparameters.LLM_SERVICE)
+
+
+if __name__ == "__main__":
+    main()
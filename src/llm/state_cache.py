@@ -0,0 +1,114 @@
+"""Saved model states for the conversations the player keeps coming back to.
+
+llama_cpp only reuses the KV cache for the prefix the *previous* call shared with this one.
+One model serves the whole game, so any background call between two lines of dialogue
+(a name, a shop's stock, a quest analysis) evicts the conversation, and the next turn pays
+prompt evaluation for the whole system prompt and transcript again. This keeps a copy of the
+model state after each dialogue call, to be put back before the next one.
+
+A snapshot is filed under a hash of every line-boundary prefix of the prompt it was made
+from, starting after the system block (the system prompt is per-NPC, the lines after it are
+the transcript). A new prompt is looked up longest prefix first, so the snapshot found is
+the one that has the most of it already evaluated. llama_cpp still checks the restored
+tokens against the new prompt itself, so a near miss costs a few tokens of re-evaluation,
+never a wrong reply.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Where the system prompt ends in a formatted prompt (see `llm_request_queue._format_prompt`).
+# Every prefix shorter than this is shared by calls of every kind and says nothing about
+# which conversation a state belongs to.
+SYSTEM_BLOCK_END = "<|im_start|>user\n"
+
+
+def _key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _prefix_keys(formatted: str) -> list[str]:
+    """Hashes of every line-boundary prefix past the system block, longest first."""
+    start = formatted.find(SYSTEM_BLOCK_END)
+    if start < 0:
+        return []
+    start += len(SYSTEM_BLOCK_END)
+    ends = [start] + [i + 1 for i in range(start, len(formatted)) if formatted[i] == "\n"]
+    return [_key(formatted[:end]) for end in reversed(ends)]
+
+
+class _Snapshot:
+    __slots__ = ("keys", "size", "state")
+
+    def __init__(self, state, size: int, keys: set[str]):
+        self.state = state
+        self.size = size
+        self.keys = keys
+
+
+class PromptStateCache:
+    """LRU store of saved llama states, bounded by the RAM they take rather than a count."""
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.lock = threading.Lock()
+        self._by_key: dict[str, _Snapshot] = {}
+        # Least recently used first; the values are unused, it is an ordered set.
+        self._lru: OrderedDict[_Snapshot, None] = OrderedDict()
+        self._used_bytes = 0
+        # The snapshot whose tokens the model holds right now, so the turn right after it
+        # (nothing else ran in between) does not copy the same state back in.
+        self.resident: _Snapshot | None = None
+
+    @property
+    def used_bytes(self) -> int:
+        return self._used_bytes
+
+    def lookup(self, formatted: str) -> _Snapshot | None:
+        """The snapshot covering the longest line-boundary prefix of this prompt, or None."""
+        with self.lock:
+            for key in _prefix_keys(formatted):
+                snapshot = self._by_key.get(key)
+                if snapshot is not None:
+                    self._lru.move_to_end(snapshot)
+                    return snapshot
+        return None
+
+    def save(self, formatted: str, state, size: int) -> _Snapshot | None:
+        """File the model's state after evaluating `formatted` (and whatever it replied).
+
+        Any snapshot sharing a prefix key with this one is the same NPC's earlier turn (the
+        system block is per-NPC), which this state supersedes, so it goes: one snapshot per
+        conversation, not per turn. A state larger than the whole budget is not kept at all."""
+        if size > self.budget_bytes:
+            self.resident = None
+            return None
+        keys = set(_prefix_keys(formatted))
+        if not keys:
+            self.resident = None
+            return None
+
+        snapshot = _Snapshot(state, size, keys)
+        with self.lock:
+            for key in keys:
+                previous = self._by_key.get(key)
+                if previous is not None:
+                    self._drop(previous)
+                self._by_key[key] = snapshot
+            self._lru[snapshot] = None
+            self._used_bytes += size
+            while self._used_bytes > self.budget_bytes and self._lru:
+                self._drop(next(iter(self._lru)))
+            self.resident = snapshot if snapshot in self._lru else None
+        return self.resident
+
+    def _drop(self, snapshot: _Snapshot):
+        self._lru.pop(snapshot, None)
+        self._used_bytes -= snapshot.size
+        for key in snapshot.keys:
+            if self._by_key.get(key) is snapshot:
+                del self._by_key[key]
+        snapshot.keys = set()
+        if self.resident is snapshot:
+            self.resident = None
@@ -0,0 +1,120 @@
+"""Live latency and throughput figures for the LLM queue, per category of call.
+
+`llm_log.log_call` writes one line per finished call, which is what a post-mortem wants and
+useless while the game runs: a slow greeting has to be explained now, and the line does not
+say where the time went. The queue records each call's phases here as it goes:
+
+- `queue_wait_s`: submitted to first started, the scheduler's share;
+- `ttft_s`: started to first token, which is prompt evaluation plus one decode step;
+- `prompt_tps`: prompt tokens evaluated (the cached prefix excluded) per second of that;
+- `decode_tps`: tokens per second after the first;
+- `cached_prefix`: prompt tokens the model already held, see `LLMBackend.cached_prefix`;
+- `draft_acceptance`: of the tokens a draft model guessed for a streamed call, the share
+  the model kept (`LLMBackend.draft_counts`), only with a draft model;
+
+plus counts of calls, cancellations, preemptions and expiries. A batched call has no time to
+first token of its own and shares its decode with the batch: only its wait is kept.
+
+Each figure is a rolling window of the last `TELEMETRY_WINDOW` samples, so the numbers follow
+the session as it changes instead of averaging over all of it. `summary()` reads them as
+percentiles, for the task panel and for the summary record the worker writes to the call log
+every `TELEMETRY_SUMMARY_S`.
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+
+import core.constants as c
+from core import llm_log
+
+METRICS = ("queue_wait_s", "ttft_s", "prompt_tps", "decode_tps", "cached_prefix", "draft_acceptance")
+COUNTS = ("calls", "cancelled", "preempted", "expired")
+
+
+class RollingHistogram:
+    """The last `size` samples of one figure, read as percentiles."""
+
+    def __init__(self, size: int):
+        self.samples = deque(maxlen=size)
+
+    def add(self, value: float):
+        self.samples.append(value)
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+        last = len(ordered) - 1
+        return {
+            "n": len(ordered),
+            "p50": round(ordered[last // 2], 3),
+            "p95": round(ordered[min(last, int(0.95 * len(ordered)))], 3),
+            "p99": round(ordered[min(last, int(0.99 * len(ordered)))], 3),
+            "mean": round(sum(ordered) / len(ordered), 3),
+        }
+
+
+class LLMTelemetry:
+    def __init__(self, window: int):
+        self.window = window
+        self.lock = threading.Lock()
+        # category -> metric -> RollingHistogram, and category -> count name -> int.
+        self._histograms = defaultdict(dict)
+        self._counts = defaultdict(lambda: dict.fromkeys(COUNTS, 0))
+        self._last_dump = time.monotonic()
+        self._dirty = False
+
+    def record(self, category: str, **metrics):
+        """One call's figures; a None figure (not measured for this call) is skipped."""
+        with self.lock:
+            histograms = self._histograms[category]
+            for name, value in metrics.items():
+                if value is None:
+                    continue
+                histogram = histograms.get(name)
+                if histogram is None:
+                    histogram = histograms[name] = RollingHistogram(self.window)
+                histogram.add(value)
+            self._dirty = True
+
+    def count(self, category: str, event: str):
+        with self.lock:
+            self._counts[category][event] += 1
+            self._dirty = True
+
+    def summary(self) -> dict:
+        """category -> {"counts": {...}, metric: {n, p50, p95, p99, mean}} for the metrics with
+        samples; a category is listed once anything was counted for it."""
+        with self.lock:
+            result = {}
+            for category, counts in self._counts.items():
+                entry = {"counts": dict(counts)}
+                for name, histogram in self._histograms.get(category, {}).items():
+                    if histogram.samples:
+                        entry[name] = histogram.summary()
+                result[category] = entry
+        return result
+
+    def maybe_dump(self):
+        """Write the summary to the call log if `TELEMETRY_SUMMARY_S` has gone by and there
+        is anything new in it. Called by the worker between requests."""
+        now = time.monotonic()
+        if not self._dirty or now - self._last_dump < c.Hyperparameters.TELEMETRY_SUMMARY_S:
+            return
+        self._last_dump = now
+        self._dirty = False
+        llm_log.log_metrics(self.summary())
+
+
+def call_metrics(prompt_tokens, completion_tokens, reused, started, first_token_at, finished) -> dict:
+    """The per-call figures of one finished (unbatched) call, from its timestamps."""
+    metrics = {"cached_prefix": reused}
+    if first_token_at is None:
+        return metrics
+    ttft = first_token_at - started
+    metrics["ttft_s"] = ttft
+    if prompt_tokens and ttft > 0:
+        metrics["prompt_tps"] = (prompt_tokens - (reused or 0)) / ttft
+    decode_time = finished - first_token_at
+    if completion_tokens and completion_tokens > 1 and decode_time > 0:
+        metrics["decode_tps"] = (completion_tokens - 1) / decode_time
+    return metrics
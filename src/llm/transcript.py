@@ -0,0 +1,101 @@
+"""Keeping a long conversation's transcript inside a token budget.
+
+Every "Continuing conversation" prompt carries the transcript so far, and so does the quest
+analysis when the conversation closes. Left alone, a player who talks for a while makes
+every turn slower than the last (prompt evaluation grows with the transcript) and in the
+end runs into `Hyperparameters.CONTEXT_SIZE`. Past `TRANSCRIPT_TOKEN_BUDGET`, everything but
+the last few messages is folded into a summary at the top of the transcript; the player
+still sees every message, only the model's copy is shortened.
+
+The fold happens at once, with an extractive summary (the first sentence of each folded
+message), because the turn being sent cannot wait for a model to write a better one. If the
+model has nothing else to do, it is then asked for a proper summary in the background,
+which replaces the extractive one from the next turn on. Folding is done in one go down to
+the last `TRANSCRIPT_KEEP_MESSAGES`, not a message at a time: the summary is at the top of
+the prompt, and each change to it costs one re-evaluation of everything after it.
+
+It runs on the main thread as the turn is sent, so the budgets are measured by
+`estimate_tokens`, from the length of the text: the model's tokenizer is a round trip to the
+inference process, and one asked a few times per turn would stall the frame.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING
+
+import core.constants as c
+from llm.llm_request_queue import estimate_tokens, llm_idle, submit_queued
+
+if TYPE_CHECKING:
+    from core.utils import ConversationHistory
+
+# Between the lines of an extractive summary, so the oldest can be dropped whole.
+SUMMARY_SEPARATOR = " | "
+
+_FIRST_SENTENCE_RE = re.compile(r"^(.+?[.!?…])(?:\s|$)")
+
+
+def _first_sentence(text: str) -> str:
+    text = text.strip()
+    match = _FIRST_SENTENCE_RE.match(text)
+    return match.group(1) if match else text
+
+
+def _extractive_summary(previous: str, messages: list[dict]) -> str:
+    """The summary so far, then a line per folded message, oldest lines dropped to fit."""
+    lines = previous.split(SUMMARY_SEPARATOR) if previous else []
+    for msg in messages:
+        speaker = "Player" if msg["role"] == "user" else "NPC"
+        lines.append(f"{speaker}: {_first_sentence(msg['content'])}")
+    limit = c.Hyperparameters.TRANSCRIPT_SUMMARY_TOKENS
+    while len(lines) > 1 and estimate_tokens(SUMMARY_SEPARATOR.join(lines)) > limit:
+        lines.pop(0)
+    return SUMMARY_SEPARATOR.join(lines)
+
+
+def compact(history: ConversationHistory):
+    """Fold the oldest messages of `history` into its summary if its prompt transcript has
+    outgrown the budget. Called before each turn is sent."""
+    if estimate_tokens(history.format_for_prompt()) <= c.Hyperparameters.TRANSCRIPT_TOKEN_BUDGET:
+        return
+    upto = len(history.messages) - c.Hyperparameters.TRANSCRIPT_KEEP_MESSAGES
+    if upto <= history.folded:
+        return
+
+    previous = history.summary
+    folded = history.messages[history.folded : upto]
+    history.fold(upto, _extractive_summary(previous, folded))
+    if llm_idle():
+        _request_summary(history, previous, folded, upto)
+
+
+def _request_summary(history: ConversationHistory, previous: str, folded: list[dict], upto: int):
+    """Ask the model for a rolling summary to replace the extractive one. Background work:
+    the player's next line goes ahead of it."""
+    earlier = f"Summary of what came before: {previous}\n" if previous else ""
+    lines = "\n".join(f"{'Player' if m['role'] == 'user' else 'NPC'}: {m['content']}" for m in folded)
+    system_prompt = (
+        "You summarize conversations between a player and an NPC in an RPG. Reply with at most three "
+        "sentences on a single line. Keep every request, offer, promise, price or reward, and whether the "
+        "player agreed to it."
+    )
+    prompt = f"{earlier}Conversation:\n{lines}\n\nSummarize the conversation so far."
+    generation = history.generation
+
+    def summarized(future):
+        # Only for the conversation, and the fold, it was written for.
+        if future.exception() is not None or history.generation != generation or history.folded != upto:
+            return
+        summary = future.result().strip()
+        if summary:
+            history.fold(upto, summary)
+
+    submit_queued(
+        prompt,
+        system_prompt,
+        "Conversation summary",
+        max_tokens=c.Hyperparameters.TRANSCRIPT_SUMMARY_TOKENS,
+        callback=summarized,
+        on_main=True,
+    )
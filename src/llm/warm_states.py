@@ -0,0 +1,101 @@
+"""Evaluated openings of system prompts, on disk next to the model.
+
+Every call's system prompt opens with `ENGLISH_ONLY_REMINDER`, every conversation's with the
+same dialogue preamble, every name list's with the same instructions. llama_cpp reuses only
+what the previous call shared with this one, so the first call of each kind in a session
+(and the first after other work has run) pays to evaluate them again. `llm.warmup` has them
+evaluated while the game loads, and this keeps the result: one state file per opening,
+holding the model's KV cache for those tokens and nothing else, under
+`<model dir>/warm_states/`.
+
+A file is named by a hash of the model and one of the text, so a later launch finds it and
+loads it instead of evaluating again, and a different model or llama_cpp never loads a state
+made by another. Before a call that opens with a warmed text, the queue loads the file if
+the model holds less of the prompt than the file has (`llm_request_queue._restore_state`);
+llama_cpp checks the tokens as it would after any call, so a text that tokenizes a little
+differently inside the full prompt costs a few tokens, never a wrong reply.
+"""
+
+import glob
+import hashlib
+import os
+
+import core.constants as c
+
+SUFFIX = ".state"
+# How much of the model file the fingerprint reads from each end: the GGUF header and its
+# metadata are at the start, and a re-quantized or truncated file differs at the end.
+FINGERPRINT_BYTES = 1024 * 1024
+
+
+def model_key(model_path: str, state_format: str) -> str:
+    """A hash of the model file (its size and both ends, not all 3 GB of it) and of what the
+    state files depend on besides (`LLMBackend.state_format`)."""
+    digest = hashlib.sha1(state_format.encode("utf-8"))
+    if os.path.isfile(model_path):
+        size = os.path.getsize(model_path)
+        digest.update(str(size).encode("ascii"))
+        with open(model_path, "rb") as f:
+            digest.update(f.read(FINGERPRINT_BYTES))
+            f.seek(max(0, size - FINGERPRINT_BYTES))
+            digest.update(f.read(FINGERPRINT_BYTES))
+    else:
+        digest.update(model_path.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class WarmStates:
+    """The warmed texts the model can be put back to, and the files that hold them."""
+
+    def __init__(self, directory: str, key: str):
+        self.directory = directory
+        self.key = key
+        # Warmed text -> (its state file, tokens in it). Only texts evaluated or loaded in
+        # this session: a file is trusted once the backend has loaded it.
+        self._known: dict[str, tuple[str, int]] = {}
+
+    @classmethod
+    def for_backend(cls, backend) -> "WarmStates":
+        directory = os.path.join(os.path.dirname(os.path.abspath(backend.model_path)), "warm_states")
+        return cls(directory, model_key(backend.model_path, backend.state_format))
+
+    def path_for(self, text: str) -> str:
+        return os.path.join(self.directory, f"{self.key}_{_text_key(text)}{SUFFIX}")
+
+    def knows(self, text: str) -> bool:
+        return text in self._known
+
+    def add(self, text: str, path: str, tokens: int):
+        self._known[text] = (path, tokens)
+        # Used now: the pruning below keeps the most recently used.
+        os.utime(path)
+
+    def forget(self, text: str):
+        path, _ = self._known.pop(text)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def longest(self, formatted: str) -> tuple[str, str, int] | None:
+        """(text, path, tokens) of the longest warmed text this prompt opens with, or None."""
+        best = None
+        for text, (path, tokens) in self._known.items():
+            if formatted.startswith(text) and (best is None or len(text) > len(best[0])):
+                best = (text, path, tokens)
+        return best
+
+    def prune(self):
+        """Delete the files of other models, and all but the newest `WARM_STATES_KEPT`."""
+        paths = glob.glob(os.path.join(glob.escape(self.directory), f"*{SUFFIX}"))
+        mine = []
+        for path in paths:
+            if os.path.basename(path).startswith(f"{self.key}_"):
+                mine.append(path)
+            else:
+                os.remove(path)
+        mine.sort(key=os.path.getmtime, reverse=True)
+        for path in mine[c.Hyperparameters.WARM_STATES_KEPT :]:
+            os.remove(path)
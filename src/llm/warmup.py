@@ -0,0 +1,29 @@
+"""The openings of system prompts worth having the model evaluate before they are needed.
+
+A conversation's system prompt opens with the dialogue preamble, a name list's with its
+instructions, both after `ENGLISH_ONLY_REMINDER` and both with the world's context in them.
+The loading screen warms what comes before the context, which no launch can know yet, and a
+game warms the whole preambles once its world has a context (`SaveSystem.when_context`):
+then the first greeting only evaluates the NPC's own part of the prompt, as the tenth does.
+The states are kept on disk (`llm.warm_states`), so the next launch on the same world loads
+them rather than evaluating them again.
+"""
+
+from llm.dialogue_manager import _dialogue_preamble
+from llm.llm_request_queue import LLMFuture, warm_up_queued
+from llm.name_generator import _names_preamble
+
+PREAMBLES = (_dialogue_preamble, _names_preamble)
+# Where the context would go, to cut a preamble there.
+_CONTEXT_MARK = "\0"
+
+
+def preambles(context: str | None = None) -> list[str]:
+    """Each preamble with this world's context, or up to where the context goes."""
+    if context is None:
+        return [preamble(_CONTEXT_MARK).split(_CONTEXT_MARK)[0] for preamble in PREAMBLES]
+    return [preamble(context) for preamble in PREAMBLES]
+
+
+def warm_up(context: str | None = None) -> LLMFuture:
+    return warm_up_queued(preambles(context))
@@ -9,6 +9,8 @@ from core.music import get_music
 from core.save import SaveSystem
 from game.game import Game
 from llm.llm_request_queue import get_llm_queue
+from llm.pregen import start_harvester
+from llm.warmup import warm_up
 from ui.loading_indicator import LoadingIndicator
 from ui.menus.main_menu import run_main_menu
 
@@ -18,12 +20,20 @@ def run_loading_screen(screen, clock):
 
     Constructing the Llama object pulls the 7B model into VRAM and blocks for
     several seconds; doing it on a worker thread lets the main thread keep the
-    window responsive instead of showing a frozen void.
+    window responsive instead of showing a frozen void. The prompt openings every
+    call shares are then evaluated (or loaded from disk), see `llm.warmup`.
     """
+    loaded = threading.Event()
     ready = threading.Event()
 
     def load():
         get_llm_queue()
+        loaded.set()
+        try:
+            warm_up().result()
+        except Exception as e:
+            # Only a head start lost: the calls evaluate the same text themselves.
+            print(f"LLM warm-up failed: {type(e).__name__}: {e}")
         ready.set()
 
     threading.Thread(target=load, daemon=True).start()
@@ -43,7 +53,8 @@ def run_loading_screen(screen, clock):
         screen.fill(c.Colors.MENU_BACKGROUND)
         indicator.draw_spinner(18, c.Colors.ACCENT)
 
-        text = c.Fonts.title.render("Loading AI model...", True, c.Colors.WHITE)
+        label = "Preparing prompts..." if loaded.is_set() else "Loading AI model..."
+        text = c.Fonts.title.render(label, True, c.Colors.WHITE)
         screen.blit(text, (cx - text.get_width() // 2, cy + 30))
 
         pygame.display.flip()
@@ -65,6 +76,8 @@ def main():
     # the title screen is exactly the dead time that costs nothing.
     get_music()
     run_loading_screen(screen, clock)
+    # From the title screen on: the next new game's world can be written while it shows.
+    start_harvester()
 
     while True:
         choice = run_main_menu(screen, clock)
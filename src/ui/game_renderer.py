@@ -114,7 +114,7 @@ class GameRenderer:
 
         self.screen.fill(c.Colors.GREEN)
 
-        for x, y, kind in world.floor_details:
+        for x, y, kind in world.chunk_contents_in_range("details", camera.x, camera.y, c.Screen.ORIGIN_X + 5):
             if not self._on_screen(camera, x, y, margin=5):
                 continue
             color, radius = c.World.FLOOR_DETAILS[kind]
@@ -153,7 +153,7 @@ class GameRenderer:
 
         # Lying on the ground and under everything that walks over it: a trap is meant to be
         # caught sight of, not read off the top of whoever is about to step in it.
-        for trap in world.traps:
+        for trap in world.chunk_contents_in_range("traps", camera.x, camera.y, c.Screen.ORIGIN_X + 100):
             if self._on_screen(camera, trap.x, trap.y):
                 trap.draw(self.screen, camera)
 
@@ -172,7 +172,7 @@ class GameRenderer:
             else:
                 item.draw(self.screen, camera)
 
-        for poi in world.pois:
+        for poi in world.chunk_contents_in_range("pois", camera.x, camera.y, c.Screen.ORIGIN_X + 100):
             if self._on_screen(camera, poi.x, poi.y):
                 poi.draw(self.screen, camera)
 
@@ -475,6 +475,7 @@ class GameRenderer:
         world: World,
         saved_ms: int = 0,
         gate_lift: float = 0.0,
+        llm_metrics: dict | None = None,
     ):
         active_task_count = len(llm_tasks)
         mouse_pos = pygame.mouse.get_pos()
@@ -514,7 +515,7 @@ class GameRenderer:
             self.show_llm_tasks = False
 
         if self.show_llm_tasks:
-            self._draw_llm_task_panel(llm_tasks)
+            self._draw_llm_task_panel(llm_tasks, llm_metrics or {})
 
     def _quick_slot_rects(self) -> list[pygame.Rect]:
         step = self.QUICK_SLOT_SIZE + self.QUICK_SLOT_GAP
@@ -711,10 +712,13 @@ class GameRenderer:
             key = c.Fonts.small.render(str(i + 1), True, c.Colors.ACCENT if active else c.Colors.MUTED)
             self.screen.blit(key, (rect.x + 4, rect.y + 2))
 
-    def _draw_llm_task_panel(self, llm_tasks):
-        width = 240
+    def _draw_llm_task_panel(self, llm_tasks, llm_metrics: dict):
+        """Each task: category, state, and below it the median figures of its category
+        (`llm.telemetry`), which tell whether a slow reply is the queue, the prompt or the
+        decode."""
+        width = 260
         pad = 10
-        row_h = 34
+        row_h = 50 if llm_metrics else 34
         header_h = 26
         height = header_h + pad + max(len(llm_tasks), 1) * row_h + pad
         right = c.Screen.WIDTH - 10
@@ -733,9 +737,17 @@ class GameRenderer:
             label = c.Fonts.small.render(f"{bullet} {task['category']}", True, color)
             self.screen.blit(label, (panel.x + pad, y))
 
-            status = f"running  {task['elapsed']:.1f}s" if running else "queued"
+            status = f"running  {task['elapsed']:.1f}s" if running else f"queued  {task['wait']:.1f}s"
+            if task["decision"]:
+                # Why it is late, or shorter than asked: see `llm_request_queue.Deadline`.
+                status += f"  {task['decision']}"
             status_surface = c.Fonts.small.render(status, True, c.Colors.BORDER)
             self.screen.blit(status_surface, (panel.x + pad + 16, y + 15))
+
+            typical = _typical_llm_figures(llm_metrics.get(task["category"]))
+            if typical:
+                typical_surface = c.Fonts.small.render(typical, True, c.Colors.MUTED)
+                self.screen.blit(typical_surface, (panel.x + pad + 16, y + 30))
             y += row_h
 
     def draw_boss_bar(self, world: World, player: Player):
@@ -817,3 +829,26 @@ class GameRenderer:
     def draw_fps(self, fps):
         fps_text = c.Fonts.small.render(f"FPS: {int(fps)}", True, c.Colors.MENU_BACKGROUND)
         self.screen.blit(fps_text, (self.screen.get_width() - 60, self.screen.get_height() - 20))
+
+
+def _typical_llm_figures(metrics: dict | None) -> str | None:
+    """ "p50 wait 0.2s  ttft 0.8s  14 t/s" for one category's telemetry, or None before any."""
+    if not metrics:
+        return None
+
+    def median(name):
+        figure = metrics.get(name)
+        return figure["p50"] if figure else None
+
+    parts = []
+    wait, ttft, decode = median("queue_wait_s"), median("ttft_s"), median("decode_tps")
+    if wait is not None:
+        parts.append(f"wait {wait:.1f}s")
+    if ttft is not None:
+        parts.append(f"ttft {ttft:.1f}s")
+    if decode is not None:
+        parts.append(f"{decode:.0f} t/s")
+    drafted = median("draft_acceptance")
+    if drafted is not None:
+        parts.append(f"draft {drafted:.0%}")
+    return "p50 " + "  ".join(parts) if parts else None